@@ -0,0 +1,231 @@
+"""
+请求准入控制 - 突发流量时限制同时处理的上传，提前拒绝超出的请求
+
+每个上传请求在读取请求体之前申请准入，占用一个并发名额和一份字节预算
+（按 Content-Length 估算，不超过该端点处理时最多缓存的字节数；没有 Content-Length 时按上限计。
+只读取文件头部的端点按 HEADER_UPLOAD_MAX_BYTES 计，而不是请求体上限，见 buffer_limit）：
+
+- 并发数和字节数都在预算内、且没有请求在排队时立即放行；
+- 否则进入有界的先进先出队列，最多等待 timeout 秒；
+- 队列已满或等待超时时抛出 Overloaded，服务返回 503 和 Retry-After，不再读取请求体。
+
+没有请求在处理时总是放行，单个超过字节预算的请求（如大批量上传）不会一直等待。
+Flask 应用（线程）使用 AdmissionGate，asgi_app（事件循环）使用 AsyncAdmissionGate。
+"""
+
+import asyncio
+import threading
+from collections import deque
+from metrics import ADMISSION_RESERVED_BYTES, ADMISSION_SHED, ADMISSION_WAITING
+
+
+class Overloaded(Exception):
+    """超出准入预算，请求被拒绝"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__('服务繁忙，请稍后重试')
+        self.reason = reason            # 'queue_full' 或 'timeout'
+        self.retry_after = retry_after  # 建议客户端等待的秒数
+
+
+class Admission:
+    """一个已放行的请求占用的预算，请求结束时调用 release()（可以重复调用）"""
+
+    __slots__ = ('_gate', 'cost', '_released')
+
+    def __init__(self, gate, cost):
+        self._gate = gate
+        self.cost = cost
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._gate._release(self.cost)
+
+
+class _Waiter:
+    """队列中等待放行的请求"""
+
+    __slots__ = ('cost', 'admitted', 'wake')
+
+    def __init__(self, cost, wake):
+        self.cost = cost
+        self.admitted = False
+        self.wake = wake
+
+
+def request_cost(content_length, limit):
+    """请求在处理期间最多缓存的字节数"""
+    if content_length is None:
+        return limit
+    return min(content_length, limit)
+
+
+def _config_getter(config):
+    """config 可以是类或字典"""
+    return config.get if isinstance(config, dict) else lambda key: getattr(config, key)
+
+
+def buffer_limit(config, endpoint, header_only=True):
+    """
+    端点处理一个请求时最多缓存的字节数（准入按此上限计算字节预算）
+
+    只读取文件头部时（header_only 的 /upload、批量分析），剩余的请求体边读边丢弃，
+    按文件头部的上限 HEADER_UPLOAD_MAX_BYTES 计，而不是整个请求体的上限。
+
+    Args:
+        config: 配置（类或字典）
+        endpoint: 'upload'、'header' 或 'batch'
+        header_only: /upload 是否只读取文件头部（Flask 应用取 HEADER_ONLY_INGEST，ASGI 应用总是只读取头部）
+    """
+    get = _config_getter(config)
+    header_limit = get('HEADER_UPLOAD_MAX_BYTES')
+    if endpoint == 'header':
+        return header_limit
+    if endpoint == 'batch':
+        return min(header_limit, get('BATCH_MAX_TOTAL_BYTES'))
+    if header_only:
+        return min(header_limit, get('MAX_CONTENT_LENGTH'))
+    return get('MAX_CONTENT_LENGTH')
+
+
+class _AdmissionQueue:
+    """并发名额和字节预算的记账，以及先进先出的等待队列（线程和事件循环共用）"""
+
+    def __init__(self, max_in_flight=None, max_bytes=None, queue_size=0, timeout=1.0,
+                 retry_after=1, name='upload'):
+        self.max_in_flight = max_in_flight
+        self.max_bytes = max_bytes
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.name = name
+        self.in_flight = 0
+        self.reserved = 0
+        self._queue = deque()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, name='upload'):
+        """按 Config 中的 ADMISSION_* 配置创建（config 可以是类或字典）"""
+        get = _config_getter(config)
+        return cls(max_in_flight=get('ADMISSION_MAX_IN_FLIGHT'),
+                   max_bytes=get('ADMISSION_MAX_BUFFERED_BYTES'),
+                   queue_size=get('ADMISSION_QUEUE_SIZE'),
+                   timeout=get('ADMISSION_QUEUE_TIMEOUT'),
+                   retry_after=get('ADMISSION_RETRY_AFTER'),
+                   name=name)
+
+    @property
+    def waiting(self):
+        return len(self._queue)
+
+    def _fits(self, cost):
+        if self.in_flight == 0:
+            return True
+        if self.max_in_flight is not None and self.in_flight >= self.max_in_flight:
+            return False
+        return self.max_bytes is None or self.reserved + cost <= self.max_bytes
+
+    def _take(self, cost):
+        self.in_flight += 1
+        self.reserved += cost
+        ADMISSION_RESERVED_BYTES.set(self.reserved, self.name)
+
+    def _try_admit(self, cost, wake):
+        """
+        立即放行，或者加入等待队列
+
+        Returns:
+            _Waiter: 需要等待时为队列中的条目，已放行时为None
+        """
+        with self._lock:
+            if not self._queue and self._fits(cost):
+                self._take(cost)
+                return None
+            if len(self._queue) >= self.queue_size:
+                raise self._shed('queue_full')
+            waiter = _Waiter(cost, wake)
+            self._queue.append(waiter)
+            ADMISSION_WAITING.set(len(self._queue), self.name)
+            return waiter
+
+    def _abandon(self, waiter, reason):
+        """
+        等待结束但没有收到放行通知：离开队列
+
+        Returns:
+            bool: 在此期间是否已被放行（此时调用方持有预算）
+        """
+        with self._lock:
+            if waiter.admitted:
+                return True
+            self._queue.remove(waiter)
+            ADMISSION_WAITING.set(len(self._queue), self.name)
+            # 队首离开后，后面的请求可能已经符合预算
+            self._wake_waiters()
+        if reason is not None:
+            raise self._shed(reason)
+        return False
+
+    def _release(self, cost):
+        with self._lock:
+            self.in_flight -= 1
+            self.reserved -= cost
+            ADMISSION_RESERVED_BYTES.set(self.reserved, self.name)
+            self._wake_waiters()
+
+    def _wake_waiters(self):
+        """按队列顺序放行符合预算的请求（调用方持有锁）"""
+        while self._queue and self._fits(self._queue[0].cost):
+            waiter = self._queue.popleft()
+            self._take(waiter.cost)
+            waiter.admitted = True
+            waiter.wake()
+        ADMISSION_WAITING.set(len(self._queue), self.name)
+
+    def _shed(self, reason):
+        ADMISSION_SHED.inc(self.name, reason)
+        return Overloaded(reason, self.retry_after)
+
+
+class AdmissionGate(_AdmissionQueue):
+    """线程中使用的准入控制（Flask 应用）"""
+
+    def acquire(self, cost):
+        """
+        申请准入，必要时阻塞等待
+
+        Returns:
+            Admission: 请求结束时释放
+
+        Raises:
+            Overloaded: 队列已满或等待超时
+        """
+        event = threading.Event()
+        waiter = self._try_admit(cost, event.set)
+        if waiter is not None and not event.wait(self.timeout):
+            self._abandon(waiter, 'timeout')
+        return Admission(self, cost)
+
+
+class AsyncAdmissionGate(_AdmissionQueue):
+    """事件循环中使用的准入控制（asgi_app），等待时不占用线程"""
+
+    async def acquire(self, cost):
+        """申请准入，必要时等待（协程，同 AdmissionGate.acquire）"""
+        future = asyncio.get_running_loop().create_future()
+        waiter = self._try_admit(cost, lambda: future.set_result(None))
+        if waiter is None:
+            return Admission(self, cost)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            self._abandon(waiter, 'timeout')
+        except asyncio.CancelledError:
+            # 客户端在排队时断开：已经放行的话归还预算
+            if self._abandon(waiter, None):
+                self._release(cost)
+            raise
+        return Admission(self, cost)
@@ -1,6 +1,18 @@
-from flask import Flask, request, render_template, jsonify, flash, redirect, url_for
+from flask import Flask, Response, request, render_template, jsonify, make_response, flash, redirect, url_for
 import os
-from photo_analyzer import analyze_photo_from_stream
+import time
+from functools import wraps
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
+from werkzeug.wsgi import get_input_stream
+from photo_analyzer import analyze_photo_from_stream, analyze_photo_data, compact_schema
+from stream_ingest import read_upload_header, read_upload_headers, trim_header
+from batch_analyzer import CONTENT_MISMATCH_ERROR, analyze_batch, batch_items, iter_batch_items, upload_error
+from image_probe import SNIFF_LENGTH, extension_matches, sniff_format
+from stage_timing import collect_timings, current_timings, stage
+from admission import AdmissionGate, Overloaded, buffer_limit, request_cost
+from metrics import (
+    REQUESTS_IN_PROGRESS, observe_request, observe_result, observe_stages, render_metrics, start_exporter
+)
 from config import config
 
 app = Flask(__name__)
@@ -12,44 +24,314 @@ app.config.from_object(config[config_name])
 # 确保上传文件夹存在
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# 上传请求的准入控制（所有分析端点共用同一份预算）
+admission = AdmissionGate.from_config(app.config)
+
+# 多个服务进程时定期导出本进程的指标快照
+if app.config['METRICS_ENABLED']:
+    start_exporter(app.config['METRICS_DIR'], app.config['METRICS_EXPORT_INTERVAL'])
+
 
 def allowed_file(filename):
     """检查文件扩展名是否允许"""
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
+def allowed_content(filename, head):
+    """按文件开头的字节识别格式，检查是否与扩展名一致"""
+    return extension_matches(filename, sniff_format(head))
+
+def content_check():
+    """上传解析使用的内容检查函数，未启用 SNIFF_CONTENT 时为None"""
+    return allowed_content if app.config['SNIFF_CONTENT'] else None
+
+def compact_requested():
+    """请求是否要求紧凑结果（?compact=1）"""
+    return request.args.get('compact', '').lower() in ('1', 'true', 'yes')
+
+def stream_requested():
+    """请求是否要求流式结果（?stream=1 或 Accept: application/x-ndjson）"""
+    return request.args.get('stream', '').lower() in ('1', 'true', 'yes') or \
+           'application/x-ndjson' in request.headers.get('Accept', '')
+
+def timing_requested():
+    """请求是否要求在结果中返回阶段耗时（?timing=1）"""
+    return request.args.get('timing', '').lower() in ('1', 'true', 'yes')
+
+def instrumented(view):
+    """
+    为分析视图计时并记录指标
+
+    启用指标（METRICS_ENABLED）时记录请求数、耗时、接收字节数和各阶段耗时；
+    流式响应在响应关闭（响应体发送完毕）时才记录，与 asgi_app 一致。
+    启用阶段计时（SERVER_TIMING 或 ?timing=1）时添加 Server-Timing 响应头。
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        metrics_enabled = app.config['METRICS_ENABLED']
+        server_timing = app.config['SERVER_TIMING'] or timing_requested()
+        if not (metrics_enabled or server_timing):
+            return view(*args, **kwargs)
+
+        endpoint = request.path
+        content_length = request.content_length
+        timings = None
+        if metrics_enabled:
+            REQUESTS_IN_PROGRESS.inc(endpoint)
+        start = time.perf_counter()
+
+        def finish(status):
+            elapsed = time.perf_counter() - start
+            if metrics_enabled:
+                REQUESTS_IN_PROGRESS.dec(endpoint)
+                observe_request(endpoint, status, elapsed, content_length)
+                if timings is not None:
+                    observe_stages(timings)
+            return elapsed
+
+        try:
+            with collect_timings() as timings:
+                response = make_response(view(*args, **kwargs))
+        except HTTPException as e:
+            finish(e.code)
+            raise
+        except BaseException:
+            finish(500)
+            raise
+
+        if response.is_streamed:
+            response.call_on_close(lambda: finish(response.status_code))
+            elapsed = time.perf_counter() - start
+        else:
+            elapsed = finish(response.status_code)
+
+        if server_timing:
+            timings.add('total', elapsed)
+            response.headers['Server-Timing'] = timings.header()
+        return response
+    return wrapper
+
+def admitted(endpoint):
+    """
+    读取请求体之前申请准入，占用的字节预算按 Content-Length 估算（不超过该端点最多缓存的字节数，
+    见 admission.buffer_limit）
+
+    超出并发或字节预算且排队失败时直接返回503和 Retry-After；
+    流式响应在响应关闭时才释放预算。
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            limit = buffer_limit(app.config, endpoint, app.config['HEADER_ONLY_INGEST'])
+            cost = request_cost(request.content_length, limit)
+            try:
+                ticket = admission.acquire(cost)
+            except Overloaded as e:
+                return jsonify({'error': str(e)}), 503, {'Retry-After': str(e.retry_after)}
+            try:
+                response = make_response(view(*args, **kwargs))
+            except BaseException:
+                ticket.release()
+                raise
+            if response.is_streamed:
+                response.call_on_close(ticket.release)
+            else:
+                ticket.release()
+            return response
+        return wrapper
+    return decorator
+
+def finish_result(result):
+    """
+    记录结果的完整性结论；?timing=1 时在结果中附带已记录的阶段耗时（毫秒），不修改缓存中的结果
+    """
+    if app.config['METRICS_ENABLED']:
+        observe_result(result)
+    timings = current_timings()
+    if timings is None or not timing_requested():
+        return result
+    return dict(result, timings=timings.as_milliseconds())
+
+def ndjson_lines(items):
+    """每个条目序列化为一行JSON（与 jsonify 相同的格式）"""
+    metrics_enabled = app.config['METRICS_ENABLED']
+    for item in items:
+        if metrics_enabled and 'result' in item:
+            observe_result(item['result'])
+        yield app.json.dumps(item, separators=(',', ':')) + '\n'
+
 @app.route('/')
 def index():
     """主页面"""
     return render_template('index.html')
 
 @app.route('/upload', methods=['POST'])
+@instrumented
+@admitted('upload')
 def upload_file():
     """处理文件上传"""
-    if 'file' not in request.files:
+    if app.config['HEADER_ONLY_INGEST']:
+        return upload_file_header_only()
+
+    with stage('receive'):
+        files = request.files
+    if 'file' not in files:
         return jsonify({'error': '没有选择文件'}), 400
     
-    file = request.files['file']
+    file = files['file']
     
     if file.filename == '':
         return jsonify({'error': '没有选择文件'}), 400
     
     if file and allowed_file(file.filename):
+        if app.config['SNIFF_CONTENT']:
+            head = file.stream.read(SNIFF_LENGTH)
+            file.stream.seek(0)
+            if not allowed_content(file.filename, head):
+                return jsonify({'error': CONTENT_MISMATCH_ERROR}), 400
         try:
             # 直接从内存中分析文件，不保存到磁盘
-            result = analyze_photo_from_stream(file)
-            return jsonify(result)
+            result = analyze_photo_from_stream(file, compact_requested())
+            return jsonify(finish_result(result))
 
         except Exception as e:
             return jsonify({'error': f'处理文件时出错: {str(e)}'}), 500
     
     return jsonify({'error': '不支持的文件格式'}), 400
 
+def upload_file_header_only():
+    """流式处理文件上传：只读取文件头部的元数据，剩余请求体直接丢弃"""
+    try:
+        with stage('receive'):
+            upload = read_upload_header(request.stream, request.content_type,
+                                        accept=allowed_file,
+                                        chunk_size=app.config['INGEST_CHUNK_SIZE'],
+                                        max_size=app.config['MAX_CONTENT_LENGTH'],
+                                        drain=app.config['HEADER_INGEST_DRAIN'],
+                                        accept_content=content_check())
+    except RequestEntityTooLarge:
+        raise
+    except Exception as e:
+        return jsonify({'error': f'处理文件时出错: {str(e)}'}), 500
+
+    if not upload.filename:
+        return jsonify({'error': '没有选择文件'}), 400
+
+    if upload.rejected:
+        return jsonify({'error': upload_error(upload)}), 400
+
+    try:
+        result = analyze_photo_data(upload.data, compact_requested())
+        return jsonify(finish_result(result))
+
+    except Exception as e:
+        return jsonify({'error': f'处理文件时出错: {str(e)}'}), 500
+
 @app.route('/analyze', methods=['POST'])
 def analyze():
-    """分析照片的API端点"""
+    """分析照片的API端点（?compact=1 时返回紧凑结果）"""
     return upload_file()
 
+@app.route('/analyze/header', methods=['POST'])
+@instrumented
+@admitted('header')
+def analyze_header():
+    """
+    分析浏览器端截取的文件头部（请求体为原始字节，JPEG截取到SOS段为止）
+
+    服务端本来也只分析这部分数据，结果与上传完整文件到 /upload 时相同。
+    ?filename= 给出原文件名时检查扩展名，?compact=1 时返回紧凑结果。
+    """
+    limit = app.config['HEADER_UPLOAD_MAX_BYTES']
+    if request.content_length is not None and request.content_length > limit:
+        return jsonify({'error': '文件头部大小超过限制'}), 413
+    with stage('receive'):
+        data = request.stream.read(limit + 1)
+    if len(data) > limit:
+        return jsonify({'error': '文件头部大小超过限制'}), 413
+    if not data:
+        return jsonify({'error': '没有选择文件'}), 400
+
+    filename = request.args.get('filename')
+    if filename and not allowed_file(filename):
+        return jsonify({'error': '不支持的文件格式'}), 400
+    if app.config['SNIFF_CONTENT']:
+        image_format = sniff_format(data)
+        if image_format is None or (filename and not extension_matches(filename, image_format)):
+            return jsonify({'error': CONTENT_MISMATCH_ERROR}), 400
+
+    try:
+        result = analyze_photo_data(trim_header(data), compact_requested())
+        return jsonify(finish_result(result))
+
+    except Exception as e:
+        return jsonify({'error': f'处理文件时出错: {str(e)}'}), 500
+
+@app.route('/analyze/codes', methods=['GET'])
+def analyze_codes():
+    """紧凑结果中字段编号和指标编号的说明"""
+    return jsonify(compact_schema())
+
+@app.route('/analyze/batch', methods=['POST'])
+@instrumented
+@admitted('batch')
+def analyze_batch_files():
+    """
+    批量分析：一个multipart请求中包含多个 files 字段，按上传顺序返回每个文件的结果
+
+    ?stream=1 时返回NDJSON流（分块传输），每个文件分析完成后立即输出一行，
+    按完成顺序排列，条目中的 index 为文件在请求中的位置。
+    """
+    try:
+        # 批量请求体的大小限制单独配置，不受单文件的 MAX_CONTENT_LENGTH 限制
+        stream = get_input_stream(request.environ,
+                                  max_content_length=app.config['BATCH_MAX_TOTAL_BYTES'])
+        uploads = read_upload_headers(stream, request.content_type,
+                                      accept=allowed_file,
+                                      chunk_size=app.config['INGEST_CHUNK_SIZE'],
+                                      max_size=app.config['MAX_CONTENT_LENGTH'],
+                                      max_files=app.config['BATCH_MAX_FILES'],
+                                      drain=app.config['HEADER_INGEST_DRAIN'],
+                                      accept_content=content_check())
+    except RequestEntityTooLarge:
+        return jsonify({'error': '上传文件总大小超过限制'}), 413
+    except Exception as e:
+        return jsonify({'error': f'处理文件时出错: {str(e)}'}), 500
+
+    uploads = [upload for upload in uploads if upload.filename]
+    if not uploads:
+        return jsonify({'error': '没有选择文件'}), 400
+
+    if len(uploads) > app.config['BATCH_MAX_FILES']:
+        return jsonify({'error': f'文件数量超过限制（最多{app.config["BATCH_MAX_FILES"]}个）'}), 400
+
+    if stream_requested():
+        items = iter_batch_items(uploads, workers=app.config['BATCH_WORKERS'], compact=compact_requested())
+        return Response(ndjson_lines(items), mimetype='application/x-ndjson')
+
+    accepted = [upload for upload in uploads if not upload.rejected]
+    try:
+        # 头部数据很小，转换为bytes后传给工作进程
+        results = analyze_batch([bytes(upload.data) for upload in accepted],
+                                workers=app.config['BATCH_WORKERS'],
+                                compact=compact_requested())
+    except Exception as e:
+        return jsonify({'error': f'处理文件时出错: {str(e)}'}), 500
+
+    if app.config['METRICS_ENABLED']:
+        for result in results:
+            observe_result(result)
+    items = batch_items(uploads, results)
+    return jsonify({'count': len(items), 'results': items})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus文本格式的服务指标（设置 METRICS_DIR 时合并所有服务进程）"""
+    if not app.config['METRICS_ENABLED']:
+        return jsonify({'error': '页面不存在'}), 404
+    body = render_metrics(app.config['METRICS_DIR'], app.config['METRICS_EXPORT_INTERVAL'])
+    return Response(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
 if __name__ == '__main__':
     app.run(debug=app.config['DEBUG'],
             host=app.config['HOST'],
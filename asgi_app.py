@@ -0,0 +1,494 @@
+"""
+异步服务入口 - ASGI应用
+
+在事件循环中接收上传：请求体按ASGI消息逐块推入解析器，慢速客户端只占用一个协程，
+不会占住工作线程。EXIF解析和完整性检查是CPU密集型工作，交给大小固定的进程池或线程池执行。
+返回的JSON与 app.py 中的 /upload、/analyze、/analyze/header、/analyze/batch 和 /analyze/codes 相同。
+
+启动（需要安装任意ASGI服务器，例如 uvicorn）:
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+"""
+
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from urllib.parse import parse_qs
+from admission import AsyncAdmissionGate, Overloaded, buffer_limit, request_cost
+from batch_analyzer import CONTENT_MISMATCH_ERROR, analyze_item, batch_items, resolve_workers, upload_error
+from config import Config
+from metrics import (
+    POOL_PENDING, REQUESTS_IN_PROGRESS, observe_request, observe_result, observe_stages, render_metrics,
+    start_exporter
+)
+from image_probe import extension_matches, sniff_format
+from photo_analyzer import compact_schema
+from stage_timing import StageTimings, run_timed
+from stream_ingest import UploadHeaderParser, trim_header
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+# 记录请求指标的分析端点
+INSTRUMENTED_PATHS = ('/upload', '/analyze', '/analyze/header', '/analyze/batch')
+
+
+def allowed_file(filename, config=Config):
+    """检查文件扩展名是否允许"""
+    return '.' in filename and \
+           filename.rsplit('.', 1)[1].lower() in config.ALLOWED_EXTENSIONS
+
+
+def allowed_content(filename, head):
+    """按文件开头的字节识别格式，检查是否与扩展名一致"""
+    return extension_matches(filename, sniff_format(head))
+
+
+def query_value(scope, name):
+    """查询参数的值（同名参数取最后一个），没有时返回None"""
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    values = query.get(name)
+    return values[-1] if values else None
+
+
+def query_flag(scope, name):
+    """查询参数中的开关（?name=1）"""
+    return (query_value(scope, name) or '').lower() in ('1', 'true', 'yes')
+
+
+def compact_requested(scope):
+    """请求是否要求紧凑结果（?compact=1）"""
+    return query_flag(scope, 'compact')
+
+
+def json_body(data):
+    """与Flask jsonify相同的序列化方式（非调试模式）"""
+    return (json.dumps(data, ensure_ascii=True, sort_keys=True, separators=(',', ':')) + '\n').encode()
+
+
+class RequestTooLarge(Exception):
+    """请求体超过大小限制"""
+
+
+class AsgiApp:
+    """照片分析ASGI应用"""
+
+    def __init__(self, config=Config):
+        self.config = config
+        self.executor = None
+        self._index_page = None
+        self.admission = AsyncAdmissionGate.from_config(config)
+        if config.METRICS_ENABLED:
+            start_exporter(config.METRICS_DIR, config.METRICS_EXPORT_INTERVAL)
+
+    # ==================== 执行器 ====================
+
+    def start(self):
+        """创建分析任务使用的进程池或线程池"""
+        if self.executor is None:
+            workers = resolve_workers(self.config.ASGI_WORKERS) or 1
+            if self.config.ASGI_EXECUTOR == 'thread':
+                self.executor = ThreadPoolExecutor(max_workers=workers)
+            else:
+                self.executor = ProcessPoolExecutor(max_workers=workers)
+        return self.executor
+
+    def stop(self):
+        """关闭执行器"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+    async def analyze(self, data, compact=False, timings=None):
+        """在执行器中分析单个文件；给出 timings（StageTimings）时记录各阶段耗时"""
+        executor = self.start()
+        if isinstance(executor, ProcessPoolExecutor):
+            # 进程池需要可序列化的数据；头部数据很小，复制代价可以忽略
+            data = bytes(data)
+        analyze = partial(analyze_item, compact=compact)
+        loop = asyncio.get_running_loop()
+        POOL_PENDING.inc('asgi')
+        try:
+            if timings is None:
+                return await loop.run_in_executor(executor, analyze, data)
+            # 计时记录在执行器中，随结果一起返回
+            result, durations = await loop.run_in_executor(executor, partial(run_timed, analyze), data)
+        finally:
+            POOL_PENDING.dec('asgi')
+        timings.update(durations)
+        return result
+
+    # ==================== ASGI入口 ====================
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        path = scope['path']
+        method = scope['method']
+        routes = {
+            '/': ('GET', self.index),
+            '/upload': ('POST', self.upload),
+            '/analyze': ('POST', self.upload),
+            '/analyze/header': ('POST', self.analyze_header),
+            '/analyze/batch': ('POST', self.analyze_batch),
+            '/analyze/codes': ('GET', self.analyze_codes),
+            '/metrics': ('GET', self.metrics),
+        }
+        if path not in routes:
+            await self.send_json(send, 404, {'error': '页面不存在'})
+            return
+        allowed_method, handler = routes[path]
+        if method != allowed_method:
+            await self.send_json(send, 405, {'error': '不支持的请求方法'})
+            return
+        limit = self.admission_limit(path)
+        if limit is not None:
+            handler = partial(self.admitted, handler, limit)
+        if self.config.METRICS_ENABLED and path in INSTRUMENTED_PATHS:
+            await self.instrumented(handler, path, scope, receive, send)
+        else:
+            await handler(scope, receive, send)
+
+    async def instrumented(self, handler, endpoint, scope, receive, send):
+        """执行处理函数并记录请求数、耗时（含流式响应的发送）和接收的字节数"""
+        status = 500
+        received = 0
+
+        async def counting_receive():
+            nonlocal received
+            message = await receive()
+            received += len(message.get('body', b''))
+            return message
+
+        async def status_send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        REQUESTS_IN_PROGRESS.inc(endpoint)
+        start = time.perf_counter()
+        try:
+            await handler(scope, counting_receive, status_send)
+        finally:
+            REQUESTS_IN_PROGRESS.dec(endpoint)
+            observe_request(endpoint, status, time.perf_counter() - start, received)
+
+    def admission_limit(self, path):
+        """需要准入控制的端点处理时最多缓存的字节数（上传总是只读取文件头部），其他端点为None"""
+        endpoint = {
+            '/upload': 'upload',
+            '/analyze': 'upload',
+            '/analyze/header': 'header',
+            '/analyze/batch': 'batch',
+        }.get(path)
+        return None if endpoint is None else buffer_limit(self.config, endpoint)
+
+    async def admitted(self, handler, limit, scope, receive, send):
+        """读取请求体之前申请准入（同 app.admitted），排队失败时直接返回503和 Retry-After"""
+        content_length = self.header(scope, b'content-length')
+        content_length = int(content_length) if content_length and content_length.isdigit() else None
+        try:
+            ticket = await self.admission.acquire(request_cost(content_length, limit))
+        except Overloaded as e:
+            await self.send_json(send, 503, {'error': str(e)},
+                                 [(b'retry-after', str(e.retry_after).encode())])
+            return
+        try:
+            await handler(scope, receive, send)
+        finally:
+            ticket.release()
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.stop()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    # ==================== 请求与响应 ====================
+
+    @staticmethod
+    async def send_response(send, status, body, content_type, headers=()):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', content_type),
+                (b'content-length', str(len(body)).encode()),
+            ] + list(headers),
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def send_json(self, send, status, data, headers=()):
+        await self.send_response(send, status, json_body(data), b'application/json', headers)
+
+    @staticmethod
+    def header(scope, name):
+        for key, value in scope['headers']:
+            if key == name:
+                return value.decode('latin-1')
+        return None
+
+    def content_check(self):
+        """上传解析使用的内容检查函数，未启用 SNIFF_CONTENT 时为None"""
+        return allowed_content if self.config.SNIFF_CONTENT else None
+
+    async def receive_body(self, scope, receive, max_length):
+        """
+        接收整个请求体（不超过 max_length 字节）
+
+        Returns:
+            bytearray: 请求体；客户端在请求体结束前断开时为None
+        """
+        content_length = self.header(scope, b'content-length')
+        if content_length and content_length.isdigit() and int(content_length) > max_length:
+            raise RequestTooLarge()
+
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            body += message.get('body', b'')
+            if len(body) > max_length:
+                raise RequestTooLarge()
+            if not message.get('more_body', False):
+                return body
+
+    async def receive_uploads(self, scope, receive, parser, max_length):
+        """
+        逐条接收请求体消息并推入解析器
+
+        解析完成后继续接收并丢弃剩余数据（HEADER_INGEST_DRAIN），保持连接可复用。
+
+        Returns:
+            bool: 客户端是否在请求体结束前断开
+        """
+        content_length = self.header(scope, b'content-length')
+        if max_length is not None and content_length and content_length.isdigit() \
+                and int(content_length) > max_length:
+            raise RequestTooLarge()
+
+        received = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return True
+            body = message.get('body', b'')
+            received += len(body)
+            if max_length is not None and received > max_length:
+                raise RequestTooLarge()
+            more_body = message.get('more_body', False)
+            if not parser.finished:
+                if body:
+                    parser.feed(body)
+                if not more_body:
+                    parser.feed(b'')
+            if not more_body:
+                return False
+            if parser.finished and not self.config.HEADER_INGEST_DRAIN:
+                return False
+
+    # ==================== 路由 ====================
+
+    async def index(self, scope, receive, send):
+        """主页面"""
+        if self._index_page is None:
+            with open(os.path.join(TEMPLATE_DIR, 'index.html'), 'rb') as f:
+                self._index_page = f.read()
+        await self.send_response(send, 200, self._index_page, b'text/html; charset=utf-8')
+
+    def new_timings(self, scope):
+        """启用阶段计时或指标时为请求创建 StageTimings，否则为None"""
+        if self.config.SERVER_TIMING or query_flag(scope, 'timing') or self.config.METRICS_ENABLED:
+            return StageTimings()
+        return None
+
+    async def upload(self, scope, receive, send):
+        """处理单个文件上传（与 /upload 相同，启用阶段计时时添加 Server-Timing 响应头）"""
+        timings = self.new_timings(scope)
+        start = time.perf_counter()
+        parser = UploadHeaderParser(self.header(scope, b'content-type') or '', field_name='file',
+                                    accept=lambda name: allowed_file(name, self.config),
+                                    max_size=self.config.MAX_CONTENT_LENGTH, max_files=1,
+                                    accept_content=self.content_check())
+        try:
+            if await self.receive_uploads(scope, receive, parser, self.config.MAX_CONTENT_LENGTH):
+                return
+        except RequestTooLarge:
+            await self.send_json(send, 413, {'error': '上传文件大小超过限制'})
+            return
+
+        if timings is not None:
+            timings.add('receive', time.perf_counter() - start)
+
+        upload = parser.uploads[0] if parser.uploads else None
+        if upload is None or not upload.filename:
+            await self.send_json(send, 400, {'error': '没有选择文件'})
+            return
+        if upload.rejected:
+            await self.send_json(send, 400, {'error': upload_error(upload)})
+            return
+
+        await self.send_analysis(scope, send, upload.data, timings, start)
+
+    async def analyze_header(self, scope, receive, send):
+        """分析浏览器端截取的文件头部（与 /analyze/header 相同，请求体为原始字节）"""
+        timings = self.new_timings(scope)
+        start = time.perf_counter()
+        try:
+            data = await self.receive_body(scope, receive, self.config.HEADER_UPLOAD_MAX_BYTES)
+        except RequestTooLarge:
+            await self.send_json(send, 413, {'error': '文件头部大小超过限制'})
+            return
+        if data is None:
+            return
+
+        if timings is not None:
+            timings.add('receive', time.perf_counter() - start)
+
+        if not data:
+            await self.send_json(send, 400, {'error': '没有选择文件'})
+            return
+        filename = query_value(scope, 'filename')
+        if filename and not allowed_file(filename, self.config):
+            await self.send_json(send, 400, {'error': '不支持的文件格式'})
+            return
+        if self.config.SNIFF_CONTENT:
+            image_format = sniff_format(data)
+            if image_format is None or (filename and not extension_matches(filename, image_format)):
+                await self.send_json(send, 400, {'error': CONTENT_MISMATCH_ERROR})
+                return
+
+        await self.send_analysis(scope, send, trim_header(bytes(data)), timings, start)
+
+    async def send_analysis(self, scope, send, data, timings, start):
+        """在执行器中分析单个文件并发送结果，启用阶段计时时添加 Server-Timing 响应头"""
+        timing_in_body = query_flag(scope, 'timing')
+        try:
+            result = await self.analyze(data, compact_requested(scope), timings)
+        except Exception as e:
+            await self.send_json(send, 500, {'error': f'处理文件时出错: {str(e)}'})
+            return
+        if self.config.METRICS_ENABLED:
+            observe_result(result)
+            observe_stages(timings)
+        if not (self.config.SERVER_TIMING or timing_in_body):
+            await self.send_json(send, 200, result)
+            return
+        if timing_in_body:
+            result = dict(result, timings=timings.as_milliseconds())
+        timings.add('total', time.perf_counter() - start)
+        await self.send_json(send, 200, result, [(b'server-timing', timings.header().encode())])
+
+    async def analyze_batch(self, scope, receive, send):
+        """批量分析（与 /analyze/batch 相同，?stream=1 时返回NDJSON流）"""
+        max_files = self.config.BATCH_MAX_FILES
+        parser = UploadHeaderParser(self.header(scope, b'content-type') or '', field_name='files',
+                                    accept=lambda name: allowed_file(name, self.config),
+                                    max_size=self.config.MAX_CONTENT_LENGTH, max_files=max_files + 1,
+                                    accept_content=self.content_check())
+        try:
+            if await self.receive_uploads(scope, receive, parser, self.config.BATCH_MAX_TOTAL_BYTES):
+                return
+        except RequestTooLarge:
+            await self.send_json(send, 413, {'error': '上传文件总大小超过限制'})
+            return
+
+        uploads = [upload for upload in parser.uploads if upload.filename]
+        if not uploads:
+            await self.send_json(send, 400, {'error': '没有选择文件'})
+            return
+        if len(uploads) > max_files:
+            await self.send_json(send, 400, {'error': f'文件数量超过限制（最多{max_files}个）'})
+            return
+
+        compact = compact_requested(scope)
+        if self.stream_requested(scope):
+            await self.stream_batch(send, uploads, compact)
+            return
+
+        try:
+            results = await asyncio.gather(*(self.analyze(upload.data, compact)
+                                             for upload in uploads if not upload.rejected))
+        except Exception as e:
+            await self.send_json(send, 500, {'error': f'处理文件时出错: {str(e)}'})
+            return
+
+        if self.config.METRICS_ENABLED:
+            for result in results:
+                observe_result(result)
+        items = batch_items(uploads, results)
+        await self.send_json(send, 200, {'count': len(items), 'results': items})
+
+    def stream_requested(self, scope):
+        """请求是否要求流式结果（?stream=1 或 Accept: application/x-ndjson）"""
+        return query_flag(scope, 'stream') or 'application/x-ndjson' in (self.header(scope, b'accept') or '')
+
+    async def analyze_entry(self, index, upload, compact):
+        """分析单个文件，得到流式响应的一个条目（出错时为错误条目，不中断其他文件）"""
+        try:
+            result = await self.analyze(upload.data, compact)
+        except Exception as e:
+            return {'index': index, 'filename': upload.filename, 'error': f'处理文件时出错: {str(e)}'}
+        if self.config.METRICS_ENABLED:
+            observe_result(result)
+        return {'index': index, 'filename': upload.filename, 'result': result}
+
+    async def stream_batch(self, send, uploads, compact):
+        """以NDJSON流返回批量结果：不设 content-length（分块传输），每个文件分析完成后立即发送一行"""
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'application/x-ndjson')],
+        })
+        tasks = []
+        for index, upload in enumerate(uploads):
+            if upload.rejected:
+                line = json_body({'index': index, 'filename': upload.filename, 'error': upload_error(upload)})
+                await send({'type': 'http.response.body', 'body': line, 'more_body': True})
+            else:
+                tasks.append(asyncio.ensure_future(self.analyze_entry(index, upload, compact)))
+        try:
+            for next_entry in asyncio.as_completed(tasks):
+                entry = await next_entry
+                await send({'type': 'http.response.body', 'body': json_body(entry), 'more_body': True})
+        finally:
+            # 客户端断开时取消尚未完成的分析
+            for task in tasks:
+                task.cancel()
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def metrics(self, scope, receive, send):
+        """服务指标（与 /metrics 相同）"""
+        if not self.config.METRICS_ENABLED:
+            await self.send_json(send, 404, {'error': '页面不存在'})
+            return
+        body = render_metrics(self.config.METRICS_DIR, self.config.METRICS_EXPORT_INTERVAL).encode()
+        await self.send_response(send, 200, body, b'text/plain; version=0.0.4; charset=utf-8')
+
+    async def analyze_codes(self, scope, receive, send):
+        """紧凑结果中的编号说明（与 /analyze/codes 相同）"""
+        await self.send_json(send, 200, compact_schema())
+
+
+app = AsgiApp()
+
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        print("需要安装ASGI服务器: pip install uvicorn")
+    else:
+        uvicorn.run(app, host=Config.HOST, port=Config.PORT)
@@ -0,0 +1,200 @@
+"""
+批量分析 - 使用进程池并行分析多张照片
+
+EXIF解析和完整性检查都是纯Python的CPU密集型工作，受GIL限制无法用线程并行。
+这里把每个文件的头部数据分发给工作进程，按输入顺序返回分析结果；
+流式响应（NDJSON）则按完成顺序逐个产出，每个文件分析完成后立即发给客户端。
+"""
+
+import atexit
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from metrics import POOL_PENDING
+from photo_analyzer import analyze_photo_data
+
+_executor = None
+_executor_workers = None
+
+
+def resolve_workers(workers=None):
+    """工作进程数：None 表示使用CPU核心数，0 表示在当前进程中执行"""
+    if workers is None:
+        return os.cpu_count() or 1
+    return max(int(workers), 0)
+
+
+def get_executor(workers=None):
+    """获取（必要时创建）共享的进程池"""
+    global _executor, _executor_workers
+    workers = resolve_workers(workers)
+    if _executor is not None and _executor_workers != workers:
+        shutdown_executor()
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=workers)
+        _executor_workers = workers
+    return _executor
+
+
+def shutdown_executor():
+    """关闭共享的进程池"""
+    global _executor, _executor_workers
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+        _executor_workers = None
+
+
+atexit.register(shutdown_executor)
+
+
+def analyze_item(file_content, compact=False):
+    """在工作进程中分析单个文件，任何异常都转换为错误结果"""
+    try:
+        return analyze_photo_data(file_content, compact)
+    except Exception as e:
+        return {'success': False, 'error': f'分析照片时出错: {str(e)}'}
+
+
+def analyze_batch(contents, workers=None, compact=False):
+    """
+    并行分析多个文件
+
+    Args:
+        contents: 各文件的数据（bytes，需可序列化传给工作进程）
+        workers: 工作进程数，None 为CPU核心数，0 为在当前进程中执行
+        compact: 为True时返回紧凑结果（见 photo_analyzer.analyze_photo_data）
+
+    Returns:
+        list: 与输入顺序一致的分析结果
+    """
+    contents = list(contents)
+    workers = resolve_workers(workers)
+    analyze = partial(analyze_item, compact=compact)
+    if workers == 0 or len(contents) <= 1:
+        return [analyze(content) for content in contents]
+
+    # 每个进程分到几批任务，减少进程间通信次数
+    chunksize = max(1, len(contents) // (workers * 4))
+    results = []
+    POOL_PENDING.inc('batch', amount=len(contents))
+    try:
+        for result in get_executor(workers).map(analyze, contents, chunksize=chunksize):
+            results.append(result)
+            POOL_PENDING.dec('batch')
+        return results
+    except BrokenProcessPool as e:
+        # 工作进程异常退出，丢弃进程池，下次请求时重新创建
+        print(f"批量分析进程池异常: {e}")
+        shutdown_executor()
+        return [analyze(content) for content in contents]
+    finally:
+        POOL_PENDING.dec('batch', amount=len(contents) - len(results))
+
+
+def iter_batch(contents, workers=None, compact=False):
+    """
+    并行分析多个文件，每个文件分析完成后立即产出结果
+
+    Args:
+        contents: 各文件的数据（bytes，需可序列化传给工作进程）
+        workers: 工作进程数，None 为CPU核心数，0 为在当前进程中执行
+        compact: 为True时返回紧凑结果（见 photo_analyzer.analyze_photo_data）
+
+    Yields:
+        tuple: (输入中的下标, 分析结果)，按完成顺序
+    """
+    contents = list(contents)
+    workers = resolve_workers(workers)
+    analyze = partial(analyze_item, compact=compact)
+    if workers == 0 or len(contents) <= 1:
+        for index, content in enumerate(contents):
+            yield index, analyze(content)
+        return
+
+    executor = get_executor(workers)
+    futures = {}
+    for index, content in enumerate(contents):
+        future = executor.submit(analyze, content)
+        POOL_PENDING.inc('batch')
+        future.add_done_callback(_task_done)
+        futures[future] = index
+    pending = set(futures.values())
+    try:
+        for future in as_completed(futures):
+            index = futures[future]
+            result = future.result()
+            pending.discard(index)
+            yield index, result
+    except BrokenProcessPool as e:
+        # 工作进程异常退出，丢弃进程池，尚未产出的文件在当前进程中分析
+        print(f"批量分析进程池异常: {e}")
+        shutdown_executor()
+        for index in sorted(pending):
+            yield index, analyze(contents[index])
+    finally:
+        # 客户端断开时生成器被关闭，取消尚未开始的任务
+        for future in futures:
+            future.cancel()
+
+
+def _task_done(future):
+    # 完成、出错和取消的任务都会调用
+    POOL_PENDING.dec('batch')
+
+
+# 文件开头的内容与扩展名不符时的错误信息
+CONTENT_MISMATCH_ERROR = '文件内容与扩展名不符或不是支持的图片格式'
+
+
+def upload_error(upload):
+    """被拒绝的上传文件的错误信息"""
+    if upload.mismatched:
+        return CONTENT_MISMATCH_ERROR
+    return '不支持的文件格式'
+
+
+def iter_batch_items(uploads, workers=None, compact=False):
+    """
+    逐个产出批量分析的响应条目：被拒绝的文件最先产出，其余文件按分析完成的顺序产出
+
+    Args:
+        uploads: 请求中的 UploadHeader 列表（含被拒绝的文件）
+
+    Yields:
+        dict: {'index', 'filename', 'result'} 或 {'index', 'filename', 'error'}，index 为文件在请求中的位置
+    """
+    accepted = []
+    for index, upload in enumerate(uploads):
+        if upload.rejected:
+            yield {'index': index, 'filename': upload.filename, 'error': upload_error(upload)}
+        else:
+            accepted.append(index)
+
+    # 头部数据很小，转换为bytes后传给工作进程
+    contents = [bytes(uploads[index].data) for index in accepted]
+    for position, result in iter_batch(contents, workers, compact):
+        index = accepted[position]
+        yield {'index': index, 'filename': uploads[index].filename, 'result': result}
+
+
+def batch_items(uploads, results):
+    """
+    组装批量分析的响应条目
+
+    Args:
+        uploads: 请求中的 UploadHeader 列表（含被拒绝的文件）
+        results: 未被拒绝的文件按顺序得到的分析结果
+
+    Returns:
+        list: 每个文件一项，{'filename', 'result'} 或 {'filename', 'error'}
+    """
+    results = iter(results)
+    items = []
+    for upload in uploads:
+        if upload.rejected:
+            items.append({'filename': upload.filename, 'error': upload_error(upload)})
+        else:
+            items.append({'filename': upload.filename, 'result': next(results)})
+    return items
@@ -0,0 +1,405 @@
+"""
+批量完整性评分 - 对列式元数据做向量化计算
+
+规则变化后需要对整个归档重新评分时，逐张调用 check_exif_integrity 的开销主要在Python层。
+这里接收按列组织的字段（制造商、型号、软件、时间、ISO、焦距……），
+时间一致性、数值范围和缺失字段规则用NumPy向量化计算；
+软件签名、设备一致性、量化表和EXIF布局规则只对去重后的取值各计算一次，再按下标广播回整列。
+
+返回每张照片的置信度和指标/警告位掩码。每个位对应 check_integrity 输出中的一条指标或警告，
+计数和置信度与逐张调用 check_integrity（执行全部内置规则）完全一致。
+
+需要安装NumPy（可选依赖）: pip install numpy
+"""
+
+from exif_integrity_checker import (
+    ExifIntegrityChecker, GPS_REFERENCE_FIELDS, TIMESTAMP_TOLERANCE, _shared_checker
+)
+from exif_time import (
+    MICROSECONDS, MIN_UTC_OFFSET, MAX_UTC_OFFSET, TIME_FIELD_GROUPS,
+    days_from_civil, gps_timestamp, is_blank, parse_datetime, parse_offset, parse_subsec
+)
+from field_plan import FIELD_NAMES, PhotoRecord
+
+try:
+    import numpy as np
+except ImportError:  # NumPy是可选依赖
+    np = None
+
+# 参与评分的列
+SCORING_FIELDS = ('Make', 'Model', 'Software', 'ProcessingSoftware', 'HostComputer',
+                  'DateTime', 'DateTimeOriginal', 'DateTimeDigitized',
+                  'SubSecTime', 'SubSecTimeOriginal', 'SubSecTimeDigitized',
+                  'OffsetTime', 'OffsetTimeOriginal', 'OffsetTimeDigitized', 'GPSDate', 'GPSTimeStamp',
+                  'ISOSpeedRatings', 'FocalLength', 'quantization', 'exif_layout', 'thumbnail')
+
+SOFTWARE_FIELDS = ('Software', 'ProcessingSoftware', 'HostComputer')
+TIME_FIELDS = tuple(field for field, _, _ in TIME_FIELD_GROUPS)
+TIME_PAIRS = ((0, 1), (0, 2), (1, 2))
+
+# ==================== 位定义 ====================
+
+# 指标位（每一位对应 check_integrity 中的一条指标）
+INDICATOR_BITS = {}
+for _index, _field in enumerate(SOFTWARE_FIELDS):
+    INDICATOR_BITS[f'editing_software:{_field}'] = 1 << _index
+    INDICATOR_BITS[f'suspicious_software:{_field}'] = 1 << (_index + 3)
+for _index, (_first, _second) in enumerate(TIME_PAIRS):
+    INDICATOR_BITS[f'timestamp_mismatch:{TIME_FIELDS[_first]}:{TIME_FIELDS[_second]}'] = 1 << (_index + 6)
+INDICATOR_BITS['device_mismatch'] = 1 << 9
+INDICATOR_BITS['missing_critical_fields'] = 1 << 10
+INDICATOR_BITS['abnormal_iso'] = 1 << 11
+INDICATOR_BITS['abnormal_focal_length'] = 1 << 12
+INDICATOR_BITS['iso_out_of_model_range'] = 1 << 13
+INDICATOR_BITS['focal_out_of_model_range'] = 1 << 14
+INDICATOR_BITS['quantization_mismatch'] = 1 << 15
+INDICATOR_BITS['exif_layout_mismatch'] = 1 << 16
+INDICATOR_BITS['thumbnail_mismatch'] = 1 << 17
+INDICATOR_BITS['gps_time_mismatch'] = 1 << 18
+
+# 警告位
+WARNING_BITS = {}
+for _index, _field in enumerate(TIME_FIELDS):
+    WARNING_BITS[f'unparsable_time:{_field}'] = 1 << _index
+WARNING_BITS['unknown_manufacturer'] = 1 << 3
+for _index, (_field, _, _offset_field) in enumerate(TIME_FIELD_GROUPS):
+    WARNING_BITS[f'invalid_offset:{_offset_field}'] = 1 << (_index + 4)
+WARNING_BITS['unparsable_gps_date'] = 1 << 7
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError('批量评分需要安装NumPy: pip install numpy')
+
+
+def describe_bits(mask, bits=INDICATOR_BITS):
+    """把位掩码转换为名称列表"""
+    return [name for name, bit in bits.items() if int(mask) & bit]
+
+
+def records_to_columns(records):
+    """
+    把 PhotoRecord 列表转换为列式数据
+
+    Returns:
+        dict: 字段名 -> 该字段在各记录中的值组成的列表
+    """
+    return {field: [getattr(record, field) for record in records] for field in SCORING_FIELDS}
+
+
+# ==================== 时间解析 ====================
+
+def _days_in_month(year, month):
+    leap = ((year % 4 == 0) & (year % 100 != 0)) | (year % 400 == 0)
+    days = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])[month - 1]
+    return days + ((month == 2) & leap)
+
+
+def parse_timestamps(values):
+    """
+    批量解析 'YYYY:MM:DD HH:MM:SS' 格式的时间
+
+    标准的19字符格式用向量化方式解析；其余非空值逐个交给 exif_time.parse_datetime，
+    因此是否能解析的判断与 check_integrity 完全一致。
+
+    Returns:
+        tuple: (present, valid, seconds)
+               present: 值是否为真（参与检查）
+               valid: 是否解析成功
+               seconds: 1970-01-01起的秒数（int64，无效时为0）
+    """
+    count = len(values)
+    present = np.fromiter((bool(value) for value in values), dtype=bool, count=count)
+    valid = np.zeros(count, dtype=bool)
+    seconds = np.zeros(count, dtype=np.int64)
+
+    # 长度取自原始字符串：numpy 的字符串数组会去掉末尾的NUL，'...:00\x00' 按数组长度计会被误认为标准格式
+    lengths = np.fromiter((len(value) if isinstance(value, str) else 0 for value in values),
+                          dtype=np.int64, count=count)
+    candidates = np.flatnonzero(present & (lengths == 19))
+    fast = np.zeros(count, dtype=bool)
+
+    if candidates.size:
+        texts = np.array([values[row] for row in candidates], dtype='U19')
+        codes = texts.view(np.uint32).reshape(-1, 19)
+        digit_positions = [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18]
+        digits = codes[:, digit_positions].astype(np.int64) - 48
+        layout = (np.all((digits >= 0) & (digits <= 9), axis=1)
+                  & (codes[:, 4] == 58) & (codes[:, 7] == 58) & (codes[:, 10] == 32)
+                  & (codes[:, 13] == 58) & (codes[:, 16] == 58))
+        year = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+        month = digits[:, 4] * 10 + digits[:, 5]
+        day = digits[:, 6] * 10 + digits[:, 7]
+        hour = digits[:, 8] * 10 + digits[:, 9]
+        minute = digits[:, 10] * 10 + digits[:, 11]
+        second = digits[:, 12] * 10 + digits[:, 13]
+
+        ok = layout & (year >= 1) & (month >= 1) & (month <= 12) & (day >= 1) \
+            & (hour <= 23) & (minute <= 59) & (second <= 59)
+        ok &= day <= _days_in_month(year, np.clip(month, 1, 12))
+
+        rows = candidates[ok]
+        fast[rows] = True
+        valid[rows] = True
+        seconds[rows] = (days_from_civil(year[ok], month[ok], day[ok]) * 86400
+                         + hour[ok] * 3600 + minute[ok] * 60 + second[ok])
+
+    # 非标准格式（单位数字段、制表符、非ASCII数字等）逐个解析
+    for row in np.flatnonzero(present & ~fast):
+        parsed = parse_datetime(values[row])
+        if parsed is not None:
+            valid[row] = True
+            seconds[row] = parsed
+
+    return present, valid, seconds
+
+
+# ==================== 评分 ====================
+
+def _factorize(values):
+    """按取值去重：返回 (唯一值列表, 每行对应的唯一值下标)"""
+    index = {}
+    codes = np.fromiter((index.setdefault(value, len(index)) for value in values),
+                        dtype=np.int64, count=len(values))
+    return list(index), codes
+
+
+def _map_unique(values, function):
+    """每个唯一值只调用一次 function，返回各行的结果列表"""
+    unique, codes = _factorize(values)
+    results = [function(value) for value in unique]
+    return [results[code] for code in codes]
+
+
+def _offset_column(values):
+    """
+    时区列
+
+    Returns:
+        tuple: (是否有时区, 时区秒数（int64，没有时为0）, 是否为无法解析的非空值)
+    """
+    parsed = _map_unique(values, lambda value: (parse_offset(value), is_blank(value)))
+    has_offset = np.array([offset is not None for offset, _ in parsed], dtype=bool)
+    seconds = np.array([offset or 0 for offset, _ in parsed], dtype=np.int64)
+    invalid = np.array([offset is None and not blank for offset, blank in parsed], dtype=bool)
+    return has_offset, seconds, invalid
+
+
+def _software_masks(checker, values):
+    """软件签名规则：每个唯一值只匹配一次"""
+    unique, codes = _factorize(values)
+    signature_hits = np.zeros(len(unique), dtype=bool)
+    suspicious_hits = np.zeros(len(unique), dtype=bool)
+    for position, value in enumerate(unique):
+        if value is None:
+            continue
+        text = str(value)
+        if not text:
+            continue
+        signature_hits[position] = checker._signature_matcher.first_match(text) is not None
+        suspicious_hits[position] = checker._suspicious_regex is not None \
+            and checker._suspicious_regex.search(text) is not None
+    return signature_hits[codes], suspicious_hits[codes]
+
+
+def _device_masks(checker, makes, models):
+    """
+    设备一致性规则：每个唯一的 (制造商, 型号) 组合只检查一次
+
+    Returns:
+        tuple: (型号不匹配, 未知制造商, 型号范围) —— 型号范围为
+               [ISO下限, ISO上限, 焦距下限, 焦距上限] 组成的 (n, 4) 数组，目录中没有范围时为nan
+    """
+    unique, codes = _factorize(list(zip(makes, models)))
+    mismatch = np.zeros(len(unique), dtype=bool)
+    unknown = np.zeros(len(unique), dtype=bool)
+    ranges = np.full((len(unique), 4), np.nan)
+    for position, (make, model) in enumerate(unique):
+        if not (make and model):
+            continue
+        record = PhotoRecord()
+        record.Make, record.Model = make, model
+        output = {'indicators': [], 'warnings': [], 'details': {}}
+        checker._check_device_consistency(record, output)
+        mismatch[position] = bool(output['indicators'])
+        unknown[position] = bool(output['warnings'])
+
+        entry = checker._resolve_device(make, model)[1]
+        if entry is not None and entry.iso_range:
+            ranges[position, 0:2] = entry.iso_range
+        if entry is not None and entry.focal_range:
+            ranges[position, 2:4] = entry.focal_range
+    return mismatch[codes], unknown[codes], ranges[codes]
+
+
+def _signal_masks(checker, check, signal, values, makes, models):
+    """
+    头部信号规则（量化表、EXIF布局）：每个唯一的 (信号, 制造商, 型号) 组合只检查一次
+
+    这些规则每张照片最多给出一条指标，返回是否给出指标
+    """
+    unique, codes = _factorize(list(zip(values, makes, models)))
+    hits = np.zeros(len(unique), dtype=bool)
+    for position, (value, make, model) in enumerate(unique):
+        if value is None:
+            continue
+        record = PhotoRecord()
+        record.Make, record.Model = make, model
+        setattr(record, signal, value)
+        output = {'indicators': [], 'warnings': [], 'details': {}}
+        check(record, output)
+        hits[position] = bool(output['indicators'])
+    return hits[codes]
+
+
+def _numeric_column(values):
+    """数值列：None 转换为 nan"""
+    return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+
+
+def _popcount(masks):
+    counts = np.zeros(masks.shape, dtype=np.int64)
+    for bit in range(32):
+        counts += (masks >> bit) & 1
+    return counts
+
+
+def score_batch(columns, checker=None):
+    """
+    对一批照片做完整性评分
+
+    Args:
+        columns: 字段名 -> 值序列（长度相同），字段见 SCORING_FIELDS；
+                 值的含义与 field_plan.PhotoRecord 相同（缺失为None）。
+                 可以用 records_to_columns() 从记录列表生成。
+        checker: 提供签名和制造商规则的检测器，默认为共享检测器
+
+    Returns:
+        dict: 各项为长度相同的NumPy数组
+              confidence: 置信度（float64）
+              is_modified: 是否可能被修改（bool）
+              indicators / warnings: 指标 / 警告位掩码（见 INDICATOR_BITS / WARNING_BITS）
+              indicator_count / warning_count: 指标 / 警告数量
+
+    Note:
+        只计算内置规则（相当于不设置置信度上限）。默认的上限为1.0，
+        提前结束时置信度已经封顶，所以 confidence 和 is_modified 与 check_integrity 相同。
+    """
+    _require_numpy()
+    checker = checker or _shared_checker
+    lengths = {len(values) for values in columns.values()}
+    if len(lengths) > 1:
+        raise ValueError('各列长度必须相同')
+    count = lengths.pop() if lengths else 0
+    column = {field: list(columns.get(field, [None] * count)) for field in SCORING_FIELDS}
+
+    indicators = np.zeros(count, dtype=np.int64)
+    warnings = np.zeros(count, dtype=np.int64)
+
+    # 软件签名
+    for field in SOFTWARE_FIELDS:
+        signature_hits, suspicious_hits = _software_masks(checker, column[field])
+        indicators |= np.where(signature_hits, INDICATOR_BITS[f'editing_software:{field}'], 0)
+        indicators |= np.where(suspicious_hits, INDICATOR_BITS[f'suspicious_software:{field}'], 0)
+
+    # 时间戳一致性：(是否有效, 本地时间的微秒数, 是否有时区, 时区秒数)
+    parsed = []
+    for field, subsec_field, offset_field in TIME_FIELD_GROUPS:
+        present, valid, seconds = parse_timestamps(column[field])
+        warnings |= np.where(present & ~valid, WARNING_BITS[f'unparsable_time:{field}'], 0)
+        subsec = np.array(_map_unique(column[subsec_field], parse_subsec), dtype=np.int64)
+        has_offset, offset, invalid_offset = _offset_column(column[offset_field])
+        warnings |= np.where(valid & invalid_offset, WARNING_BITS[f'invalid_offset:{offset_field}'], 0)
+        parsed.append((valid, seconds * MICROSECONDS + subsec, has_offset, offset))
+    for first, second in TIME_PAIRS:
+        valid_first, time_first, has_first, offset_first = parsed[first]
+        valid_second, time_second, has_second, offset_second = parsed[second]
+        # 两者都有时区时按UTC比较
+        both = has_first & has_second
+        difference = np.abs((time_first - np.where(both, offset_first * MICROSECONDS, 0))
+                            - (time_second - np.where(both, offset_second * MICROSECONDS, 0)))
+        mismatch = valid_first & valid_second & (difference > TIMESTAMP_TOLERANCE)
+        name = f'timestamp_mismatch:{TIME_FIELDS[first]}:{TIME_FIELDS[second]}'
+        indicators |= np.where(mismatch, INDICATOR_BITS[name], 0)
+
+    # 拍摄时间与GPS时间（UTC）
+    gps = _map_unique(list(zip(column['GPSDate'], column['GPSTimeStamp'])),
+                      lambda pair: gps_timestamp(*pair))
+    gps_valid = np.array([value is not None for value in gps], dtype=bool)
+    gps_time = np.array([value or 0 for value in gps], dtype=np.int64)
+    gps_date_blank = np.array(_map_unique(column['GPSDate'], is_blank), dtype=bool)
+    gps_time_present = np.array([value is not None for value in column['GPSTimeStamp']], dtype=bool)
+    warnings |= np.where(~gps_valid & ~gps_date_blank & gps_time_present, WARNING_BITS['unparsable_gps_date'], 0)
+
+    reference_valid = np.zeros(count, dtype=bool)
+    reference_time = np.zeros(count, dtype=np.int64)
+    reference_has_offset = np.zeros(count, dtype=bool)
+    reference_offset = np.zeros(count, dtype=np.int64)
+    for field in reversed(GPS_REFERENCE_FIELDS):   # 优先级高的字段最后写入
+        valid, local_time, has_offset, offset = parsed[TIME_FIELDS.index(field)]
+        reference_valid |= valid
+        reference_time = np.where(valid, local_time, reference_time)
+        reference_has_offset = np.where(valid, has_offset, reference_has_offset)
+        reference_offset = np.where(valid, offset, reference_offset)
+    with_offset = np.abs(reference_time - reference_offset * MICROSECONDS - gps_time) > TIMESTAMP_TOLERANCE
+    implied = reference_time - gps_time
+    without_offset = ((implied < MIN_UTC_OFFSET * MICROSECONDS - TIMESTAMP_TOLERANCE)
+                      | (implied > MAX_UTC_OFFSET * MICROSECONDS + TIMESTAMP_TOLERANCE))
+    gps_mismatch = gps_valid & reference_valid & np.where(reference_has_offset, with_offset, without_offset)
+    indicators |= np.where(gps_mismatch, INDICATOR_BITS['gps_time_mismatch'], 0)
+
+    # 设备一致性
+    mismatch, unknown, model_ranges = _device_masks(checker, column['Make'], column['Model'])
+    indicators |= np.where(mismatch, INDICATOR_BITS['device_mismatch'], 0)
+    warnings |= np.where(unknown, WARNING_BITS['unknown_manufacturer'], 0)
+
+    # 关键字段缺失
+    missing = np.zeros(count, dtype=bool)
+    for field in ('Make', 'Model', 'DateTime'):
+        missing |= np.fromiter((value is None for value in column[field]), dtype=bool, count=count)
+    indicators |= np.where(missing, INDICATOR_BITS['missing_critical_fields'], 0)
+
+    # 数值范围（nan 比较结果为False，与逐张检查中nan不触发指标一致）
+    iso = _numeric_column(column['ISOSpeedRatings'])
+    focal = _numeric_column(column['FocalLength'])
+    with np.errstate(invalid='ignore'):
+        abnormal_iso = (iso != 0) & ((iso > 102400) | (iso < 25))
+        abnormal_focal = (focal != 0) & ((focal > 1000) | (focal < 1))
+    indicators |= np.where(abnormal_iso, INDICATOR_BITS['abnormal_iso'], 0)
+    indicators |= np.where(abnormal_focal, INDICATOR_BITS['abnormal_focal_length'], 0)
+
+    # 超出设备目录中该型号的范围（没有范围时上下限为nan，不会触发）
+    with np.errstate(invalid='ignore'):
+        iso_out = (iso != 0) & ((iso < model_ranges[:, 0]) | (iso > model_ranges[:, 1]))
+        focal_out = (focal != 0) & ((focal < model_ranges[:, 2]) | (focal > model_ranges[:, 3]))
+    indicators |= np.where(iso_out, INDICATOR_BITS['iso_out_of_model_range'], 0)
+    indicators |= np.where(focal_out, INDICATOR_BITS['focal_out_of_model_range'], 0)
+
+    # 量化表和EXIF结构布局
+    quantization = _signal_masks(checker, checker._check_quantization_tables, 'quantization',
+                                 column['quantization'], column['Make'], column['Model'])
+    indicators |= np.where(quantization, INDICATOR_BITS['quantization_mismatch'], 0)
+    layout = _signal_masks(checker, checker._check_exif_layout, 'exif_layout',
+                           column['exif_layout'], column['Make'], column['Model'])
+    indicators |= np.where(layout, INDICATOR_BITS['exif_layout_mismatch'], 0)
+
+    # 缩略图与主图（比较结果已在读取信号时算出，这里只比较差异）
+    difference = _numeric_column([None if comparison is None else comparison.difference
+                                  for comparison in column['thumbnail']])
+    indicators |= np.where(difference > checker.thumbnail_threshold, INDICATOR_BITS['thumbnail_mismatch'], 0)
+
+    # 置信度（与 _confidence 相同的运算顺序，保证浮点结果一致）
+    indicator_count = _popcount(indicators)
+    warning_count = _popcount(warnings)
+    confidence = 0.0 + indicator_count * 0.3
+    confidence = confidence + warning_count * 0.1
+    confidence = np.minimum(confidence, 1.0)
+
+    return {
+        'confidence': confidence,
+        'is_modified': confidence > 0.3,
+        'indicators': indicators,
+        'warnings': warnings,
+        'indicator_count': indicator_count,
+        'warning_count': warning_count,
+    }
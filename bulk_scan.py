@@ -0,0 +1,248 @@
+"""
+批量扫描目录 - 递归遍历目录树，多进程并行分析照片，结果以JSONL格式输出
+
+用法:
+    python bulk_scan.py <目录> [<目录> ...] -o results.jsonl [-j 进程数]
+
+已完成的文件路径记录在检查点文件中（默认为 <输出文件>.checkpoint）。
+中断后使用相同参数重新运行，会跳过检查点中已有的文件，结果追加到输出文件末尾。
+每个结果先写入输出文件再记录检查点，因此中断时最多重复输出最后几条结果，不会丢失；
+中断时写了一半的行在重新运行时会被截掉。
+
+文件名不是合法UTF-8时（os.scandir 以代理字符表示无法解码的字节），
+输出文件和检查点文件中按原始字节写出（surrogateescape）。
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from batch_analyzer import resolve_workers
+from config import Config
+from photo_analyzer import analyze_photo
+from result_store import configure_result_store
+
+DEFAULT_BATCH_SIZE = 32          # 每个任务包含的文件数（减少进程间通信次数）
+PROGRESS_INTERVAL = 5.0          # 进度输出间隔（秒）
+
+
+def iter_image_files(roots, extensions=None):
+    """递归遍历目录，按扩展名筛选图片文件（单个文件路径直接返回）"""
+    extensions = extensions or Config.ALLOWED_EXTENSIONS
+    for root in roots:
+        if os.path.isfile(root):
+            yield os.path.abspath(root)
+            continue
+        pending = [os.path.abspath(root)]
+        while pending:
+            directory = pending.pop()
+            try:
+                entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+            except OSError as e:
+                print(f"无法读取目录 {directory}: {e}", file=sys.stderr)
+                continue
+            subdirectories = []
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirectories.append(entry.path)
+                    elif entry.is_file() and '.' in entry.name and \
+                            entry.name.rsplit('.', 1)[1].lower() in extensions:
+                        yield entry.path
+                except OSError:
+                    continue
+            # 倒序入栈，保证按名称顺序遍历
+            pending.extend(reversed(subdirectories))
+
+
+def truncate_partial_line(path):
+    """截掉文件末尾没有换行符的不完整行（上次运行在写入途中被中断）"""
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb+') as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(position - 64 * 1024, 0)
+            f.seek(start)
+            chunk = f.read(position - start)
+            newline = chunk.rfind(b'\n')
+            if newline >= 0:
+                position = start + newline + 1
+                break
+            position = start
+        if position < end:
+            f.truncate(position)
+
+
+def load_checkpoint(checkpoint_path):
+    """读取检查点文件中已完成的文件路径（忽略末尾不完整的行）"""
+    done = set()
+    truncate_partial_line(checkpoint_path)
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path, 'r', encoding='utf-8', errors='surrogateescape') as f:
+            for line in f:
+                path = line.rstrip('\n')
+                if path:
+                    done.add(path)
+    return done
+
+
+def analyze_paths(paths):
+    """在工作进程中分析一批文件"""
+    results = []
+    for path in paths:
+        try:
+            result = analyze_photo(path)
+        except Exception as e:
+            result = {'success': False, 'error': f'分析照片时出错: {str(e)}'}
+        results.append((path, result))
+    return results
+
+
+def iter_batches(paths, batch_size):
+    """把路径按批次分组"""
+    batch = []
+    for path in paths:
+        batch.append(path)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class ScanStats:
+    """扫描进度统计"""
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.processed = 0   # 本次分析的文件数
+        self.failed = 0      # 分析失败的文件数
+        self.skipped = 0     # 检查点中已完成而跳过的文件数
+        self._last_report = self.start_time
+
+    def elapsed(self):
+        return time.perf_counter() - self.start_time
+
+    def throughput(self):
+        elapsed = self.elapsed()
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    def report(self, force=False, stream=sys.stderr):
+        """按间隔输出进度"""
+        now = time.perf_counter()
+        if not force and now - self._last_report < PROGRESS_INTERVAL:
+            return
+        self._last_report = now
+        print(f"已分析 {self.processed} 个文件（失败 {self.failed}，跳过 {self.skipped}），"
+              f"用时 {self.elapsed():.1f} 秒，{self.throughput():.1f} 个/秒", file=stream)
+
+    def summary(self):
+        return {
+            'processed': self.processed,
+            'failed': self.failed,
+            'skipped': self.skipped,
+            'elapsed': round(self.elapsed(), 3),
+            'throughput': round(self.throughput(), 1),
+        }
+
+
+def scan(roots, output_path, checkpoint_path=None, workers=None,
+         batch_size=DEFAULT_BATCH_SIZE, quiet=False, store_path=None):
+    """
+    扫描目录并把分析结果追加写入JSONL文件
+
+    Args:
+        roots: 要扫描的目录或文件列表
+        output_path: JSONL输出文件
+        checkpoint_path: 检查点文件，默认为 <输出文件>.checkpoint
+        workers: 工作进程数，None 为CPU核心数，0 为在当前进程中执行
+        batch_size: 每个任务包含的文件数
+        quiet: 不输出进度
+        store_path: 持久化结果存储文件，未变化的文件直接使用上次的结果
+
+    Returns:
+        dict: 扫描统计
+    """
+    checkpoint_path = checkpoint_path or output_path + '.checkpoint'
+    done = load_checkpoint(checkpoint_path)
+    # 不完整行中的文件没有记入检查点，会重新分析，截掉后新结果不会接在残行后面
+    truncate_partial_line(output_path)
+    stats = ScanStats()
+    workers = resolve_workers(workers)
+
+    def pending_paths():
+        for path in iter_image_files(roots):
+            if path in done:
+                stats.skipped += 1
+            else:
+                yield path
+
+    with open(output_path, 'a', encoding='utf-8', errors='surrogateescape') as output, \
+            open(checkpoint_path, 'a', encoding='utf-8', errors='surrogateescape') as checkpoint:
+
+        def write_results(results):
+            for path, result in results:
+                record = {'path': path, 'result': result}
+                output.write(json.dumps(record, ensure_ascii=False) + '\n')
+                stats.processed += 1
+                if not result.get('success'):
+                    stats.failed += 1
+            # 先落盘结果，再记录检查点
+            output.flush()
+            checkpoint.write(''.join(path + '\n' for path, _ in results))
+            checkpoint.flush()
+            if not quiet:
+                stats.report()
+
+        batches = iter_batches(pending_paths(), batch_size)
+        if workers == 0:
+            if store_path:
+                configure_result_store(store_path)
+            for batch in batches:
+                write_results(analyze_paths(batch))
+        else:
+            # 只保持有限数量的任务在途，目录再大内存占用也不变
+            max_in_flight = workers * 2
+            initargs = (store_path,) if store_path else ()
+            with ProcessPoolExecutor(max_workers=workers,
+                                     initializer=configure_result_store if store_path else None,
+                                     initargs=initargs) as executor:
+                in_flight = set()
+                for batch in batches:
+                    in_flight.add(executor.submit(analyze_paths, batch))
+                    if len(in_flight) >= max_in_flight:
+                        finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            write_results(future.result())
+                for future in in_flight:
+                    write_results(future.result())
+
+    if not quiet:
+        stats.report(force=True)
+    return stats.summary()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='递归扫描目录并批量分析照片，结果输出为JSONL')
+    parser.add_argument('roots', nargs='+', help='要扫描的目录或文件')
+    parser.add_argument('-o', '--output', required=True, help='JSONL输出文件（追加写入）')
+    parser.add_argument('-c', '--checkpoint', help='检查点文件，默认为 <输出文件>.checkpoint')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='工作进程数，默认为CPU核心数')
+    parser.add_argument('-b', '--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help='每个任务包含的文件数')
+    parser.add_argument('-s', '--store', help='持久化结果存储文件（SQLite），未变化的文件不再重新分析')
+    parser.add_argument('-q', '--quiet', action='store_true', help='不输出进度')
+    args = parser.parse_args(argv)
+
+    summary = scan(args.roots, args.output, args.checkpoint, args.workers,
+                   max(args.batch_size, 1), args.quiet, args.store)
+    print(json.dumps(summary, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
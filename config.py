@@ -17,6 +17,57 @@ class Config:
     UPLOAD_FOLDER = 'uploads'
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'tiff', 'tif', 'bmp'}
+    SNIFF_CONTENT = True  # 按文件开头的字节识别格式，拒绝与扩展名不符或不支持的内容（不再读取其余部分）
+
+    # 流式读取配置
+    HEADER_ONLY_INGEST = True      # 上传时只读取文件头部（元数据），不缓存整个文件
+    HEADER_INGEST_DRAIN = True     # 头部读取完毕后丢弃剩余请求体（保持连接可复用）
+    INGEST_CHUNK_SIZE = 64 * 1024  # 每次从请求流读取的字节数
+    HEADER_UPLOAD_MAX_BYTES = 1024 * 1024  # 浏览器端截取的文件头部（/analyze/header）的最大字节数
+
+    # 批量分析配置
+    BATCH_MAX_FILES = 500                      # 单次批量请求最多包含的文件数
+    BATCH_MAX_TOTAL_BYTES = 1024 * 1024 * 1024  # 单次批量请求体的最大字节数（1GB）
+    BATCH_WORKERS = None                       # 工作进程数，None 为CPU核心数，0 为不使用进程池
+
+    # 分析结果缓存配置（按文件头部内容寻址）
+    RESULT_CACHE_ENABLED = True
+    RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024  # 进程内缓存的最大字节数
+    RESULT_CACHE_TTL = 3600                    # 缓存结果的存活时间（秒），0 为不过期
+    RESULT_CACHE_SHARED_PATH = None            # 多进程共享的SQLite缓存文件，None 为不启用
+    RESULT_CACHE_SHARED_MAX_BYTES = 256 * 1024 * 1024  # 共享缓存中结果的最大字节数，None 为不限制
+    RESULT_STORE_PATH = None                   # 按文件路径持久化结果的SQLite文件，None 为不启用
+
+    # 准入控制：读取请求体之前限制同时处理的上传，超出预算且排队失败时返回503和Retry-After
+    ADMISSION_MAX_IN_FLIGHT = 32                     # 同时处理的上传请求数，None 为不限制
+    ADMISSION_MAX_BUFFERED_BYTES = 256 * 1024 * 1024  # 处理中的请求最多缓存的字节数（见 admission.buffer_limit），None 为不限制
+    ADMISSION_QUEUE_SIZE = 64                        # 超出预算时最多排队的请求数，0 为直接拒绝
+    ADMISSION_QUEUE_TIMEOUT = 2.0                    # 排队等待的最长时间（秒）
+    ADMISSION_RETRY_AFTER = 1                        # 503响应中 Retry-After 的秒数
+
+    # 阶段计时：在响应中返回 Server-Timing 头（请求带 ?timing=1 时同时写入结果的 timings）
+    SERVER_TIMING = False
+
+    # 服务指标（/metrics，Prometheus文本格式）
+    METRICS_ENABLED = True
+    METRICS_DIR = None             # 多个服务进程共享快照的目录，None 为只报告当前进程
+    METRICS_EXPORT_INTERVAL = 1.0  # 各进程写入快照的间隔（秒）
+
+    # 异步服务（asgi_app.py）配置
+    ASGI_EXECUTOR = 'process'  # 分析任务交给 'process'（进程池）或 'thread'（线程池）执行
+    ASGI_WORKERS = None        # 池的大小，None 为CPU核心数
+
+    # 完整性检查配置
+    INTEGRITY_CONFIDENCE_CEILING = 1.0  # 置信度达到该值后跳过剩余规则，None 为总是执行全部规则
+    # 编译后的设备目录（python device_catalog.py build 生成），None 为只使用内置的型号特征
+    DEVICE_CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'device_catalog.bin')
+    # 从参考照片采集的量化表指纹（python quant_tables.py learn 生成），None 为只使用IJG标准表
+    QUANT_TABLE_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'quant_tables.csv')
+    # 各制造商/型号原图的EXIF结构布局（python exif_layout.py learn 采集），None 为不检查布局
+    EXIF_LAYOUT_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'exif_layouts.csv')
+    # 比较嵌入缩略图与主图（需要完整文件，主图以1/8比例解码），只有头部数据时自动跳过
+    THUMBNAIL_CHECK = False
+    THUMBNAIL_DIFFERENCE_THRESHOLD = 0.08  # 平均灰度差异超过该比例时认为缩略图与主图不一致
     
     # 服务器配置
     HOST = '0.0.0.0'  # 允许外部访问，如果只想本地访问可改为 '127.0.0.1'
@@ -0,0 +1,369 @@
+"""
+设备目录 - 预先编译的制造商/型号索引
+
+目录源文件（data/device_catalog.csv）用 build 命令编译为紧凑的二进制文件。
+运行时用mmap映射该文件，型号名称规范化后计算哈希，在开放寻址表中查找，
+耗时只与型号名称的长度有关，不随目录大小增长；进程之间共享同一份只读页面。
+
+每个型号还可以记录焦距范围和ISO范围，供完整性检查判断参数是否超出该型号的能力。
+
+构建:
+    python device_catalog.py build data/device_catalog.csv -o data/device_catalog.bin
+查询:
+    python device_catalog.py lookup Canon "EOS R5"
+"""
+
+import argparse
+import csv
+import mmap
+import os
+import struct
+import sys
+import threading
+import unicodedata
+import zlib
+from collections import namedtuple
+from functools import lru_cache
+from config import Config
+
+# ==================== 文件格式 ====================
+#
+# 文件头之后依次是：制造商表、制造商别名表、型号条目表、哈希桶、字符串区。
+# 字符串以UTF-8保存，表中记录 (文件内偏移, 字节长度)。
+# 哈希桶数量为2的幂，保存 条目下标+1（0 表示空桶），冲突时线性探测。
+
+MAGIC = b'DCAT'
+VERSION = 1
+
+# 魔数, 版本, 制造商数, 别名数, 条目数, 哈希桶数, 别名表偏移, 条目表偏移, 哈希桶偏移
+HEADER = struct.Struct('<4sHHIIIIII')
+# 制造商名称（偏移, 长度）
+MAKE = struct.Struct('<IH2x')
+# 别名键（偏移, 长度）, 制造商编号
+ALIAS = struct.Struct('<IHH')
+# 型号键（偏移, 长度）, 制造商编号, 型号名称（偏移, 长度）, 焦距范围, ISO范围（0 表示未知）
+ENTRY = struct.Struct('<IHHIH2xddII')
+BUCKET = struct.Struct('<I')
+
+CatalogEntry = namedtuple('CatalogEntry', ['make', 'model', 'focal_range', 'iso_range'])
+
+
+# 查找键只保留ASCII字母和数字
+KEY_CHARACTERS = frozenset('abcdefghijklmnopqrstuvwxyz0123456789')
+
+
+def normalize_key(text):
+    """
+    规范化的查找键：忽略大小写、空格、标点和重音
+
+    先做NFKD分解（全角字符转为ASCII，重音字母拆为字母和组合符号），之后只保留ASCII字母和数字，
+    其他文字中形似拉丁字母的字符一律去掉，不会与目录中的名称混淆。
+    """
+    text = unicodedata.normalize('NFKD', str(text)).casefold()
+    return ''.join(char for char in text if char in KEY_CHARACTERS)
+
+
+def model_key(make, model):
+    """型号的查找键（去掉型号中的制造商前缀，如 'Canon EOS R5' -> 'eosr5'）"""
+    key = normalize_key(model)
+    make_key = normalize_key(make)
+    if make_key and key.startswith(make_key) and len(key) > len(make_key):
+        key = key[len(make_key):]
+    return key
+
+
+def _key_hash(data):
+    # crc32在各进程和平台上结果相同（内置hash()每个进程随机）
+    return zlib.crc32(data)
+
+
+# ==================== 构建 ====================
+
+def _parse_number(text, convert):
+    return convert(text) if text else 0
+
+
+def load_source(path):
+    """
+    读取目录源文件
+
+    Returns:
+        tuple: (制造商 -> 别名列表, 型号行列表)
+               型号行为 (制造商, 型号, 别名列表, 焦距下限, 焦距上限, ISO下限, ISO上限)
+    """
+    makes = {}
+    models = []
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = csv.DictReader(line for line in f if line.strip() and not line.startswith('#'))
+        for row in rows:
+            make = row['make'].strip().lower()
+            model = row['model'].strip()
+            aliases = [alias.strip() for alias in (row['aliases'] or '').split('|') if alias.strip()]
+            makes.setdefault(make, [])
+            if not model:
+                makes[make].extend(aliases)
+                continue
+            models.append((make, model, aliases,
+                           _parse_number(row['focal_min'].strip(), float),
+                           _parse_number(row['focal_max'].strip(), float),
+                           _parse_number(row['iso_min'].strip(), int),
+                           _parse_number(row['iso_max'].strip(), int)))
+    return makes, models
+
+
+def build_catalog(makes, models, output_path):
+    """
+    编译目录文件
+
+    Args:
+        makes: 制造商 -> 别名列表
+        models: 型号行列表（见 load_source）
+        output_path: 输出文件路径
+
+    Returns:
+        int: 型号条目数（每个别名一条）
+    """
+    strings = {}
+    pool = bytearray()
+
+    def add_string(text):
+        data = text.encode('utf-8')
+        if data not in strings:
+            strings[data] = len(pool)
+            pool.extend(data)
+        return strings[data], len(data)
+
+    make_names = list(makes)
+    make_ids = {make: index for index, make in enumerate(make_names)}
+
+    aliases = {}
+    for make in make_names:
+        for alias in [make] + makes[make]:
+            aliases.setdefault(normalize_key(alias), make_ids[make])
+
+    entries = []
+    seen = set()
+    for make, model, model_aliases, focal_min, focal_max, iso_min, iso_max in models:
+        for name in [model] + model_aliases:
+            # 与查找时一致，去掉型号中的制造商前缀（如 'DJI Mini 2'）
+            key = model_key(make, name)
+            if (key, make) in seen:
+                continue
+            seen.add((key, make))
+            entries.append((key, make_ids[make], model, focal_min, focal_max, iso_min, iso_max))
+
+    bucket_count = 8
+    while bucket_count < len(entries) * 2:
+        bucket_count *= 2
+    buckets = [0] * bucket_count
+    for index, entry in enumerate(entries):
+        slot = _key_hash(entry[0].encode('utf-8')) & (bucket_count - 1)
+        while buckets[slot]:
+            slot = (slot + 1) & (bucket_count - 1)
+        buckets[slot] = index + 1
+
+    aliases_offset = HEADER.size + MAKE.size * len(make_names)
+    entries_offset = aliases_offset + ALIAS.size * len(aliases)
+    buckets_offset = entries_offset + ENTRY.size * len(entries)
+    strings_offset = buckets_offset + BUCKET.size * bucket_count
+
+    output = bytearray(HEADER.pack(MAGIC, VERSION, len(make_names), len(aliases), len(entries),
+                                   bucket_count, aliases_offset, entries_offset, buckets_offset))
+    for make in make_names:
+        offset, length = add_string(make)
+        output += MAKE.pack(strings_offset + offset, length)
+    for key, make_id in sorted(aliases.items()):
+        offset, length = add_string(key)
+        output += ALIAS.pack(strings_offset + offset, length, make_id)
+    for key, make_id, model, focal_min, focal_max, iso_min, iso_max in entries:
+        key_offset, key_length = add_string(key)
+        name_offset, name_length = add_string(model)
+        output += ENTRY.pack(strings_offset + key_offset, key_length, make_id,
+                             strings_offset + name_offset, name_length,
+                             focal_min, focal_max, iso_min, iso_max)
+    for value in buckets:
+        output += BUCKET.pack(value)
+    output += pool
+
+    temp_path = output_path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(output)
+    os.replace(temp_path, output_path)
+    return len(entries)
+
+
+# ==================== 查找 ====================
+
+class DeviceCatalog:
+    """
+    只读的设备目录（mmap映射）
+
+    制造商别名表很小，打开时读入字典；型号条目留在映射的文件中，查找时按需读取。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            (magic, version, make_count, alias_count, self.entry_count, self._bucket_count,
+             aliases_offset, self._entries_offset, self._buckets_offset) = HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f'不是有效的设备目录文件: {path}')
+
+            self.makes = tuple(self._string(*MAKE.unpack_from(self._map, HEADER.size + index * MAKE.size))
+                               for index in range(make_count))
+            self._aliases = {}
+            for index in range(alias_count):
+                offset, length, make_id = ALIAS.unpack_from(self._map, aliases_offset + index * ALIAS.size)
+                self._aliases[self._string(offset, length)] = self.makes[make_id]
+            self._make_keys = tuple(normalize_key(make) for make in self.makes)
+        except Exception:
+            self.close()
+            raise
+
+        # 同一组制造商/型号反复出现（同一台设备拍摄的大量照片），缓存解析结果
+        self.resolve = lru_cache(maxsize=4096)(self._resolve)
+
+    def close(self):
+        if getattr(self, '_map', None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def _string(self, offset, length):
+        return self._map[offset:offset + length].decode('utf-8')
+
+    def _find(self, key):
+        """在哈希表中查找型号键，返回所有制造商下的条目"""
+        data = key.encode('utf-8')
+        mask = self._bucket_count - 1
+        slot = _key_hash(data) & mask
+        found = []
+        while True:
+            index = BUCKET.unpack_from(self._map, self._buckets_offset + slot * BUCKET.size)[0]
+            if not index:
+                return found
+            (key_offset, key_length, make_id, name_offset, name_length,
+             focal_min, focal_max, iso_min, iso_max) = ENTRY.unpack_from(
+                self._map, self._entries_offset + (index - 1) * ENTRY.size)
+            if key_length == len(data) and self._map[key_offset:key_offset + key_length] == data:
+                found.append(CatalogEntry(self.makes[make_id], self._string(name_offset, name_length),
+                                          (focal_min, focal_max) if focal_max else None,
+                                          (iso_min, iso_max) if iso_max else None))
+            slot = (slot + 1) & mask
+
+    def manufacturer(self, make):
+        """
+        EXIF中的制造商名称 -> 目录中的规范名称（未收录时返回None）
+
+        先按别名精确查找，找不到时再看名称中是否包含某个制造商（如 'Canon Inc. Japan'）。
+        """
+        key = normalize_key(make)
+        manufacturer = self._aliases.get(key)
+        if manufacturer is None:
+            for name, make_key in zip(self.makes, self._make_keys):
+                if make_key in key:
+                    return name
+        return manufacturer
+
+    def lookup(self, model):
+        """
+        按型号查找条目
+
+        型号中带有制造商前缀（如 'Canon EOS R5'、'NIKON D850'）时去掉前缀再查找。
+
+        Returns:
+            list: CatalogEntry 列表（同一型号名称可能属于多个制造商）
+        """
+        key = normalize_key(model)
+        found = self._find(key)
+        if not found:
+            for make_key in self._make_keys:
+                if key.startswith(make_key) and len(key) > len(make_key):
+                    found = self._find(key[len(make_key):])
+                    if found:
+                        break
+        return found
+
+    def _resolve(self, make, model):
+        """
+        Returns:
+            tuple: (规范制造商名称或None, 该制造商下的条目或None, 收录该型号的其他制造商)
+        """
+        manufacturer = self.manufacturer(make)
+        entry = None
+        others = []
+        for item in self.lookup(model):
+            if item.make == manufacturer:
+                entry = entry or item
+            elif item.make not in others:
+                others.append(item.make)
+        return manufacturer, entry, tuple(others)
+
+
+_device_catalog = None
+_device_catalog_path = None
+_device_catalog_lock = threading.Lock()
+
+
+def get_device_catalog(config=Config):
+    """
+    获取进程内共享的设备目录（首次调用时映射文件），未配置或文件不存在时返回None
+
+    Args:
+        config: 配置类
+    """
+    global _device_catalog, _device_catalog_path
+    path = config.DEVICE_CATALOG_PATH
+    if not path:
+        return None
+    if _device_catalog_path != path:
+        with _device_catalog_lock:
+            if _device_catalog_path != path:
+                catalog = None
+                try:
+                    catalog = DeviceCatalog(path)
+                except (OSError, ValueError, struct.error) as e:
+                    print(f"无法加载设备目录 {path}: {e}")
+                _device_catalog = catalog
+                _device_catalog_path = path
+    return _device_catalog
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='编译或查询设备目录')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='把源文件编译为二进制目录')
+    build.add_argument('source', help='目录源文件（CSV）')
+    build.add_argument('-o', '--output', default=Config.DEVICE_CATALOG_PATH, help='输出文件')
+    lookup = commands.add_parser('lookup', help='查询制造商和型号')
+    lookup.add_argument('make', help='制造商')
+    lookup.add_argument('model', help='型号')
+    lookup.add_argument('-c', '--catalog', default=Config.DEVICE_CATALOG_PATH, help='目录文件')
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        makes, models = load_source(args.source)
+        count = build_catalog(makes, models, args.output)
+        print(f"已写入 {args.output}: {len(makes)} 个制造商, {len(models)} 个型号, {count} 个查找键, "
+              f"{os.path.getsize(args.output)} 字节")
+        return 0
+
+    catalog = DeviceCatalog(args.catalog)
+    try:
+        manufacturer, entry, others = catalog.resolve(args.make, args.model)
+        print(f"制造商: {manufacturer or '未收录'}")
+        print(f"型号: {entry.model if entry else '未收录'}")
+        if entry:
+            print(f"焦距范围: {entry.focal_range or '未知'}")
+            print(f"ISO范围: {entry.iso_range or '未知'}")
+        if others:
+            print(f"收录该型号的其他制造商: {', '.join(others)}")
+    finally:
+        catalog.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,45 +3,256 @@ EXIF完整性检测器 - 检测EXIF信息是否被修改
 """
 
 import re
-from datetime import datetime
-from PIL import Image
-from PIL.ExifTags import TAGS
-import exifread
-import io
+import threading
+import time
+from config import Config
+from device_catalog import get_device_catalog
+from exif_layout import describe_differences, get_layout_index
+from exif_time import (
+    MICROSECONDS, MIN_UTC_OFFSET, MAX_UTC_OFFSET, TIME_FIELD_GROUPS,
+    gps_timestamp, is_blank, parse_datetime, parse_offset, parse_subsec, time_difference
+)
+from field_plan import FIELD_IDS, FIELD_NAMES, SIGNAL_NAMES, PhotoRecord, build_record, compact_value
+from quant_tables import get_quant_index
+from signature_matcher import SignatureMatcher
+
+# 常见的EXIF编辑软件标识（列表越靠前优先级越高）
+EDITING_SOFTWARE_SIGNATURES = [
+    'Adobe Photoshop',
+    'GIMP',
+    'Paint.NET',
+    'Canva',
+    'Snapseed',
+    'VSCO',
+    'Lightroom',
+    'Photoshop Express',
+    'PicsArt',
+    'Fotor'
+]
+
+# 可疑的软件版本模式
+SUSPICIOUS_SOFTWARE_PATTERNS = [
+    r'Adobe Photoshop.*',
+    r'GIMP.*',
+    r'.*Editor.*',
+    r'.*Photo.*Editor.*'
+]
+
+# 没有设备目录时按名称识别的制造商（有设备目录时以目录为准）
+KNOWN_MANUFACTURERS = (
+    'canon', 'nikon', 'sony', 'apple', 'samsung', 'huawei', 'honor', 'xiaomi', 'oppo', 'vivo',
+    'oneplus', 'motorola', 'google', 'fujifilm', 'olympus', 'panasonic', 'leica', 'pentax',
+    'gopro', 'dji'
+)
+
+# 时间字段之间允许的差异（微秒）
+TIMESTAMP_TOLERANCE = 3600 * MICROSECONDS
+
+# 与GPS时间比较的拍摄时间字段（按优先级）
+GPS_REFERENCE_FIELDS = ('DateTimeOriginal', 'DateTimeDigitized')
+
+# 指标和警告的固定编号：名称 -> (编号, 文本模板, 参数中字段名的位置)
+# 紧凑输出只包含编号和参数，文本由客户端按模板生成；编号只能追加，不能修改或复用
+# 指标从1开始，警告从101开始；register_rule 追加的规则输出的普通文本编号为0
+MESSAGES = {
+    # 指标
+    'editing_software': (1, '检测到图像编辑软件: {0}', ()),
+    'suspicious_software': (2, '检测到可疑软件模式: {0}', ()),
+    'timestamp_mismatch': (3, '时间戳不一致: {0}和{1}相差{2:.1f}小时', (0, 1)),
+    'gps_time_mismatch': (4, '拍摄时间与GPS时间不一致: {0}与GPS时间相差{1:.1f}小时', (0,)),
+    'gps_time_out_of_range': (5, '拍摄时间与GPS时间不一致: {0}与GPS时间(UTC)相差{1:+.1f}小时，超出时区范围', (0,)),
+    'device_mismatch': (6, '制造商与型号可能不匹配: {0} - {1}', ()),
+    'iso_out_of_model_range': (7, 'ISO值超出{0}的范围({1}-{2}): {3}', ()),
+    'focal_out_of_model_range': (8, '焦距超出{0}的范围({1:g}-{2:g}mm): {3}mm', ()),
+    'quantization_editor': (9, '量化表与编辑软件的输出一致: {0}', ()),
+    'quantization_model_mismatch': (10, '量化表与{0}的原图不符，可能经过重新压缩', ()),
+    'quantization_other_device': (11, '量化表来自其他设备: {0}', ()),
+    # 参数为差异列表 [[项目, 实际值, 应有值], ...]
+    'exif_layout_mismatch': (12, 'EXIF结构与{0}设备的原始布局不符: {1}', ()),
+    'thumbnail_mismatch': (13, '嵌入的缩略图与主图不一致（差异{0:.1%}）', ()),
+    # 参数为缺失字段的列表
+    'missing_critical_fields': (14, '缺失关键EXIF字段: {0}', (0,)),
+    'abnormal_iso': (15, '异常ISO值: {0}', ()),
+    'abnormal_focal_length': (16, '异常焦距值: {0}mm', ()),
+
+    # 警告
+    'unparsable_time': (101, '无法解析时间字段 {0}: {1}', (0,)),
+    'invalid_offset': (102, '无法解析时区字段 {0}: {1}', (0,)),
+    'unparsable_gps_date': (103, '无法解析GPS日期 GPSDate: {0}', ()),
+    'unknown_manufacturer': (104, '未知制造商: {0}', ()),
+    'check_failed': (105, '检测过程中出错: {0}', ()),
+    'integrity_check_failed': (106, '完整性检查失败: {0}', ()),
+}
+
+
+class Finding(str):
+    """
+    规则输出的指标或警告
+
+    本身是按模板生成的文本，与之前的输出相同；同时保留名称和原始参数，用于生成紧凑输出。
+    参数是列表等无法直接套用模板的值时，由调用方给出 text。
+    """
+
+    __slots__ = ('name', 'params')
+
+    def __new__(cls, name, *params, text=None):
+        if text is None:
+            text = MESSAGES[name][1].format(*params)
+        self = super().__new__(cls, text)
+        self.name = name
+        self.params = params
+        return self
+
+    def __reduce__(self):
+        # 结果会被缓存和传给其他进程，序列化时保留名称和参数
+        return _restore_finding, (self.name, self.params, str(self))
+
+    def compact(self):
+        """[编号, 参数...]，字段名替换为 field_plan.FIELD_IDS 中的编号"""
+        code, _, field_params = MESSAGES[self.name]
+        params = [compact_value(param) for param in self.params]
+        for index in field_params:
+            param = self.params[index]
+            params[index] = [FIELD_IDS[field] for field in param] if isinstance(param, list) \
+                else FIELD_IDS[param]
+        return [code] + params
+
+
+def _restore_finding(name, params, text):
+    return Finding(name, *params, text=text)
+
+
+def compact_message(message):
+    """指标或警告 -> [编号, 参数...]；不在 MESSAGES 中的普通文本为 [0, 文本]"""
+    if isinstance(message, Finding):
+        return message.compact()
+    return [0, str(message)]
+
+
+# 规则的开销等级：数值越小越先执行
+COST_TRIVIAL = 0    # 只判断字段是否存在或比较数值
+COST_CHEAP = 1      # 字符串匹配
+COST_EXPENSIVE = 2  # 需要解析字段内容（如时间）
+
+
+def integrity_rule(name, cost, fields):
+    """
+    把检测器的方法注册为完整性规则
+
+    Args:
+        name: 规则名称（用于统计）
+        cost: 开销等级，开销小的规则先执行
+        fields: 规则读取的记录字段（field_plan.FIELD_NAMES 或 SIGNAL_NAMES 中的名称）
+    """
+    def decorator(method):
+        method.rule_info = (name, cost, tuple(fields))
+        return method
+    return decorator
+
+
+class IntegrityRule:
+    """已注册的完整性规则及其执行统计"""
+
+    __slots__ = ('name', 'check', 'cost', 'fields', 'order', 'calls', 'skipped', 'total_time')
+
+    def __init__(self, name, check, cost, fields, order):
+        unknown = [field for field in fields if field not in FIELD_NAMES and field not in SIGNAL_NAMES]
+        if unknown:
+            raise ValueError(f'规则 {name} 使用了未知字段: {", ".join(unknown)}')
+        self.name = name
+        self.check = check      # check(record, result)
+        self.cost = cost
+        self.fields = tuple(fields)
+        self.order = order      # 注册顺序，决定输出中指标的顺序
+        self.calls = 0          # 执行次数
+        self.skipped = 0        # 因达到置信度上限而跳过的次数
+        self.total_time = 0.0   # 累计耗时（秒）
+
 
 class ExifIntegrityChecker:
-    """EXIF完整性检测器"""
+    """
+    EXIF完整性检测器
+
+    签名和模式在构造时编译，之后不再修改，同一个实例可以在多个线程之间共享。
+
+    检测规则是带有 @integrity_rule 的方法（按定义顺序注册），也可以用 register_rule 追加。
+    执行时按开销从小到大运行，置信度达到上限后跳过剩余规则；
+    输出中的指标和警告始终按注册顺序排列。
+    """
     
-    def __init__(self):
-        # 常见的EXIF编辑软件标识
-        self.editing_software_signatures = [
-            'Adobe Photoshop',
-            'GIMP',
-            'Paint.NET',
-            'Canva',
-            'Snapseed',
-            'VSCO',
-            'Lightroom',
-            'Photoshop Express',
-            'PicsArt',
-            'Fotor'
-        ]
-        
-        # 可疑的软件版本模式
-        self.suspicious_software_patterns = [
-            r'Adobe Photoshop.*',
-            r'GIMP.*',
-            r'.*Editor.*',
-            r'.*Photo.*Editor.*'
-        ]
+    def __init__(self, editing_software_signatures=None, suspicious_software_patterns=None,
+                 confidence_ceiling=Config.INTEGRITY_CONFIDENCE_CEILING, device_catalog=None,
+                 quant_index=None, layout_index=None,
+                 thumbnail_threshold=Config.THUMBNAIL_DIFFERENCE_THRESHOLD):
+        self.editing_software_signatures = list(editing_software_signatures or EDITING_SOFTWARE_SIGNATURES)
+        self.suspicious_software_patterns = list(suspicious_software_patterns or SUSPICIOUS_SOFTWARE_PATTERNS)
+        self.known_manufacturers = KNOWN_MANUFACTURERS
+        # 设备目录（device_catalog.DeviceCatalog），None 时使用配置中的目录
+        self.device_catalog = device_catalog if device_catalog is not None else get_device_catalog()
+        # 量化表指纹索引（quant_tables.QuantIndex），None 时使用配置中的索引
+        self.quant_index = quant_index if quant_index is not None else get_quant_index()
+        # EXIF结构布局索引（exif_layout.LayoutIndex），None 时使用配置中的索引
+        self.layout_index = layout_index if layout_index is not None else get_layout_index()
+        # 缩略图与主图的平均灰度差异超过该值时认为不一致
+        self.thumbnail_threshold = thumbnail_threshold
+
+        # 所有编辑软件签名编译进一个自动机，扫描一遍即可找到最靠前的命中签名
+        self._signature_matcher = SignatureMatcher(self.editing_software_signatures)
+        # 可疑模式只需要判断是否有任意一个命中，合并为一个正则
+        self._suspicious_regex = re.compile(
+            '|'.join(f'(?:{pattern})' for pattern in self.suspicious_software_patterns),
+            re.IGNORECASE) if self.suspicious_software_patterns else None
+
+        # 置信度达到该值后不再执行剩余规则（None 表示总是执行全部规则）
+        self.confidence_ceiling = confidence_ceiling
+
+        self.rules = []
+        self._execution_order = ()
+        self._stats_lock = threading.Lock()
+        # 按定义顺序收集规则方法（子类覆盖的方法保留父类中的位置）
+        rule_methods = {}
+        for klass in reversed(type(self).__mro__):
+            for attribute, method in vars(klass).items():
+                if hasattr(method, 'rule_info'):
+                    rule_methods[attribute] = method.rule_info
+        for attribute, (name, cost, fields) in rule_methods.items():
+            self.register_rule(name, getattr(self, attribute), cost, fields)
+
+    def register_rule(self, name, check, cost=COST_CHEAP, fields=()):
+        """
+        注册一条完整性规则
+
+        Args:
+            name: 规则名称
+            check: 检测函数 check(record, result)，向 result 的 indicators/warnings/details 写入结果
+            cost: 开销等级
+            fields: 规则读取的记录字段
+        """
+        rule = IntegrityRule(name, check, cost, fields, len(self.rules))
+        self.rules.append(rule)
+        self._execution_order = tuple(sorted(self.rules, key=lambda item: (item.cost, item.order)))
+        return rule
+
+    def rule_stats(self):
+        """各规则的执行次数、跳过次数和累计耗时"""
+        with self._stats_lock:
+            return {rule.name: {
+                'cost': rule.cost,
+                'fields': list(rule.fields),
+                'calls': rule.calls,
+                'skipped': rule.skipped,
+                'total_time': rule.total_time,
+            } for rule in self.rules}
     
-    def check_integrity(self, pil_data, exifread_data):
+    def check_integrity(self, pil_data, exifread_data=None, compact=False):
         """
         检查EXIF数据的完整性
 
         Args:
-            pil_data: 已解析的PIL EXIF数据
-            exifread_data: 已解析的exifread EXIF数据
+            pil_data: 字段记录（field_plan.PhotoRecord），
+                      或已解析的EXIF标签映射（exif_parser.ExifTags 或PIL风格字典）
+            exifread_data: 已解析的exifread EXIF数据（可选，兼容旧调用方）
+            compact: 为True时返回紧凑结果：指标和警告为 [编号, 参数...]（见 MESSAGES），不含 details
 
         Returns:
             dict: 完整性检查结果
@@ -55,237 +266,340 @@ class ExifIntegrityChecker:
         }
         
         try:
-            # 验证输入数据
-            if pil_data is None:
-                pil_data = {}
-            if exifread_data is None:
-                exifread_data = {}
+            # 每个字段只解析一次，各项检测都读取同一条记录
+            if isinstance(pil_data, PhotoRecord):
+                record = pil_data
+            else:
+                record = build_record(pil_data, exifread_data)
             
-            # 执行各种检测
-            self._check_software_signatures(pil_data, exifread_data, result)
-            self._check_timestamp_consistency(pil_data, exifread_data, result)
-            self._check_device_consistency(pil_data, exifread_data, result)
-            self._check_missing_critical_fields(pil_data, exifread_data, result)
-            self._check_suspicious_values(pil_data, exifread_data, result)
+            # 执行各项检测规则
+            self._run_rules(record, result)
             
             # 计算总体置信度
             self._calculate_confidence(result)
             
         except Exception as e:
-            result['warnings'].append(f'检测过程中出错: {str(e)}')
-        
+            result['warnings'].append(Finding('check_failed', str(e)))
+
+        if compact:
+            return compact_integrity(result)
         return result
+
+    def _run_rules(self, record, result):
+        """按开销从小到大执行规则，达到置信度上限时提前结束，结果按注册顺序合并"""
+        ceiling = self.confidence_ceiling
+        outputs = [None] * len(self.rules)
+        timings = []
+        indicator_count = warning_count = 0
+        stopped_early = False
+
+        try:
+            for rule in self._execution_order:
+                if ceiling is not None and _confidence(indicator_count, warning_count) >= ceiling:
+                    stopped_early = True
+                    break
+                output = {'indicators': [], 'warnings': [], 'details': result['details']}
+                outputs[rule.order] = output
+                start = time.perf_counter()
+                try:
+                    rule.check(record, output)
+                finally:
+                    timings.append((rule, time.perf_counter() - start))
+                indicator_count += len(output['indicators'])
+                warning_count += len(output['warnings'])
+        finally:
+            skipped = []
+            for rule in self.rules:
+                output = outputs[rule.order]
+                if output is None:
+                    skipped.append(rule)
+                    continue
+                result['indicators'].extend(output['indicators'])
+                result['warnings'].extend(output['warnings'])
+            if stopped_early:
+                result['details']['skipped_rules'] = [rule.name for rule in skipped]
+            else:
+                skipped = []
+
+            with self._stats_lock:
+                for rule, elapsed in timings:
+                    rule.calls += 1
+                    rule.total_time += elapsed
+                for rule in skipped:
+                    rule.skipped += 1
     
 
     
-    def _check_software_signatures(self, pil_data, exifread_data, result):
+    @integrity_rule('software_signatures', COST_CHEAP, ('Software', 'ProcessingSoftware', 'HostComputer'))
+    def _check_software_signatures(self, record, result):
         """检查软件签名"""
-        software_fields = ['Software', 'ProcessingSoftware', 'HostComputer']
-        
-        for field in software_fields:
-            value = None
-            if field in pil_data:
-                value = str(pil_data[field])
-            elif f'Image {field}' in exifread_data:
-                value = str(exifread_data[f'Image {field}'])
-            elif f'EXIF {field}' in exifread_data:
-                value = str(exifread_data[f'EXIF {field}'])
+        for value in (record.Software, record.ProcessingSoftware, record.HostComputer):
+            if value is None:
+                continue
+            value = str(value)
             
             if value:
                 # 检查是否包含编辑软件标识
-                for signature in self.editing_software_signatures:
-                    if signature.lower() in value.lower():
-                        result['indicators'].append(f'检测到图像编辑软件: {signature}')
-                        result['details']['editing_software'] = value
-                        break
+                signature = self._signature_matcher.first_match(value)
+                if signature is not None:
+                    result['indicators'].append(Finding('editing_software', signature))
+                    result['details']['editing_software'] = value
                 
                 # 检查可疑模式
-                for pattern in self.suspicious_software_patterns:
-                    if re.search(pattern, value, re.IGNORECASE):
-                        result['indicators'].append(f'检测到可疑软件模式: {value}')
-                        break
+                if self._suspicious_regex is not None and self._suspicious_regex.search(value):
+                    result['indicators'].append(Finding('suspicious_software', value))
     
-    def _check_timestamp_consistency(self, pil_data, exifread_data, result):
-        """检查时间戳一致性"""
+    @integrity_rule('timestamp_consistency', COST_EXPENSIVE,
+                    sum(TIME_FIELD_GROUPS, ()) + ('GPSDate', 'GPSTimeStamp'))
+    def _check_timestamp_consistency(self, record, result):
+        """检查时间戳一致性（含小数秒；两个时间都有时区时按UTC比较），以及拍摄时间与GPS时间是否一致"""
         time_fields = {
-            'DateTime': None,
-            'DateTimeOriginal': None,
-            'DateTimeDigitized': None
+            'DateTime': record.DateTime,
+            'DateTimeOriginal': record.DateTimeOriginal,
+            'DateTimeDigitized': record.DateTimeDigitized
         }
         
-        # 提取时间字段
-        for field in time_fields.keys():
-            if field in pil_data:
-                time_fields[field] = pil_data[field]
-            elif f'EXIF {field}' in exifread_data:
-                time_fields[field] = str(exifread_data[f'EXIF {field}'])
-            elif f'Image {field}' in exifread_data:
-                time_fields[field] = str(exifread_data[f'Image {field}'])
-        
-        # 检查时间一致性
-        valid_times = []
-        for field, value in time_fields.items():
-            if value:
-                try:
-                    # 尝试解析时间
-                    parsed_time = datetime.strptime(value, '%Y:%m:%d %H:%M:%S')
-                    valid_times.append((field, parsed_time))
-                except:
-                    result['warnings'].append(f'无法解析时间字段 {field}: {value}')
+        # 解析为 (本地时间的微秒数, 时区秒数或None)
+        valid_times = {}
+        for field, subsec_field, offset_field in TIME_FIELD_GROUPS:
+            value = time_fields[field]
+            if not value:
+                continue
+            seconds = parse_datetime(value)
+            if seconds is None:
+                result['warnings'].append(Finding('unparsable_time', field, value))
+                continue
+            offset_text = getattr(record, offset_field)
+            offset = parse_offset(offset_text)
+            if offset is None and not is_blank(offset_text):
+                result['warnings'].append(Finding('invalid_offset', offset_field, offset_text))
+            valid_times[field] = (seconds * MICROSECONDS + parse_subsec(getattr(record, subsec_field)), offset)
         
-        # 检查时间差异
-        if len(valid_times) >= 2:
-            for i in range(len(valid_times)):
-                for j in range(i + 1, len(valid_times)):
-                    field1, time1 = valid_times[i]
-                    field2, time2 = valid_times[j]
-                    diff = abs((time1 - time2).total_seconds())
-                    
-                    # 如果时间差异超过1小时，可能被修改
-                    if diff > 3600:
-                        result['indicators'].append(f'时间戳不一致: {field1}和{field2}相差{diff/3600:.1f}小时')
+        # 检查时间差异，超过1小时可能被修改
+        fields = list(valid_times)
+        for i in range(len(fields)):
+            for j in range(i + 1, len(fields)):
+                diff = time_difference(valid_times[fields[i]], valid_times[fields[j]])
+                if diff > TIMESTAMP_TOLERANCE:
+                    result['indicators'].append(
+                        Finding('timestamp_mismatch', fields[i], fields[j], diff / 3600 / MICROSECONDS))
+
+        # GPS时间为UTC：拍摄时间有时区时直接比较，没有时区时两者之差应在时区范围内
+        gps_time = gps_timestamp(record.GPSDate, record.GPSTimeStamp)
+        if gps_time is None and not is_blank(record.GPSDate) and record.GPSTimeStamp is not None:
+            result['warnings'].append(Finding('unparsable_gps_date', record.GPSDate))
+        reference = next((field for field in GPS_REFERENCE_FIELDS if field in valid_times), None)
+        if gps_time is not None and reference is not None:
+            local_time, offset = valid_times[reference]
+            if offset is not None:
+                diff = abs(local_time - offset * MICROSECONDS - gps_time)
+                if diff > TIMESTAMP_TOLERANCE:
+                    result['indicators'].append(
+                        Finding('gps_time_mismatch', reference, diff / 3600 / MICROSECONDS))
+            else:
+                implied = local_time - gps_time
+                if not (MIN_UTC_OFFSET * MICROSECONDS - TIMESTAMP_TOLERANCE <= implied
+                        <= MAX_UTC_OFFSET * MICROSECONDS + TIMESTAMP_TOLERANCE):
+                    result['indicators'].append(
+                        Finding('gps_time_out_of_range', reference, implied / 3600 / MICROSECONDS))
         
         result['details']['timestamps'] = time_fields
     
-    def _check_device_consistency(self, pil_data, exifread_data, result):
+    @integrity_rule('device_consistency', COST_CHEAP, ('Make', 'Model'))
+    def _check_device_consistency(self, record, result):
         """检查设备信息一致性"""
-        make = None
-        model = None
-        
-        # 提取制造商和型号
-        if 'Make' in pil_data:
-            make = pil_data['Make']
-        elif 'Image Make' in exifread_data:
-            make = str(exifread_data['Image Make'])
-        
-        if 'Model' in pil_data:
-            model = pil_data['Model']
-        elif 'Image Model' in exifread_data:
-            model = str(exifread_data['Image Model'])
+        make = record.Make
+        model = record.Model
+        device_info = {'make': make, 'model': model}
         
         # 检查制造商和型号的一致性
         if make and model:
-            make_lower = make.lower()
-            model_lower = model.lower()
-
-            # 定义制造商和其对应的型号特征
-            manufacturer_patterns = {
-                'canon': ['canon', 'eos', 'powershot', 'rebel'],
-                'nikon': ['nikon', 'd', 'coolpix', 'z'],
-                'sony': ['sony', 'alpha', 'a7', 'rx', 'fx'],
-                'apple': ['iphone', 'ipad'],
-                'samsung': ['samsung', 'galaxy', 'sm-'],
-                'huawei': ['huawei', 'mate', 'p', 'nova', 'honor'],
-                'xiaomi': ['xiaomi', 'mi', 'redmi', 'poco'],
-                'fujifilm': ['fujifilm', 'x-', 'gfx'],
-                'olympus': ['olympus', 'om-', 'e-m', 'pen'],
-                'panasonic': ['panasonic', 'lumix', 'gh', 'gx'],
-                'leica': ['leica', 'q', 'm', 's'],
-                'pentax': ['pentax', 'k-', 'ricoh']
-            }
-
-            # 检查是否是已知制造商
-            detected_manufacturer = None
-            for manufacturer, patterns in manufacturer_patterns.items():
-                if manufacturer in make_lower:
-                    detected_manufacturer = manufacturer
-                    break
+            detected_manufacturer, entry, other_makes = self._resolve_device(make, model)
 
             if not detected_manufacturer:
-                result['warnings'].append(f'未知制造商: {make}')
-            else:
-                # 检查型号是否与制造商匹配
-                patterns = manufacturer_patterns[detected_manufacturer]
-                model_matches = any(pattern in model_lower for pattern in patterns)
-
-                if not model_matches:
-                    result['indicators'].append(f'制造商与型号可能不匹配: {make} - {model}')
+                result['warnings'].append(Finding('unknown_manufacturer', make))
+            elif entry is not None:
+                device_info['catalog_model'] = entry.model
+            elif other_makes:
+                # 目录中该型号属于其他制造商
+                result['indicators'].append(Finding('device_mismatch', make, model))
+            elif self.device_catalog is not None:
+                # 目录中没有收录该型号：无法判断是否匹配，只在详情中注明，不影响置信度
+                device_info['catalog_model'] = None
         
-        result['details']['device_info'] = {'make': make, 'model': model}
+        result['details']['device_info'] = device_info
+
+    @integrity_rule('device_expectations', COST_CHEAP, ('Make', 'Model', 'ISOSpeedRatings', 'FocalLength'))
+    def _check_device_expectations(self, record, result):
+        """检查拍摄参数是否超出该型号的范围（设备目录中记录的焦距和ISO范围）"""
+        make = record.Make
+        model = record.Model
+        if not (make and model):
+            return
+        entry = self._resolve_device(make, model)[1]
+        if entry is None:
+            return
+
+        iso_value = record.ISOSpeedRatings
+        if iso_value and entry.iso_range:
+            low, high = entry.iso_range
+            if iso_value < low or iso_value > high:
+                result['indicators'].append(Finding('iso_out_of_model_range', entry.model, low, high, iso_value))
+
+        focal_length = record.FocalLength
+        if focal_length and entry.focal_range:
+            low, high = entry.focal_range
+            if focal_length < low or focal_length > high:
+                result['indicators'].append(Finding('focal_out_of_model_range', entry.model, low, high, focal_length))
+
+    @integrity_rule('quantization_tables', COST_CHEAP, ('quantization', 'Make', 'Model'))
+    def _check_quantization_tables(self, record, result):
+        """检查JPEG量化表是否来自编辑软件，或与声称的拍摄设备不符"""
+        fingerprint = record.quantization
+        if fingerprint is None:
+            return
+        entry = self.quant_index.lookup(fingerprint)
+        result['details']['quantization'] = {'fingerprint': fingerprint,
+                                             'source': entry.label if entry else None}
+
+        if entry is not None and entry.kind == 'editor':
+            result['indicators'].append(Finding('quantization_editor', entry.label))
+            return
+
+        make = record.Make
+        model = record.Model
+        if not (make and model):
+            return
+        manufacturer = self._resolve_device(make, model)[0]
+        expected = self.quant_index.model_fingerprints(manufacturer, model) if manufacturer else ()
+        if expected and fingerprint not in expected:
+            result['indicators'].append(Finding('quantization_model_mismatch', model))
+        elif entry is not None and entry.kind == 'camera' and entry.make != manufacturer:
+            result['indicators'].append(Finding('quantization_other_device', entry.label))
+
+    @integrity_rule('exif_layout', COST_CHEAP, ('exif_layout', 'Make', 'Model'))
+    def _check_exif_layout(self, record, result):
+        """检查EXIF块的结构布局是否与声称的设备写出的布局一致"""
+        layout = record.exif_layout
+        if layout is None:
+            return
+        result['details']['exif_layout'] = layout.fingerprint
+
+        make = record.Make
+        model = record.Model
+        if not (make and model):
+            return
+        manufacturer = self._resolve_device(make, model)[0]
+        if not manufacturer:
+            return
+        differences = self.layout_index.compare(layout, manufacturer, model)
+        if differences:
+            result['indicators'].append(Finding(
+                'exif_layout_mismatch', make, differences,
+                text=f'EXIF结构与{make}设备的原始布局不符: {describe_differences(differences)}'))
+
+    @integrity_rule('thumbnail_consistency', COST_TRIVIAL, ('thumbnail',))
+    def _check_thumbnail_consistency(self, record, result):
+        """检查嵌入的缩略图与主图是否一致（比较在读取信号时完成）"""
+        comparison = record.thumbnail
+        if comparison is None:
+            return
+        result['details']['thumbnail'] = {
+            'difference': comparison.difference,
+            'thumbnail_size': list(comparison.thumbnail_size),
+        }
+        if comparison.difference > self.thumbnail_threshold:
+            result['indicators'].append(Finding('thumbnail_mismatch', comparison.difference))
+
+    def _resolve_device(self, make, model):
+        """
+        确定制造商并在设备目录中查找型号
+
+        Returns:
+            tuple: (制造商或None, 该制造商下的目录条目或None, 目录中收录该型号的其他制造商)
+        """
+        if self.device_catalog is not None:
+            return self.device_catalog.resolve(make, model)
+
+        # 没有设备目录时只按名称判断制造商
+        make_lower = make.lower()
+        for manufacturer in self.known_manufacturers:
+            if manufacturer in make_lower:
+                return manufacturer, None, ()
+        return None, None, ()
     
-    def _check_missing_critical_fields(self, pil_data, exifread_data, result):
+    @integrity_rule('missing_critical_fields', COST_TRIVIAL, ('Make', 'Model', 'DateTime'))
+    def _check_missing_critical_fields(self, record, result):
         """检查关键字段缺失"""
-        critical_fields = ['Make', 'Model', 'DateTime']
-        missing_fields = []
-        
-        for field in critical_fields:
-            found = False
-            if field in pil_data:
-                found = True
-            elif f'Image {field}' in exifread_data:
-                found = True
-            elif f'EXIF {field}' in exifread_data:
-                found = True
-            
-            if not found:
-                missing_fields.append(field)
+        missing_fields = [field for field, value in (('Make', record.Make),
+                                                     ('Model', record.Model),
+                                                     ('DateTime', record.DateTime))
+                          if value is None]
         
         if missing_fields:
-            result['indicators'].append(f'缺失关键EXIF字段: {", ".join(missing_fields)}')
+            result['indicators'].append(Finding('missing_critical_fields', missing_fields,
+                                                 text=f'缺失关键EXIF字段: {", ".join(missing_fields)}'))
             result['details']['missing_fields'] = missing_fields
     
-    def _check_suspicious_values(self, pil_data, exifread_data, result):
+    @integrity_rule('suspicious_values', COST_TRIVIAL, ('ISOSpeedRatings', 'FocalLength'))
+    def _check_suspicious_values(self, record, result):
         """检查可疑值"""
-        # 检查异常的ISO值
-        iso_value = None
-        if 'ISOSpeedRatings' in pil_data:
-            iso_value = pil_data['ISOSpeedRatings']
-        elif 'EXIF ISOSpeedRatings' in exifread_data:
-            try:
-                iso_value = int(str(exifread_data['EXIF ISOSpeedRatings']))
-            except:
-                pass
+        # 检查异常的ISO值（记录中已规范化为int，无法比较时为None）
+        iso_value = record.ISOSpeedRatings
         
         if iso_value:
             if iso_value > 102400 or iso_value < 25:
-                result['indicators'].append(f'异常ISO值: {iso_value}')
+                result['indicators'].append(Finding('abnormal_iso', iso_value))
         
-        # 检查异常的焦距
-        focal_length = None
-        if 'FocalLength' in pil_data:
-            focal_length = pil_data['FocalLength']
-        elif 'EXIF FocalLength' in exifread_data:
-            try:
-                focal_str = str(exifread_data['EXIF FocalLength'])
-                if '/' in focal_str:
-                    parts = focal_str.split('/')
-                    focal_length = float(parts[0]) / float(parts[1])
-                else:
-                    focal_length = float(focal_str)
-            except:
-                pass
+        # 检查异常的焦距（记录中已规范化为float）
+        focal_length = record.FocalLength
         
         if focal_length:
             if focal_length > 1000 or focal_length < 1:
-                result['indicators'].append(f'异常焦距值: {focal_length}mm')
+                result['indicators'].append(Finding('abnormal_focal_length', focal_length))
     
     def _calculate_confidence(self, result):
         """计算修改置信度"""
-        indicator_count = len(result['indicators'])
-        warning_count = len(result['warnings'])
-        
-        # 基础置信度计算
-        confidence = 0.0
-        
-        # 每个指标增加置信度
-        confidence += indicator_count * 0.3
-        
-        # 警告也会增加一些置信度
-        confidence += warning_count * 0.1
-        
-        # 限制在0-1范围内
-        confidence = min(confidence, 1.0)
+        confidence = _confidence(len(result['indicators']), len(result['warnings']))
         
         result['confidence'] = confidence
         result['is_modified'] = confidence > 0.3  # 30%以上置信度认为可能被修改
 
-def check_exif_integrity(pil_data, exifread_data):
+def _confidence(indicator_count, warning_count):
+    """按指标和警告数量计算修改置信度"""
+    # 基础置信度计算
+    confidence = 0.0
+    
+    # 每个指标增加置信度
+    confidence += indicator_count * 0.3
+    
+    # 警告也会增加一些置信度
+    confidence += warning_count * 0.1
+    
+    # 限制在0-1范围内
+    return min(confidence, 1.0)
+
+def compact_integrity(result):
+    """完整性检查结果 -> 紧凑结果（指标和警告只保留编号和参数，去掉 details）"""
+    return {
+        'is_modified': result['is_modified'],
+        'confidence': result['confidence'],
+        'indicators': [compact_message(message) for message in result['indicators']],
+        'warnings': [compact_message(message) for message in result['warnings']],
+    }
+
+# 共享的检测器实例（只读，线程安全）
+_shared_checker = ExifIntegrityChecker()
+
+def check_exif_integrity(pil_data, exifread_data=None, compact=False):
     """
     检查EXIF完整性
 
     Args:
-        pil_data: 已解析的PIL EXIF数据
-        exifread_data: 已解析的exifread EXIF数据
+        pil_data: 字段记录（field_plan.PhotoRecord），
+                  或已解析的EXIF标签映射（exif_parser.ExifTags 或PIL风格字典）
+        exifread_data: 已解析的exifread EXIF数据（可选，兼容旧调用方）
+        compact: 为True时返回紧凑结果（见 ExifIntegrityChecker.check_integrity）
 
     Returns:
         dict: 检查结果
@@ -295,8 +609,11 @@ def check_exif_integrity(pil_data, exifread_data):
         EXIF数据解析应该在调用方（如photo_analyzer.py）中完成，
         然后将解析结果传递给这个函数，避免重复解析。
     """
-    checker = ExifIntegrityChecker()
-    return checker.check_integrity(pil_data=pil_data, exifread_data=exifread_data)
+    return _shared_checker.check_integrity(pil_data=pil_data, exifread_data=exifread_data, compact=compact)
+
+def integrity_rule_stats():
+    """共享检测器中各规则的执行统计"""
+    return _shared_checker.rule_stats()
 
 def check_exif_integrity_from_file(file_path):
     """
@@ -310,15 +627,22 @@ def check_exif_integrity_from_file(file_path):
 
     Note:
         这个函数会进行EXIF解析，如果你已经有解析好的数据，
-        建议直接使用 check_exif_integrity(pil_data, exifread_data)
+        建议直接使用 check_exif_integrity(exif_tags)。
+        启用结果存储时，未变化的文件直接返回上次的结果。
     """
-    # 导入解析函数（避免循环导入）
-    from photo_analyzer import extract_exif_with_pil, extract_exif_with_exifread
+    from result_store import cached_file_result
+
+    return cached_file_result(file_path, 'integrity', _check_file)
 
-    pil_data = extract_exif_with_pil(file_path)
-    exifread_data = extract_exif_with_exifread(file_path)
+def _check_file(file_path):
+    """映射文件，解析EXIF和头部信号后检查"""
+    from exif_parser import parse_exif
+    from field_plan import read_signals
+    from stream_ingest import open_shared_buffer
 
-    return check_exif_integrity(pil_data=pil_data, exifread_data=exifread_data)
+    with open_shared_buffer(file_path) as buffer:
+        exif_tags = parse_exif(buffer)
+        return check_exif_integrity(read_signals(build_record(exif_tags), buffer, exif_tags.thumbnail))
 
 if __name__ == "__main__":
     # 测试代码
@@ -0,0 +1,155 @@
+"""
+EXIF结构布局索引 - 各制造商/型号原图的IFD布局
+
+相机固件写出的EXIF块结构固定：字节序、IFD的排列顺序、标签顺序、数据之间有无空隙。
+piexif、exiftool和各种编辑软件重写EXIF后，这些结构特征通常随之改变。
+解析器遍历IFD时已经记录了布局（exif_parser.ExifLayout），这里只负责和预期的布局比较。
+
+采集:
+    python exif_layout.py learn --make apple --model "iPhone 13 Pro" 原图.jpg ...
+查看:
+    python exif_layout.py show 照片.jpg
+"""
+
+import argparse
+import csv
+import os
+import sys
+from config import Config
+from exif_parser import ExifLayout
+from device_catalog import model_key
+
+LAYOUT_FIELDS = ExifLayout._fields
+INDEX_FIELDS = ('make', 'model') + LAYOUT_FIELDS
+
+# 布局各部分的中文名称
+LAYOUT_NAMES = {
+    'byte_order': '字节序',
+    'first_ifd': 'IFD0偏移',
+    'ifd_order': 'IFD顺序',
+    'placement': '数据排列',
+    'alignment': '数据对齐',
+    'unsorted': '乱序的IFD',
+}
+
+# 索引文件中表示空值的写法（空单元格表示不限制）
+EMPTY_VALUE = '-'
+
+
+def load_layout_rows(path):
+    """读取布局索引文件中的条目（跳过 # 开头的注释行）"""
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, newline='', encoding='utf-8') as f:
+        return [row for row in csv.DictReader(line for line in f if line.strip() and not line.startswith('#'))]
+
+
+class LayoutIndex:
+    """制造商/型号 -> 预期的布局"""
+
+    def __init__(self, rows=()):
+        self.makes = {}     # 制造商 -> 适用于所有型号的布局列表
+        self.models = {}    # (制造商, 型号键) -> 布局列表
+        for row in rows:
+            # 每个布局保存为 {字段: 预期值}，只包含有限制的字段
+            pattern = {}
+            for field in LAYOUT_FIELDS:
+                value = (row.get(field) or '').strip()
+                if value:
+                    pattern[field] = '' if value == EMPTY_VALUE else value
+            make = row['make'].strip().lower()
+            model = (row.get('model') or '').strip()
+            if model:
+                self.models.setdefault((make, model_key(make, model)), []).append(pattern)
+            else:
+                self.makes.setdefault(make, []).append(pattern)
+
+    def expected(self, make, model):
+        """预期的布局列表（型号有记录时只用型号的记录）"""
+        return self.models.get((make, model_key(make, model))) or self.makes.get(make, [])
+
+    def compare(self, layout, make, model):
+        """
+        与预期的布局比较
+
+        Returns:
+            list: 不一致的部分 [(字段, 实际值, 预期值)]；没有预期布局或与任意一条一致时为空
+        """
+        best = None
+        for pattern in self.expected(make, model):
+            differences = [(field, str(getattr(layout, field)), value)
+                           for field, value in pattern.items() if str(getattr(layout, field)) != value]
+            if not differences:
+                return []
+            if best is None or len(differences) < len(best):
+                best = differences
+        return best or []
+
+
+_layout_index = None
+
+
+def get_layout_index(config=Config):
+    """获取进程内共享的布局索引（首次调用时加载）"""
+    global _layout_index
+    if _layout_index is None:
+        _layout_index = LayoutIndex(load_layout_rows(config.EXIF_LAYOUT_INDEX_PATH))
+    return _layout_index
+
+
+def describe_differences(differences):
+    """不一致部分的文字说明"""
+    return '，'.join(f'{LAYOUT_NAMES[field]}为{actual or EMPTY_VALUE}（应为{expected or EMPTY_VALUE}）'
+                    for field, actual, expected in differences)
+
+
+# ==================== 命令行 ====================
+
+def _read_layout(path):
+    from exif_parser import parse_exif_file
+
+    return parse_exif_file(path).layout
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='EXIF结构布局')
+    commands = parser.add_subparsers(dest='command', required=True)
+    show = commands.add_parser('show', help='显示照片的EXIF结构布局')
+    show.add_argument('files', nargs='+', help='图片文件')
+    learn = commands.add_parser('learn', help='从原图采集布局，追加到索引文件')
+    learn.add_argument('files', nargs='+', help='未经编辑的原图')
+    learn.add_argument('--make', required=True, help='制造商（与设备目录中的名称一致）')
+    learn.add_argument('--model', default='', help='型号，留空表示适用于该制造商的所有型号')
+    learn.add_argument('-i', '--index', default=Config.EXIF_LAYOUT_INDEX_PATH, help='索引文件')
+    args = parser.parse_args(argv)
+
+    if args.command == 'show':
+        for path in args.files:
+            layout = _read_layout(path)
+            print(f"{path}: {layout.fingerprint if layout else '没有EXIF'}")
+        return 0
+
+    known = {tuple(row.get(field) or '' for field in INDEX_FIELDS) for row in load_layout_rows(args.index)}
+    new_file = not os.path.exists(args.index)
+    added = 0
+    with open(args.index, 'a', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(INDEX_FIELDS)
+        for path in args.files:
+            layout = _read_layout(path)
+            if layout is None:
+                print(f"{path}: 没有EXIF，跳过", file=sys.stderr)
+                continue
+            row = (args.make.lower(), args.model) + tuple(str(value) or EMPTY_VALUE for value in layout)
+            if row in known:
+                continue
+            known.add(row)
+            writer.writerow(row)
+            added += 1
+    print(f"新增 {added} 条布局记录到 {args.index}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
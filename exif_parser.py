@@ -0,0 +1,721 @@
+"""
+原生EXIF解析器 - 单次遍历APP1/TIFF IFD链，生成统一的标签映射
+
+取代原先 PIL(getexif) + exifread 的双重解析：
+只遍历一次 IFD0 -> Exif IFD -> GPS IFD -> Interop IFD -> IFD1，
+得到一个按标签名索引的字典，字段提取和完整性检查都使用它。
+"""
+
+import struct
+from collections import namedtuple
+from fractions import Fraction
+
+# ==================== 标签定义 ====================
+
+# IFD0（主图像）标签
+IFD0_TAGS = {
+    0x000B: 'ProcessingSoftware',
+    0x00FE: 'NewSubfileType',
+    0x0100: 'ImageWidth',
+    0x0101: 'ImageLength',
+    0x0102: 'BitsPerSample',
+    0x0103: 'Compression',
+    0x0106: 'PhotometricInterpretation',
+    0x010E: 'ImageDescription',
+    0x010F: 'Make',
+    0x0110: 'Model',
+    0x0112: 'Orientation',
+    0x0115: 'SamplesPerPixel',
+    0x011A: 'XResolution',
+    0x011B: 'YResolution',
+    0x011C: 'PlanarConfiguration',
+    0x0128: 'ResolutionUnit',
+    0x0131: 'Software',
+    0x0132: 'DateTime',
+    0x013B: 'Artist',
+    0x013C: 'HostComputer',
+    0x013E: 'WhitePoint',
+    0x013F: 'PrimaryChromaticities',
+    0x0152: 'ExtraSamples',
+    0x0153: 'SampleFormat',
+    0x0211: 'YCbCrCoefficients',
+    0x0213: 'YCbCrPositioning',
+    0x0214: 'ReferenceBlackWhite',
+    0x8298: 'Copyright',
+    0x8769: 'ExifOffset',
+    0x8825: 'GPSInfo',
+}
+
+# Exif子IFD标签
+EXIF_TAGS = {
+    0x829A: 'ExposureTime',
+    0x829D: 'FNumber',
+    0x8822: 'ExposureProgram',
+    0x8827: 'ISOSpeedRatings',
+    0x8830: 'SensitivityType',
+    0x8832: 'RecommendedExposureIndex',
+    0x9000: 'ExifVersion',
+    0x9003: 'DateTimeOriginal',
+    0x9004: 'DateTimeDigitized',
+    0x9010: 'OffsetTime',
+    0x9011: 'OffsetTimeOriginal',
+    0x9012: 'OffsetTimeDigitized',
+    0x9101: 'ComponentsConfiguration',
+    0x9102: 'CompressedBitsPerPixel',
+    0x9201: 'ShutterSpeedValue',
+    0x9202: 'ApertureValue',
+    0x9203: 'BrightnessValue',
+    0x9204: 'ExposureBiasValue',
+    0x9205: 'MaxApertureValue',
+    0x9206: 'SubjectDistance',
+    0x9207: 'MeteringMode',
+    0x9208: 'LightSource',
+    0x9209: 'Flash',
+    0x920A: 'FocalLength',
+    0x9214: 'SubjectArea',
+    0x927C: 'MakerNote',
+    0x9286: 'UserComment',
+    0x9290: 'SubSecTime',
+    0x9291: 'SubSecTimeOriginal',
+    0x9292: 'SubSecTimeDigitized',
+    0xA000: 'FlashPixVersion',
+    0xA001: 'ColorSpace',
+    0xA002: 'ExifImageWidth',
+    0xA003: 'ExifImageLength',
+    0xA005: 'InteroperabilityOffset',
+    0xA20E: 'FocalPlaneXResolution',
+    0xA20F: 'FocalPlaneYResolution',
+    0xA210: 'FocalPlaneResolutionUnit',
+    0xA217: 'SensingMethod',
+    0xA300: 'FileSource',
+    0xA301: 'SceneType',
+    0xA401: 'CustomRendered',
+    0xA402: 'ExposureMode',
+    0xA403: 'WhiteBalance',
+    0xA404: 'DigitalZoomRatio',
+    0xA405: 'FocalLengthIn35mmFilm',
+    0xA406: 'SceneCaptureType',
+    0xA407: 'GainControl',
+    0xA408: 'Contrast',
+    0xA409: 'Saturation',
+    0xA40A: 'Sharpness',
+    0xA40C: 'SubjectDistanceRange',
+    0xA420: 'ImageUniqueID',
+    0xA430: 'CameraOwnerName',
+    0xA431: 'BodySerialNumber',
+    0xA432: 'LensSpecification',
+    0xA433: 'LensMake',
+    0xA434: 'LensModel',
+    0xA435: 'LensSerialNumber',
+}
+
+# GPS子IFD标签
+GPS_TAGS = {
+    0x0000: 'GPSVersionID',
+    0x0001: 'GPSLatitudeRef',
+    0x0002: 'GPSLatitude',
+    0x0003: 'GPSLongitudeRef',
+    0x0004: 'GPSLongitude',
+    0x0005: 'GPSAltitudeRef',
+    0x0006: 'GPSAltitude',
+    0x0007: 'GPSTimeStamp',
+    0x0008: 'GPSSatellites',
+    0x0009: 'GPSStatus',
+    0x000A: 'GPSMeasureMode',
+    0x000B: 'GPSDOP',
+    0x000C: 'GPSSpeedRef',
+    0x000D: 'GPSSpeed',
+    0x0010: 'GPSImgDirectionRef',
+    0x0011: 'GPSImgDirection',
+    0x0012: 'GPSMapDatum',
+    0x001B: 'GPSProcessingMethod',
+    0x001D: 'GPSDate',
+}
+
+# Interop子IFD标签
+INTEROP_TAGS = {
+    0x0001: 'InteroperabilityIndex',
+    0x0002: 'InteroperabilityVersion',
+}
+
+# IFD1（缩略图）标签
+THUMBNAIL_TAGS = {
+    0x0103: 'Compression',
+    0x0201: 'JPEGInterchangeFormat',
+    0x0202: 'JPEGInterchangeFormatLength',
+}
+
+# 子IFD指针标签
+EXIF_IFD_POINTER = 0x8769
+GPS_IFD_POINTER = 0x8825
+INTEROP_IFD_POINTER = 0xA005
+
+# 不放入标签映射的标签（与旧实现一致，MakerNote体积大且格式私有）
+SKIPPED_TAGS = {'MakerNote'}
+
+# 枚举字段的可读文本（与exifread的printable保持一致，保证输出不变）
+PRINTABLE_VALUES = {
+    'MeteringMode': {
+        0: 'Unidentified',
+        1: 'Average',
+        2: 'CenterWeightedAverage',
+        3: 'Spot',
+        4: 'MultiSpot',
+        5: 'Pattern',
+        6: 'Partial',
+        255: 'other',
+    },
+    'Flash': {
+        0: 'Flash did not fire',
+        1: 'Flash fired',
+        5: 'Strobe return light not detected',
+        7: 'Strobe return light detected',
+        9: 'Flash fired, compulsory flash mode',
+        13: 'Flash fired, compulsory flash mode, return light not detected',
+        15: 'Flash fired, compulsory flash mode, return light detected',
+        16: 'Flash did not fire, compulsory flash mode',
+        24: 'Flash did not fire, auto mode',
+        25: 'Flash fired, auto mode',
+        29: 'Flash fired, auto mode, return light not detected',
+        31: 'Flash fired, auto mode, return light detected',
+        32: 'No flash function',
+        65: 'Flash fired, red-eye reduction mode',
+        69: 'Flash fired, red-eye reduction mode, return light not detected',
+        71: 'Flash fired, red-eye reduction mode, return light detected',
+        73: 'Flash fired, compulsory flash mode, red-eye reduction mode',
+        77: 'Flash fired, compulsory flash mode, red-eye reduction mode, return light not detected',
+        79: 'Flash fired, compulsory flash mode, red-eye reduction mode, return light detected',
+        89: 'Flash fired, auto mode, red-eye reduction mode',
+        93: 'Flash fired, auto mode, return light not detected, red-eye reduction mode',
+        95: 'Flash fired, auto mode, return light detected, red-eye reduction mode',
+    },
+    'ExposureMode': {
+        0: 'Auto Exposure',
+        1: 'Manual Exposure',
+        2: 'Auto Bracket',
+    },
+    'WhiteBalance': {
+        0: 'Auto',
+        1: 'Manual',
+    },
+}
+
+# TIFF字段类型: 类型编号 -> (struct格式, 字节长度)
+FIELD_TYPES = {
+    1: ('B', 1),    # BYTE
+    2: ('s', 1),    # ASCII
+    3: ('H', 2),    # SHORT
+    4: ('L', 4),    # LONG
+    5: ('L', 8),    # RATIONAL
+    6: ('b', 1),    # SBYTE
+    7: ('s', 1),    # UNDEFINED
+    8: ('h', 2),    # SSHORT
+    9: ('l', 4),    # SLONG
+    10: ('l', 8),   # SRATIONAL
+    11: ('f', 4),   # FLOAT
+    12: ('d', 8),   # DOUBLE
+    13: ('L', 4),   # IFD
+}
+
+# 单个IFD允许的最大条目数，防止损坏数据导致超长循环
+MAX_IFD_ENTRIES = 1000
+
+EXIF_HEADER = b'Exif\x00\x00'
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# metadata_extent 的返回值：需要读取完整文件
+FULL_EXTENT = -1
+
+# ==================== 数据结构 ====================
+
+class Ratio(Fraction):
+    """有理数值，允许分母为0（损坏的EXIF中很常见）"""
+
+    def __new__(cls, numerator=0, denominator=None):
+        try:
+            self = super(Ratio, cls).__new__(cls, numerator, denominator)
+        except ZeroDivisionError:
+            self = super(Ratio, cls).__new__(cls)
+            self._numerator = numerator
+            self._denominator = denominator
+        return self
+
+    def __repr__(self):
+        return str(self)
+
+
+class ExifTags(dict):
+    """
+    统一的EXIF标签映射
+
+    键为标签名，值为解码后的Python值（str/int/Ratio/tuple/bytes）。
+    同名标签以IFD0优先，其次为Exif、GPS、Interop子IFD。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.primary = set()     # 来自IFD0的标签名
+        self.byte_order = None   # 'II' 或 'MM'
+        self.thumbnail = None    # IFD1缩略图 (起始偏移, 长度)，相对于整个缓冲区
+        self.layout = None       # EXIF块的结构布局（ExifLayout）
+
+    def display(self, name):
+        """
+        返回字段的显示值，与旧版 PIL + exifread 合并结果保持一致：
+        IFD0中的标签保持PIL风格的类型化值，其余标签使用exifread风格的文本。
+        """
+        if name not in self:
+            return None
+        return self.display_value(name, self[name])
+
+    def display_value(self, name, value):
+        """已取出标签值时计算显示值（避免再次查找）"""
+        if name in self.primary:
+            if isinstance(value, bytes):
+                try:
+                    return value.decode('utf-8')
+                except UnicodeDecodeError:
+                    return str(value)
+            if isinstance(value, Ratio):
+                return _ratio_to_float(value)
+            return value
+
+        return printable_value(name, value)
+
+
+class ExifLayout(namedtuple('ExifLayout', ['byte_order', 'first_ifd', 'ifd_order',
+                                           'placement', 'alignment', 'unsorted'])):
+    """
+    EXIF块的结构布局，遍历IFD时顺带记录
+
+    byte_order: 'II' 或 'MM'
+    first_ifd: IFD0相对TIFF头的偏移
+    ifd_order: 各IFD按在文件中的位置排列（0=IFD0, E=Exif, I=Interop, G=GPS, 1=IFD1）
+    placement: 'packed'（结构之间没有空隙）、'gap'（有未引用的空隙）或 'overlap'（结构互相重叠）
+    alignment: 外部数据的偏移是否都是偶数（'even' / 'odd'）
+    unsorted: 标签没有按编号升序排列的IFD（'' 表示全部有序）
+    """
+
+    __slots__ = ()
+
+    @property
+    def fingerprint(self):
+        """紧凑的文本形式，如 'MM|8|0EG1|packed|even|'"""
+        return '|'.join(str(value) for value in self)
+
+
+class _LayoutRecorder:
+    """在 _walk_ifd 中记录各IFD和外部数据的位置"""
+
+    __slots__ = ('ifds', 'spans', 'unsorted', 'odd_values')
+
+    # 允许的对齐填充字节数
+    PADDING = 3
+
+    def __init__(self):
+        self.ifds = []          # (偏移, IFD类型)
+        self.spans = []         # 已引用的区间 (起始, 结束)，相对TIFF头
+        self.unsorted = ''
+        self.odd_values = False
+
+    def add_ifd(self, kind, offset, entry_count):
+        self.ifds.append((offset, kind))
+        self.spans.append((offset, offset + 6 + 12 * entry_count))
+
+    def add_value(self, offset, length):
+        self.spans.append((offset, offset + length))
+        if offset & 1:
+            self.odd_values = True
+
+    def summary(self, byte_order, first_ifd):
+        placement = 'packed'
+        position = 8
+        for start, stop in sorted(self.spans):
+            if start < position:
+                placement = 'overlap'
+                break
+            if start - position > self.PADDING:
+                placement = 'gap'
+            position = stop
+        return ExifLayout(byte_order, first_ifd, ''.join(kind for _, kind in sorted(self.ifds)),
+                          placement, 'odd' if self.odd_values else 'even', self.unsorted)
+
+
+def _ratio_to_float(value):
+    """有理数转浮点数，分母为0时返回nan"""
+    try:
+        return float(value)
+    except ZeroDivisionError:
+        return float('nan')
+
+
+def printable_value(name, value):
+    """将标签值转换为exifread风格的可读文本"""
+    mapping = PRINTABLE_VALUES.get(name)
+    values = value if isinstance(value, tuple) else (value,)
+
+    if mapping is not None and not isinstance(value, (str, bytes)):
+        return ''.join(mapping.get(v, repr(v)) for v in values)
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bytes):
+        return str(list(value))
+    if isinstance(value, tuple):
+        return '[' + ', '.join(repr(v) for v in value) + ']'
+    return str(value)
+
+# ==================== 容器格式定位 ====================
+
+def iter_jpeg_segments(data):
+    """
+    遍历JPEG标记段，直到SOS（图像数据开始）或EOI为止
+
+    Args:
+        data: bytes/bytearray/memoryview
+
+    Yields:
+        tuple: (marker, payload_offset, payload_length)
+               payload不含2字节长度字段；SOS段也会被返回，之后停止遍历
+    """
+    size = len(data)
+    if size < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return
+
+    pos = 2
+    while pos + 4 <= size:
+        if data[pos] != 0xFF:
+            # 标记之间出现垃圾字节，按照规范应视为结构损坏
+            return
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # 填充字节
+            pos += 1
+            continue
+        if marker == 0xD9:
+            return
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            # 无长度字段的独立标记
+            pos += 2
+            continue
+
+        length = (data[pos + 2] << 8) | data[pos + 3]
+        if length < 2:
+            return
+        yield marker, pos + 4, length - 2
+        if marker == 0xDA:
+            return
+        pos += 2 + length
+
+
+def find_exif_block(data):
+    """
+    在图片数据中定位TIFF结构（EXIF数据）
+
+    支持 JPEG(APP1)、TIFF、PNG(eXIf) 和 WebP(EXIF) 容器。
+
+    Returns:
+        tuple: (起始偏移, 结束偏移)，找不到时返回None
+    """
+    size = len(data)
+    head = bytes(data[:12])
+
+    if head[:2] == b'\xFF\xD8':
+        for marker, offset, length in iter_jpeg_segments(data):
+            if marker == 0xE1 and bytes(data[offset:offset + 6]) == EXIF_HEADER:
+                return offset + 6, min(offset + length, size)
+        return None
+
+    if head[:4] in (b'II*\x00', b'MM\x00*'):
+        return 0, size
+
+    if head[:8] == PNG_SIGNATURE:
+        pos = 8
+        while pos + 8 <= size:
+            chunk_length = struct.unpack_from('>L', data, pos)[0]
+            chunk_type = bytes(data[pos + 4:pos + 8])
+            if chunk_type == b'eXIf':
+                return pos + 8, min(pos + 8 + chunk_length, size)
+            if chunk_type in (b'IDAT', b'IEND'):
+                break
+            pos += 12 + chunk_length
+        return None
+
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        pos = 12
+        while pos + 8 <= size:
+            chunk_type = bytes(data[pos:pos + 4])
+            chunk_length = struct.unpack_from('<L', data, pos + 4)[0]
+            if chunk_type == b'EXIF':
+                start = pos + 8
+                if bytes(data[start:start + 6]) == EXIF_HEADER:
+                    start += 6
+                return start, min(pos + 8 + chunk_length, size)
+            pos += 8 + chunk_length + (chunk_length & 1)
+        return None
+
+    return None
+
+def metadata_extent(data):
+    """
+    计算读取元数据和图片尺寸所需的前缀长度，用于流式读取时提前停止
+
+    JPEG读到SOS段为止，PNG读到第一个IDAT块头，GIF读到第一个图像描述符，
+    BMP读到像素数据之前；TIFF/WebP等元数据位置不固定的格式需要完整文件。
+
+    Args:
+        data: 目前已读取的前缀（bytes/bytearray/memoryview）
+
+    Returns:
+        int: 所需的前缀长度；FULL_EXTENT 表示需要完整文件；None 表示数据不足，需要继续读取
+    """
+    size = len(data)
+    if size < 12:
+        return None
+    head = bytes(data[:12])
+
+    if head[:2] == b'\xFF\xD8':
+        end = 2
+        for marker, offset, length in iter_jpeg_segments(data):
+            if offset + length > size:
+                return None
+            end = offset + length
+            if marker == 0xDA:
+                return end
+        if end + 4 > size:
+            return None
+        # 没有找到SOS（结构损坏），交给后续流程按完整文件处理
+        return FULL_EXTENT
+
+    if head[:8] == PNG_SIGNATURE:
+        pos = 8
+        while pos + 8 <= size:
+            chunk_length = struct.unpack_from('>L', data, pos)[0]
+            chunk_type = bytes(data[pos + 4:pos + 8])
+            if chunk_type in (b'IDAT', b'IEND'):
+                return pos + 8
+            pos += 12 + chunk_length
+        return None
+
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return _gif_extent(data)
+
+    if head[:2] == b'BM':
+        if size < 14:
+            return None
+        return struct.unpack_from('<L', data, 10)[0]
+
+    return FULL_EXTENT
+
+
+def _gif_extent(data):
+    """GIF: 头部、全局调色板、扩展块，直到第一个图像描述符（含局部调色板）"""
+    size = len(data)
+    pos = 13
+    flags = data[10]
+    if flags & 0x80:
+        pos += 3 << ((flags & 0x07) + 1)
+
+    while pos < size:
+        block = data[pos]
+        if block == 0x2C:
+            if pos + 10 > size:
+                return None
+            local_flags = data[pos + 9]
+            end = pos + 10
+            if local_flags & 0x80:
+                end += 3 << ((local_flags & 0x07) + 1)
+            return end + 1
+        if block == 0x21:
+            pos += 2
+            while True:
+                if pos >= size:
+                    return None
+                block_size = data[pos]
+                pos += 1 + block_size
+                if block_size == 0:
+                    break
+            continue
+        # 文件结束符或未知块
+        return pos + 1
+    return None
+
+# ==================== TIFF/IFD解析 ====================
+
+def _read_value(data, endian, field_type, count, offset):
+    """读取单个IFD条目的值"""
+    fmt, unit = FIELD_TYPES[field_type]
+
+    if field_type == 2:
+        raw = bytes(data[offset:offset + count]).split(b'\x00', 1)[0]
+        try:
+            return raw.decode('utf-8')
+        except UnicodeDecodeError:
+            return raw.decode('latin-1')
+
+    if field_type == 7:
+        return bytes(data[offset:offset + count])
+
+    if field_type in (5, 10):
+        numbers = struct.unpack_from(f'{endian}{count * 2}{fmt}', data, offset)
+        values = tuple(Ratio(numbers[i], numbers[i + 1]) for i in range(0, len(numbers), 2))
+    else:
+        values = struct.unpack_from(f'{endian}{count}{fmt}', data, offset)
+
+    if count == 1:
+        return values[0]
+    if field_type == 1:
+        return bytes(values)
+    return values
+
+
+def _walk_ifd(data, base, end, endian, ifd_offset, tag_names, tags, primary=False,
+              layout=None, kind=''):
+    """
+    解析单个IFD，把已知标签写入tags（同时向layout记录结构信息）
+
+    Returns:
+        tuple: (子IFD指针字典 {tag_id: 偏移}, 下一个IFD的偏移)
+    """
+    start = base + ifd_offset
+    if ifd_offset <= 0 or start + 2 > end:
+        return {}, 0
+
+    entry_count = struct.unpack_from(endian + 'H', data, start)[0]
+    if entry_count > MAX_IFD_ENTRIES:
+        return {}, 0
+
+    if layout is not None:
+        layout.add_ifd(kind, ifd_offset, entry_count)
+    previous_tag = -1
+
+    pointers = {}
+    entry = start + 2
+    for _ in range(entry_count):
+        if entry + 12 > end:
+            break
+        tag_id, field_type, count = struct.unpack_from(endian + 'HHL', data, entry)
+        if layout is not None:
+            if tag_id <= previous_tag and kind not in layout.unsorted:
+                layout.unsorted += kind
+            previous_tag = tag_id
+        type_info = FIELD_TYPES.get(field_type)
+        if type_info is not None and count:
+            byte_length = count * type_info[1]
+            if byte_length <= 4:
+                value_offset = entry + 8
+            else:
+                value_offset = base + struct.unpack_from(endian + 'L', data, entry + 8)[0]
+                if layout is not None:
+                    layout.add_value(value_offset - base, byte_length)
+
+            if value_offset + byte_length <= end:
+                if tag_id in (EXIF_IFD_POINTER, GPS_IFD_POINTER, INTEROP_IFD_POINTER):
+                    pointers[tag_id] = struct.unpack_from(endian + 'L', data, value_offset)[0]
+
+                name = tag_names.get(tag_id)
+                if name is not None and name not in SKIPPED_TAGS and name not in tags:
+                    try:
+                        tags[name] = _read_value(data, endian, field_type, count, value_offset)
+                    except struct.error:
+                        pass
+                    else:
+                        if primary:
+                            tags.primary.add(name)
+        entry += 12
+
+    next_ifd = 0
+    if entry + 4 <= end:
+        next_ifd = struct.unpack_from(endian + 'L', data, entry)[0]
+    return pointers, next_ifd
+
+
+def parse_tiff(data, base=0, end=None):
+    """
+    解析TIFF结构（EXIF数据块）
+
+    Args:
+        data: 完整缓冲区（bytes/bytearray/memoryview）
+        base: TIFF头在缓冲区中的偏移
+        end: TIFF结构的结束偏移，默认为缓冲区末尾
+
+    Returns:
+        ExifTags: 标签映射
+    """
+    tags = ExifTags()
+    if end is None:
+        end = len(data)
+    if base + 8 > end:
+        return tags
+
+    byte_order = bytes(data[base:base + 2])
+    if byte_order == b'II':
+        endian = '<'
+    elif byte_order == b'MM':
+        endian = '>'
+    else:
+        return tags
+    tags.byte_order = byte_order.decode('ascii')
+
+    first_ifd = struct.unpack_from(endian + 'L', data, base + 4)[0]
+    layout = _LayoutRecorder()
+    pointers, next_ifd = _walk_ifd(data, base, end, endian, first_ifd, IFD0_TAGS, tags, primary=True,
+                                   layout=layout, kind='0')
+
+    visited = {first_ifd}
+    exif_offset = pointers.get(EXIF_IFD_POINTER)
+    if exif_offset and exif_offset not in visited:
+        visited.add(exif_offset)
+        exif_pointers, _ = _walk_ifd(data, base, end, endian, exif_offset, EXIF_TAGS, tags,
+                                     layout=layout, kind='E')
+        interop_offset = exif_pointers.get(INTEROP_IFD_POINTER)
+        if interop_offset and interop_offset not in visited:
+            visited.add(interop_offset)
+            _walk_ifd(data, base, end, endian, interop_offset, INTEROP_TAGS, tags, layout=layout, kind='I')
+
+    gps_offset = pointers.get(GPS_IFD_POINTER)
+    if gps_offset and gps_offset not in visited:
+        visited.add(gps_offset)
+        _walk_ifd(data, base, end, endian, gps_offset, GPS_TAGS, tags, layout=layout, kind='G')
+
+    if next_ifd and next_ifd not in visited:
+        thumbnail = ExifTags()
+        _walk_ifd(data, base, end, endian, next_ifd, THUMBNAIL_TAGS, thumbnail, layout=layout, kind='1')
+        thumb_offset = thumbnail.get('JPEGInterchangeFormat')
+        thumb_length = thumbnail.get('JPEGInterchangeFormatLength')
+        if isinstance(thumb_offset, int) and isinstance(thumb_length, int) and thumb_length > 0:
+            # 缩略图数据不要求对齐，只记录区间
+            layout.spans.append((thumb_offset, thumb_offset + thumb_length))
+            if base + thumb_offset + thumb_length <= end:
+                tags.thumbnail = (base + thumb_offset, thumb_length)
+
+    tags.layout = layout.summary(tags.byte_order, first_ifd)
+    return tags
+
+
+def parse_exif(data):
+    """
+    从图片数据中解析EXIF（单次遍历）
+
+    Args:
+        data: 图片文件内容（bytes/bytearray/memoryview）
+
+    Returns:
+        ExifTags: 标签映射；没有EXIF或解析失败时返回空映射
+    """
+    try:
+        block = find_exif_block(data)
+        if block is None:
+            return ExifTags()
+        start, end = block
+        return parse_tiff(data, start, end)
+    except Exception as e:
+        print(f"EXIF解析错误: {e}")
+        return ExifTags()
+
+
+def parse_exif_file(file_path):
+    """从文件路径解析EXIF（mmap映射文件，不读入整个文件）"""
+    from stream_ingest import open_shared_buffer
+
+    with open_shared_buffer(file_path) as buffer:
+        return parse_exif(buffer)
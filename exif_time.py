@@ -0,0 +1,156 @@
+"""
+EXIF时间解析 - 按固定宽度切片，不经过 datetime.strptime
+
+EXIF中的时间都是固定宽度的文本：
+- DateTime / DateTimeOriginal / DateTimeDigitized: 'YYYY:MM:DD HH:MM:SS'（相机的本地时间）
+- SubSecTime*: 对应时间的小数秒（数字串，'5' 表示0.5秒）
+- OffsetTime*: 对应时间相对UTC的时差 '+HH:MM'
+- GPSDate + GPSTimeStamp: 'YYYY:MM:DD' 和时、分、秒三个有理数，为UTC时间
+
+解析结果统一为整数（1970-01-01起的秒数或微秒数），跨字段比较只做整数运算。
+不符合固定宽度的时间（如单位数的月份）回退到 strptime，能否解析的判断与 strptime 一致。
+"""
+
+import re
+from datetime import datetime
+from fractions import Fraction
+
+MICROSECONDS = 1000000
+
+DATETIME_FORMAT = '%Y:%m:%d %H:%M:%S'
+
+# (时间字段, 小数秒字段, 时区字段)
+TIME_FIELD_GROUPS = (
+    ('DateTime', 'SubSecTime', 'OffsetTime'),
+    ('DateTimeOriginal', 'SubSecTimeOriginal', 'OffsetTimeOriginal'),
+    ('DateTimeDigitized', 'SubSecTimeDigitized', 'OffsetTimeDigitized'),
+)
+
+# 实际使用中的时区范围（秒）
+MIN_UTC_OFFSET = -12 * 3600
+MAX_UTC_OFFSET = 14 * 3600
+
+_DATETIME = re.compile(r'(\d{4}):(\d\d):(\d\d) (\d\d):(\d\d):(\d\d)', re.ASCII)
+_DATE = re.compile(r'(\d{4}):(\d\d):(\d\d)', re.ASCII)
+_OFFSET = re.compile(r'([+-])(\d\d):(\d\d)', re.ASCII)
+_DAYS_IN_MONTH = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+_EPOCH = datetime(1970, 1, 1)
+_ONE_SECOND = datetime(1970, 1, 1, 0, 0, 1) - _EPOCH
+
+
+def days_from_civil(year, month, day):
+    """公历日期 -> 1970-01-01起的天数（整数或NumPy整数数组均可）"""
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    month_index = (month + 9) % 12
+    day_of_year = (153 * month_index + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+
+def _valid_date(year, month, day):
+    if year < 1 or not 1 <= month <= 12 or day < 1:
+        return False
+    if month == 2 and year % 4 == 0 and (year % 100 != 0 or year % 400 == 0):
+        return day <= 29
+    return day <= _DAYS_IN_MONTH[month - 1]
+
+
+def parse_datetime(text):
+    """
+    解析 'YYYY:MM:DD HH:MM:SS'
+
+    Returns:
+        int: 1970-01-01起的秒数（不含时区，即相机的本地时间）；无法解析时为None
+    """
+    match = _DATETIME.fullmatch(text) if isinstance(text, str) else None
+    if match is None:
+        # 非固定宽度的写法（单位数字段、制表符等）交给 strptime
+        try:
+            return (datetime.strptime(text, DATETIME_FORMAT) - _EPOCH) // _ONE_SECOND
+        except (TypeError, ValueError):
+            return None
+    year, month, day, hour, minute, second = map(int, match.groups())
+    if not _valid_date(year, month, day) or hour > 23 or minute > 59 or second > 59:
+        return None
+    return days_from_civil(year, month, day) * 86400 + hour * 3600 + minute * 60 + second
+
+
+def parse_subsec(text):
+    """SubSecTime* -> 微秒（超过6位的部分舍去）；没有或无法解析时为0"""
+    if not isinstance(text, str):
+        return 0
+    text = text.strip()
+    if not (text.isascii() and text.isdigit()):
+        return 0
+    return int(text[:6].ljust(6, '0'))
+
+
+def parse_offset(text):
+    """OffsetTime* '+HH:MM' -> 相对UTC的秒数；没有或无法解析时为None"""
+    match = _OFFSET.fullmatch(text.strip(' \x00')) if isinstance(text, str) else None
+    if match is None or int(match.group(3)) > 59:
+        return None
+    sign, hours, minutes = match.groups()
+    offset = int(hours) * 3600 + int(minutes) * 60
+    if sign == '-':
+        offset = -offset
+    return offset if MIN_UTC_OFFSET <= offset <= MAX_UTC_OFFSET else None
+
+
+def is_blank(text):
+    """EXIF中未知的值常写作空格或空字符串"""
+    return not isinstance(text, str) or not text.strip(' \x00')
+
+
+def gps_time_of_day(values):
+    """
+    GPSTimeStamp（时、分、秒三个有理数）-> 当天的微秒数
+
+    Returns:
+        int: 0 至 86400 * 10^6（不含）；格式不对或超出范围时为None
+    """
+    try:
+        hour, minute, second = (Fraction(value) for value in values)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    # 损坏的EXIF中分母可能为0（exif_parser.Ratio）
+    if 0 in (hour.denominator, minute.denominator, second.denominator):
+        return None
+    if not (0 <= hour < 24 and 0 <= minute < 60 and 0 <= second < 61):
+        return None
+    total = int((hour * 3600 + minute * 60 + second) * MICROSECONDS)
+    return total if total < 86400 * MICROSECONDS else None
+
+
+def gps_timestamp(date_text, time_of_day):
+    """
+    GPSDate 和 gps_time_of_day 的结果 -> UTC时间
+
+    Returns:
+        int: 1970-01-01起的微秒数（UTC）；没有或无法解析时为None
+    """
+    match = _DATE.fullmatch(date_text.strip(' \x00')) if isinstance(date_text, str) else None
+    if match is None or time_of_day is None:
+        return None
+    year, month, day = map(int, match.groups())
+    if not _valid_date(year, month, day):
+        return None
+    return days_from_civil(year, month, day) * 86400 * MICROSECONDS + time_of_day
+
+
+def time_difference(first, second):
+    """
+    两个时间之差的绝对值（微秒）
+
+    Args:
+        first, second: (本地时间的微秒数, 时区秒数或None)
+
+    两者都有时区时按UTC比较；否则认为两者是同一时钟的本地时间，直接比较。
+    """
+    (first_time, first_offset), (second_time, second_offset) = first, second
+    if first_offset is not None and second_offset is not None:
+        first_time -= first_offset * MICROSECONDS
+        second_time -= second_offset * MICROSECONDS
+    return abs(first_time - second_time)
@@ -0,0 +1,292 @@
+"""
+字段解析计划 - 每个标签每次请求只解析一次
+
+解析表在导入时编译一次：字段名、旧版exifread格式中的键名、中文名称和格式化函数都预先确定。
+每张照片按解析表生成一条紧凑的 PhotoRecord，
+字段提取、Config.SPECIAL_FIELDS 格式化和完整性检查都只读取这条记录。
+"""
+
+from fractions import Fraction
+from config import Config
+from exif_parser import ExifLayout, ExifTags
+from exif_time import gps_time_of_day
+from quant_tables import quantization_fingerprint
+from thumbnail_check import ThumbnailComparison, compare_thumbnail
+
+# 解析表：(字段名, 旧版exifread数据中依次查找的前缀)
+FIELD_SOURCES = (
+    # 设备信息
+    ('Make', ('Image',)),
+    ('Model', ('Image',)),
+    ('Software', ('Image', 'EXIF')),
+    ('ProcessingSoftware', ('Image', 'EXIF')),
+    ('HostComputer', ('Image', 'EXIF')),
+    ('LensModel', ('EXIF',)),
+    ('LensMake', ('EXIF',)),
+
+    # 时间
+    ('DateTime', ('EXIF', 'Image')),
+    ('DateTimeOriginal', ('EXIF', 'Image')),
+    ('DateTimeDigitized', ('EXIF', 'Image')),
+    ('SubSecTime', ('EXIF',)),
+    ('SubSecTimeOriginal', ('EXIF',)),
+    ('SubSecTimeDigitized', ('EXIF',)),
+    ('OffsetTime', ('EXIF',)),
+    ('OffsetTimeOriginal', ('EXIF',)),
+    ('OffsetTimeDigitized', ('EXIF',)),
+    ('GPSDate', ('GPS',)),
+    ('GPSTimeStamp', ('GPS',)),
+
+    # 拍摄参数
+    ('ExposureTime', ('EXIF',)),
+    ('FNumber', ('EXIF',)),
+    ('ISOSpeedRatings', ('EXIF',)),
+    ('FocalLength', ('EXIF',)),
+    ('Flash', ('EXIF',)),
+    ('WhiteBalance', ('EXIF',)),
+    ('ExposureMode', ('EXIF',)),
+    ('MeteringMode', ('EXIF',)),
+    ('Orientation', ('Image',)),
+)
+
+FIELD_NAMES = tuple(name for name, _ in FIELD_SOURCES)
+FIELD_INDEX = {name: index for index, name in enumerate(FIELD_NAMES)}
+
+# 不来自EXIF标签、在读取头部时得到的信号（完整性规则同样可以读取）
+SIGNAL_NAMES = (
+    'quantization',     # JPEG量化表指纹（quant_tables.quantization_fingerprint）
+    'exif_layout',      # EXIF块的结构布局（exif_parser.ExifLayout，解析时记录）
+    'thumbnail',        # 嵌入缩略图与主图的比较结果（thumbnail_check.ThumbnailComparison，需要完整文件）
+)
+
+# 展示给用户的字段
+DEVICE_FIELDS = ('Make', 'Model', 'Software', 'LensModel', 'LensMake')
+TECHNICAL_FIELDS = ('DateTime', 'DateTimeOriginal', 'ExposureTime', 'FNumber',
+                    'ISOSpeedRatings', 'FocalLength', 'Flash', 'WhiteBalance',
+                    'ExposureMode', 'MeteringMode', 'Orientation')
+
+# 紧凑输出中的固定字段编号（只能追加，已有的编号不能修改或复用）
+FIELD_IDS = {
+    'Make': 1, 'Model': 2, 'Software': 3, 'ProcessingSoftware': 4, 'HostComputer': 5,
+    'LensModel': 6, 'LensMake': 7,
+    'DateTime': 8, 'DateTimeOriginal': 9, 'DateTimeDigitized': 10,
+    'SubSecTime': 11, 'SubSecTimeOriginal': 12, 'SubSecTimeDigitized': 13,
+    'OffsetTime': 14, 'OffsetTimeOriginal': 15, 'OffsetTimeDigitized': 16,
+    'GPSDate': 17, 'GPSTimeStamp': 18,
+    'ExposureTime': 19, 'FNumber': 20, 'ISOSpeedRatings': 21, 'FocalLength': 22, 'Flash': 23,
+    'WhiteBalance': 24, 'ExposureMode': 25, 'MeteringMode': 26, 'Orientation': 27,
+    # 信号
+    'quantization': 64, 'exif_layout': 65, 'thumbnail': 66,
+}
+
+# 紧凑输出包含的字段（与完整输出展示的字段相同）
+COMPACT_FIELDS = DEVICE_FIELDS + TECHNICAL_FIELDS
+
+
+class PhotoRecord:
+    """
+    单张照片的规范化字段记录
+
+    字段属性保存供完整性检查使用的值（缺失为None）：
+    文本字段为原始值，ISOSpeedRatings 规范化为int，FocalLength 规范化为float，
+    GPSTimeStamp 规范化为当天的微秒数（exif_time.gps_time_of_day），无法比较时为None。
+    display 按 FIELD_NAMES 的顺序保存用于展示的值（只有原生解析结果才有）。
+    SIGNAL_NAMES 中的信号没有时为None：exif_layout 由 build_record 从解析结果中取出，
+    其余由 read_signals 在读取头部时填入。
+    """
+
+    __slots__ = FIELD_NAMES + SIGNAL_NAMES + ('display',)
+
+    def __init__(self):
+        for name in FIELD_NAMES + SIGNAL_NAMES:
+            setattr(self, name, None)
+        self.display = None
+
+
+# ==================== 值的规范化 ====================
+
+def _iso_from_tag(value):
+    # 多值ISO（如双ISO记录）无法比较，与旧版exifread路径一致地忽略
+    return value if isinstance(value, int) else None
+
+
+def _iso_from_text(text):
+    try:
+        return int(text)
+    except ValueError:
+        return None
+
+
+def _focal_from_tag(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+
+
+def _focal_from_text(text):
+    try:
+        if '/' in text:
+            numerator, denominator = text.split('/')
+            return float(numerator) / float(denominator)
+        return float(text)
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def _gps_time_from_text(text):
+    # exifread 的格式为 '[14, 30, 13/2]'
+    return gps_time_of_day(part.strip() for part in text.strip('[]').split(','))
+
+
+# 字段名 -> (标签值的规范化函数, 旧版exifread文本的规范化函数)
+NORMALIZERS = {
+    'ISOSpeedRatings': (_iso_from_tag, _iso_from_text),
+    'FocalLength': (_focal_from_tag, _focal_from_text),
+    'GPSTimeStamp': (gps_time_of_day, _gps_time_from_text),
+}
+
+# 编译后的解析计划：(属性名, 下标, 旧版键名元组, 标签值规范化, 文本规范化)
+RESOLUTION_PLAN = tuple(
+    (name, FIELD_INDEX[name], tuple(f'{prefix} {name}' for prefix in prefixes))
+    + NORMALIZERS.get(name, (None, str))
+    for name, prefixes in FIELD_SOURCES
+)
+
+
+def build_record(tags, exifread_data=None):
+    """
+    按解析计划生成字段记录
+
+    Args:
+        tags: exif_parser.ExifTags 或PIL风格的字典（可为None）
+        exifread_data: 旧版exifread格式的数据（可选，只在tags中没有该字段时查找）
+
+    Returns:
+        PhotoRecord: 字段记录
+    """
+    record = PhotoRecord()
+    tags = tags or {}
+    exif_tags = tags if isinstance(tags, ExifTags) else None
+    display = [None] * len(FIELD_NAMES) if exif_tags is not None else None
+
+    for name, index, legacy_keys, from_tag, from_text in RESOLUTION_PLAN:
+        value = tags.get(name)
+        if value is not None:
+            if display is not None:
+                display[index] = exif_tags.display_value(name, value)
+            setattr(record, name, from_tag(value) if from_tag else value)
+        elif exifread_data:
+            for key in legacy_keys:
+                legacy_value = exifread_data.get(key)
+                if legacy_value is not None:
+                    setattr(record, name, from_text(str(legacy_value)))
+                    break
+
+    record.display = display
+    if exif_tags is not None:
+        record.exif_layout = exif_tags.layout
+    return record
+
+
+def read_signals(record, data, thumbnail=None):
+    """
+    从图片头部数据读取 SIGNAL_NAMES 中的信号，填入记录
+
+    Args:
+        record: build_record 生成的记录
+        data: 解析EXIF时使用的同一份头部数据（或完整文件）
+        thumbnail: IFD1缩略图的位置（ExifTags.thumbnail），data 为完整文件时用于比较缩略图与主图
+
+    Returns:
+        PhotoRecord: 同一条记录
+    """
+    record.quantization = quantization_fingerprint(data)
+    record.thumbnail = compare_thumbnail(data, thumbnail)
+    return record
+
+
+# ==================== 紧凑输出 ====================
+
+def compact_value(value):
+    """
+    记录中的值 -> 可直接序列化为JSON的原始值（不经过展示格式化）
+
+    有理数转换为浮点数（分母为0时为None），元组转换为列表，
+    结构布局取指纹，缩略图比较结果取差异值，其他无法序列化的值转换为文本。
+    """
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    if isinstance(value, Fraction):
+        return float(value) if value.denominator else None
+    if isinstance(value, ExifLayout):
+        return value.fingerprint
+    if isinstance(value, ThumbnailComparison):
+        return value.difference
+    if isinstance(value, (tuple, list)):
+        return [compact_value(item) for item in value]
+    return str(value)
+
+
+def compact_fields(record, fields=COMPACT_FIELDS):
+    """
+    紧凑输出的字段
+
+    Returns:
+        list: [[字段编号, 原始值], ...]（只包含有值的字段）
+    """
+    values = []
+    for field in fields:
+        value = getattr(record, field)
+        if value is not None:
+            values.append([FIELD_IDS[field], compact_value(value)])
+    return values
+
+
+# ==================== 字段格式化 ====================
+
+def compile_output_plan(fields, config=Config):
+    """编译展示字段：(下标, 字段名, 中文名称, 格式化函数)"""
+    return tuple((FIELD_INDEX[field], field, config.EXIF_FIELD_MAPPING.get(field, field),
+                  config.SPECIAL_FIELDS.get(field))
+                 for field in fields)
+
+
+DEVICE_PLAN = compile_output_plan(DEVICE_FIELDS)
+TECHNICAL_PLAN = compile_output_plan(TECHNICAL_FIELDS)
+
+
+def format_fields(record, plan):
+    """
+    按展示计划格式化记录中的字段
+
+    Returns:
+        dict: 中文名称 -> 格式化后的值（只包含有值的字段）
+    """
+    info = {}
+    display = record.display
+    if display is None:
+        return info
+
+    for index, field, chinese_name, formatter in plan:
+        value = display[index]
+        if not value:
+            continue
+
+        # 应用特殊格式化
+        if callable(formatter):
+            try:
+                value = formatter(value)
+            except Exception as e:
+                print(f"格式化字段 {field} 时出错: {e}")
+                value = str(value)
+        elif isinstance(formatter, dict):
+            try:
+                # 对于字典映射，尝试转换为整数作为键
+                key = int(float(str(value)))
+                value = formatter.get(key, str(value))
+            except:
+                value = formatter.get(str(value), str(value))
+
+        info[chinese_name] = value
+    return info
@@ -0,0 +1,300 @@
+"""
+图片尺寸与格式探测 - 直接读取文件头，不通过PIL打开图片
+
+读取 JPEG SOFn、PNG IHDR、GIF逻辑屏幕描述符、BMP信息头和TIFF IFD0，
+返回宽、高、格式和颜色模式。格式和模式的命名与PIL保持一致，
+无法确定时返回None，由调用方回退到PIL。
+"""
+
+import struct
+from exif_parser import iter_jpeg_segments, parse_tiff, PNG_SIGNATURE
+
+# JPEG帧开始标记（SOF0-SOF15，不含DHT/JPG/DAC）
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7,
+                    0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# JPEG分量数 -> PIL模式
+JPEG_MODES = {1: 'L', 3: 'RGB', 4: 'CMYK'}
+
+# PNG (位深, 颜色类型) -> PIL模式
+PNG_MODES = {
+    (1, 0): '1', (2, 0): 'L', (4, 0): 'L', (8, 0): 'L', (16, 0): 'I',
+    (8, 2): 'RGB', (16, 2): 'RGB',
+    (1, 3): 'P', (2, 3): 'P', (4, 3): 'P', (8, 3): 'P',
+    (8, 4): 'LA', (16, 4): 'RGBA',
+    (8, 6): 'RGBA', (16, 6): 'RGBA',
+}
+
+# BMP位深 -> PIL模式（调色板图像可能进一步变为 '1' 或 'L'）
+BMP_MODES = {1: 'P', 4: 'P', 8: 'P', 16: 'RGB', 24: 'RGB', 32: 'RGB'}
+
+# BMP BITFIELDS 32位掩码中带alpha通道的布局
+BMP_ALPHA_MASKS = {
+    (0xFF000000, 0xFF0000, 0xFF00, 0xFF),
+    (0xFF, 0xFF00, 0xFF0000, 0xFF000000),
+    (0xFF0000, 0xFF00, 0xFF, 0xFF000000),
+    (0x0, 0x0, 0x0, 0x0),
+}
+BMP_OPAQUE_MASKS = {
+    (0xFF0000, 0xFF00, 0xFF, 0x0),
+    (0xFF000000, 0xFF0000, 0xFF00, 0x0),
+}
+
+# TIFF (光度解释, 位深, 附加样本) -> PIL模式
+TIFF_MODES = {
+    (0, (1,), ()): '1',
+    (1, (1,), ()): '1',
+    (0, (8,), ()): 'L',
+    (1, (8,), ()): 'L',
+    (2, (8, 8, 8), ()): 'RGB',
+    (2, (8, 8, 8, 8), (0,)): 'RGBX',
+    (2, (8, 8, 8, 8), (1,)): 'RGBa',
+    (2, (8, 8, 8, 8), (2,)): 'RGBA',
+    (3, (8,), ()): 'P',
+    (5, (8, 8, 8, 8), ()): 'CMYK',
+}
+
+MPF_HEADER = b'MPF\x00'
+MPF_NUMBER_OF_IMAGES = 0xB001
+
+# 识别格式所需的文件开头字节数（WebP的RIFF头最长）
+SNIFF_LENGTH = 12
+
+# 各格式（sniff_format 的结果）对应的文件扩展名
+FORMAT_EXTENSIONS = {
+    'JPEG': {'jpg', 'jpeg'},
+    'PNG': {'png'},
+    'GIF': {'gif'},
+    'BMP': {'bmp'},
+    'TIFF': {'tif', 'tiff'},
+    'WEBP': {'webp'},
+}
+
+# 不能携带EXIF的格式：分析时探测尺寸后直接返回
+METADATA_LESS_FORMATS = {'GIF', 'BMP'}
+
+
+def sniff_format(data):
+    """
+    按文件开头的魔数识别格式
+
+    Args:
+        data: 图片数据或文件开头（至少 SNIFF_LENGTH 字节才能识别所有格式）
+
+    Returns:
+        str: 'JPEG'、'PNG'、'GIF'、'BMP'、'TIFF' 或 'WEBP'（MPO归为JPEG），无法识别时返回None
+    """
+    head = bytes(data[:SNIFF_LENGTH])
+    if head[:3] == b'\xFF\xD8\xFF':
+        return 'JPEG'
+    if head[:8] == PNG_SIGNATURE:
+        return 'PNG'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'GIF'
+    if head[:2] == b'BM':
+        return 'BMP'
+    if head[:4] in (b'II*\x00', b'MM\x00*'):
+        return 'TIFF'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'WEBP'
+    return None
+
+
+def extension_matches(filename, image_format):
+    """文件扩展名是否与识别出的格式一致（无法识别的内容总是不一致）"""
+    if image_format is None or '.' not in filename:
+        return False
+    return filename.rsplit('.', 1)[1].lower() in FORMAT_EXTENSIONS[image_format]
+
+
+def probe_image(data, exif_tags=None, image_format=None):
+    """
+    从文件头探测图片基本信息
+
+    Args:
+        data: 图片数据或文件头（bytes/bytearray/memoryview）
+        exif_tags: 已解析的EXIF标签映射（TIFF格式复用IFD0，避免重复解析）
+        image_format: 已由 sniff_format 识别出的格式，None 时在这里识别
+
+    Returns:
+        dict: {'width', 'height', 'format', 'mode'}，无法确定时返回None
+    """
+    if image_format is None:
+        image_format = sniff_format(data)
+    try:
+        if image_format == 'JPEG':
+            return _probe_jpeg(data)
+        if image_format == 'PNG':
+            return _probe_png(data)
+        if image_format == 'GIF':
+            return _probe_gif(data)
+        if image_format == 'BMP':
+            return _probe_bmp(data)
+        if image_format == 'TIFF':
+            return _probe_tiff(data, exif_tags)
+    except (struct.error, IndexError, ValueError):
+        pass
+    return None
+
+
+def _image_info(width, height, image_format, mode):
+    """组装探测结果"""
+    if width <= 0 or height <= 0 or mode is None:
+        return None
+    return {'width': width, 'height': height, 'format': image_format, 'mode': mode}
+
+
+def _probe_jpeg(data):
+    """JPEG: 读取SOFn段；带多图MPF索引的文件PIL识别为MPO"""
+    image_format = 'JPEG'
+    for marker, offset, length in iter_jpeg_segments(data):
+        if marker == 0xE2 and bytes(data[offset:offset + 4]) == MPF_HEADER:
+            if _mpf_image_count(data, offset + 4, offset + length) > 1:
+                image_format = 'MPO'
+        elif marker in JPEG_SOF_MARKERS:
+            if length < 6 or data[offset] != 8:
+                return None
+            height, width = struct.unpack_from('>HH', data, offset + 1)
+            return _image_info(width, height, image_format, JPEG_MODES.get(data[offset + 5]))
+    return None
+
+
+def _mpf_image_count(data, start, end):
+    """读取APP2 MPF索引中的图像数量"""
+    byte_order = bytes(data[start:start + 2])
+    endian = '<' if byte_order == b'II' else '>'
+    ifd = start + struct.unpack_from(endian + 'L', data, start + 4)[0]
+    if ifd + 2 > end:
+        return 0
+    count = struct.unpack_from(endian + 'H', data, ifd)[0]
+    for index in range(count):
+        entry = ifd + 2 + index * 12
+        if entry + 12 > end:
+            break
+        tag, field_type, _ = struct.unpack_from(endian + 'HHL', data, entry)
+        if tag == MPF_NUMBER_OF_IMAGES and field_type == 4:
+            return struct.unpack_from(endian + 'L', data, entry + 8)[0]
+    return 0
+
+
+def _probe_png(data):
+    """PNG: 读取IHDR块"""
+    if bytes(data[12:16]) != b'IHDR':
+        return None
+    width, height, bit_depth, color_type = struct.unpack_from('>LLBB', data, 16)
+    return _image_info(width, height, 'PNG', PNG_MODES.get((bit_depth, color_type)))
+
+
+def _is_grey_palette(palette, entry_size, indices):
+    """调色板是否为灰度渐变（PIL会把这类图像当作灰度图）"""
+    for index, value in enumerate(indices):
+        start = index * entry_size
+        if bytes(palette[start:start + 3]) != bytes((value, value, value)):
+            return False
+    return True
+
+
+def _probe_gif(data):
+    """GIF: 逻辑屏幕描述符 + 第一帧的图像描述符（决定调色板和尺寸）"""
+    width, height = struct.unpack_from('<HH', data, 6)
+    flags = data[10]
+    pos = 13
+
+    global_palette = False
+    if flags & 0x80:
+        palette_size = 3 << ((flags & 0x07) + 1)
+        global_palette = not _is_grey_palette(data[pos:pos + palette_size], 3, range(palette_size // 3))
+        pos += palette_size
+
+    while pos < len(data):
+        block = data[pos]
+        if block == 0x21:
+            pos += 2
+            while True:
+                block_size = data[pos]
+                pos += 1 + block_size
+                if block_size == 0:
+                    break
+        elif block == 0x2C:
+            x0, y0, frame_width, frame_height = struct.unpack_from('<HHHH', data, pos + 1)
+            width = max(width, x0 + frame_width)
+            height = max(height, y0 + frame_height)
+            local_flags = data[pos + 9]
+            frame_palette = global_palette
+            if local_flags & 0x80:
+                palette_size = 3 << ((local_flags & 0x07) + 1)
+                local = data[pos + 10:pos + 10 + palette_size]
+                frame_palette = not _is_grey_palette(local, 3, range(palette_size // 3))
+            return _image_info(width, height, 'GIF', 'P' if frame_palette else 'L')
+        else:
+            break
+    return None
+
+
+def _probe_bmp(data):
+    """BMP: 读取信息头，调色板图像按PIL规则判断是否为灰度"""
+    header_size = struct.unpack_from('<L', data, 14)[0]
+    if header_size == 12:
+        width, height, _, bits = struct.unpack_from('<HHHH', data, 18)
+        compression, colors, palette_entry = 0, 0, 3
+    elif header_size in (40, 64, 108, 124):
+        width, raw_height, _, bits, compression = struct.unpack_from('<LLHHL', data, 18)
+        height = 2 ** 32 - raw_height if data[25] == 0xFF else raw_height
+        colors = struct.unpack_from('<L', data, 46)[0]
+        palette_entry = 4
+    else:
+        return None
+
+    mode = BMP_MODES.get(bits)
+    if mode is None:
+        return None
+
+    if compression == 3:
+        # 16/24位的位域布局较少见，交给PIL处理
+        if bits != 32:
+            return None
+        if header_size >= 56:
+            masks = struct.unpack_from('<LLLL', data, 54)
+        else:
+            masks = struct.unpack_from('<LLL', data, 54) + (0,)
+        if masks in BMP_ALPHA_MASKS:
+            mode = 'RGBA'
+        elif masks not in BMP_OPAQUE_MASKS:
+            return None
+    elif compression not in (0, 1, 2):
+        return None
+
+    if mode == 'P':
+        colors = colors or (1 << bits)
+        if not 0 < colors <= 65536:
+            return None
+        palette_start = 14 + header_size
+        palette = data[palette_start:palette_start + palette_entry * colors]
+        if len(palette) < palette_entry * colors:
+            return None
+        indices = (0, 255) if colors == 2 else range(colors)
+        if _is_grey_palette(palette, palette_entry, indices):
+            mode = '1' if colors == 2 else 'L'
+
+    return _image_info(width, height, 'BMP', mode)
+
+
+def _probe_tiff(data, exif_tags=None):
+    """TIFF: 从IFD0的尺寸和采样标签推断"""
+    tags = exif_tags if exif_tags is not None and exif_tags.byte_order else parse_tiff(data)
+    if 'ImageWidth' not in tags.primary or 'ImageLength' not in tags.primary:
+        return None
+    sample_format = tags.get('SampleFormat', 1)
+    if any(value != 1 for value in (sample_format if isinstance(sample_format, tuple) else (sample_format,))):
+        return None
+
+    bits = tags.get('BitsPerSample', 1)
+    bits = bits if isinstance(bits, tuple) else (bits,)
+    samples = tags.get('SamplesPerPixel', 1)
+    if len(bits) == 1 and samples > 1:
+        bits = bits * samples
+    extra = tags.get('ExtraSamples', ())
+    extra = extra if isinstance(extra, tuple) else (extra,)
+
+    mode = TIFF_MODES.get((tags.get('PhotometricInterpretation'), bits, extra))
+    return _image_info(tags['ImageWidth'], tags['ImageLength'], 'TIFF', mode)
@@ -0,0 +1,480 @@
+"""
+服务指标 - Prometheus文本格式（/metrics）
+
+指标保存在进程内的注册表中，每次更新只是一次加锁的字典操作。
+
+多个服务进程（如 gunicorn -w 4）时设置 Config.METRICS_DIR：
+每个进程每隔 METRICS_EXPORT_INTERVAL 秒把自己的快照写入该目录下的一个文件，
+/metrics 读取目录中所有快照后合并，无论请求落到哪个进程，看到的都是全部进程的总和：
+- 计数器和直方图跨进程求和，已退出进程的累计值保留（与 prometheus_client 的多进程模式一致）
+- 仪表（进行中的请求、工作池中的任务数）只合并最近仍在写入快照的进程
+- 已退出进程的快照在合并时并入归档文件后删除（类似 prometheus_client 的 mark_process_dead），
+  快照文件数不随进程重启和工作进程重建增长
+
+fork出的子进程（预加载应用的服务进程、批量分析的工作进程）清空继承的数值，只报告自己的部分。
+"""
+
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+from result_cache import get_result_cache
+
+# 请求耗时的直方图分桶（秒）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 分析阶段耗时的直方图分桶（秒）
+STAGE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+# 快照超过该倍数的导出间隔没有更新时，认为进程已退出，不再合并其仪表，并把计数器和直方图并入归档
+STALE_INTERVALS = 3
+# 已退出进程累计值的归档文件，以及并入归档时使用的锁文件（同一时间只有一个进程归档）
+ARCHIVE_FILENAME = 'archived-metrics.json'
+ARCHIVE_LOCK_FILENAME = 'archived-metrics.lock'
+
+
+# ==================== 指标类型 ====================
+
+class _Metric:
+    """一个指标及其各标签组合的值"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+    def samples(self):
+        """[(标签值元组, 值)]，值的格式由指标类型决定"""
+        with self._lock:
+            return [(labels, self._copy(value)) for labels, value in self._values.items()]
+
+    @staticmethod
+    def _copy(value):
+        return value
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def set(self, value, *labels):
+        """从其他统计（如缓存的命中数）同步累计值"""
+        with self._lock:
+            self._values[labels] = value
+
+
+class Gauge(_Metric):
+    """可增可减的当前值"""
+
+    kind = 'gauge'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    """分桶直方图：各桶的计数（不累计）、总和与次数"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        # 第一个不小于 value 的上界；超过所有上界时落入 +Inf 桶
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @staticmethod
+    def _copy(value):
+        return [list(value[0]), value[1], value[2]]
+
+
+# ==================== 注册表 ====================
+
+class MetricsRegistry:
+    """进程内的全部指标；collectors 在生成快照前调用，用于同步其他模块自己维护的统计"""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+        self.started = time.time_ns()
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+        return collector
+
+    def reset(self):
+        """清空所有数值（fork出的子进程调用）"""
+        for metric in self.metrics:
+            metric.reset()
+        self.started = time.time_ns()
+
+    def snapshot(self):
+        """可序列化为JSON的快照：{指标名: [[标签值列表, 值], ...]}"""
+        for collector in self.collectors:
+            try:
+                collector()
+            except Exception as e:
+                print(f"收集指标时出错: {e}")
+        return {metric.name: [[list(labels), value] for labels, value in metric.samples()]
+                for metric in self.metrics}
+
+    def snapshot_path(self, directory):
+        """本进程的快照文件（包含进程启动时间，进程号被复用时不会覆盖已退出进程的累计值）"""
+        return os.path.join(directory, f'metrics-{os.getpid()}-{self.started}.json')
+
+    def write_snapshot(self, directory):
+        """原子地写入本进程的快照"""
+        path = self.snapshot_path(directory)
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'time': time.time(), 'metrics': self.snapshot()}, f)
+        os.replace(temp_path, path)
+
+    def collect(self, directory=None, interval=1.0):
+        """
+        合并本进程和目录中其他进程的快照
+
+        Returns:
+            dict: 指标名 -> {标签值元组: 值}
+        """
+        kinds = {metric.name: metric.kind for metric in self.metrics}
+        snapshots = [(self.snapshot(), True)]
+
+        if directory and os.path.isdir(directory):
+            own = os.path.basename(self.snapshot_path(directory))
+            now = time.time()
+            # 先读归档：其中记录的快照已经并入，删除之前仍可能留在目录中
+            archive = _read_snapshot(directory, ARCHIVE_FILENAME) or {}
+            folded = set(archive.get('folded', ()))
+            snapshots.append((archive.get('metrics', {}), False))
+            stale = []
+            for filename in os.listdir(directory):
+                if filename == own or filename in folded or not _is_snapshot(filename):
+                    continue
+                data = _read_snapshot(directory, filename)
+                if data is None:
+                    continue
+                live = now - data.get('time', 0) <= interval * STALE_INTERVALS
+                snapshots.append((data.get('metrics', {}), live))
+                if not live:
+                    stale.append(filename)
+            if stale:
+                _archive_snapshots(directory, kinds, stale, interval)
+
+        return _merge_snapshots(kinds, snapshots)
+
+    def render(self, directory=None, interval=1.0):
+        """Prometheus文本格式（0.0.4）"""
+        merged = self.collect(directory, interval)
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for labels, value in sorted(merged[metric.name].items()):
+                pairs = list(zip(metric.labelnames, labels))
+                if metric.kind != 'histogram':
+                    lines.append(f'{metric.name}{_labels(pairs)} {_number(value)}')
+                    continue
+                buckets, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(metric.buckets + (float('inf'),), buckets):
+                    cumulative += bucket_count
+                    le = '+Inf' if bound == float('inf') else _number(bound)
+                    lines.append(f'{metric.name}_bucket{_labels(pairs + [("le", le)])} {cumulative}')
+                lines.append(f'{metric.name}_sum{_labels(pairs)} {_number(total)}')
+                lines.append(f'{metric.name}_count{_labels(pairs)} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _is_snapshot(filename):
+    return filename.startswith('metrics-') and filename.endswith('.json')
+
+
+def _read_snapshot(directory, filename):
+    """读取快照或归档文件，不存在或无法读取时返回None"""
+    try:
+        with open(os.path.join(directory, filename), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"读取指标快照 {filename} 时出错: {e}")
+        return None
+
+
+def _merge_snapshots(kinds, snapshots):
+    """
+    合并快照
+
+    Args:
+        kinds: 指标名 -> 类型
+        snapshots: (快照中的指标, 进程是否仍在运行) 列表；已退出进程的仪表不计入
+
+    Returns:
+        dict: 指标名 -> {标签值元组: 值}
+    """
+    merged = {name: {} for name in kinds}
+    for metrics, live in snapshots:
+        for name, samples in metrics.items():
+            kind = kinds.get(name)
+            if kind is None or (kind == 'gauge' and not live):
+                continue
+            values = merged[name]
+            for labels, value in samples:
+                labels = tuple(labels)
+                values[labels] = _merge_value(kind, values.get(labels), value)
+    return merged
+
+
+def _archive_snapshots(directory, kinds, filenames, interval):
+    """
+    把已退出进程的快照并入归档文件后删除
+
+    归档先原子地替换，再删除快照；归档中记录本次并入的文件名，
+    其他进程在删除完成前读到新归档时跳过这些文件，不会重复计入。
+    其他进程正在归档时跳过（下次合并时再归档）。
+    """
+    lock_path = os.path.join(directory, ARCHIVE_LOCK_FILENAME)
+    try:
+        lock = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        # 持有锁的进程在归档过程中退出时，锁文件过期后删除
+        try:
+            if time.time() - os.path.getmtime(lock_path) > interval * STALE_INTERVALS:
+                os.remove(lock_path)
+        except OSError:
+            pass
+        return
+    except OSError as e:
+        print(f"归档指标快照时出错: {e}")
+        return
+
+    try:
+        # 持有锁之后重新读取，只并入仍然存在、且没有被其他进程并入的快照
+        archive = _read_snapshot(directory, ARCHIVE_FILENAME) or {}
+        folded = set(archive.get('folded', ()))
+        snapshots = [(archive.get('metrics', {}), False)]
+        archived = []
+        for filename in filenames:
+            data = None if filename in folded else _read_snapshot(directory, filename)
+            if data is not None:
+                snapshots.append((data.get('metrics', {}), False))
+                archived.append(filename)
+        if not archived:
+            return
+
+        merged = _merge_snapshots(kinds, snapshots)
+        path = os.path.join(directory, ARCHIVE_FILENAME)
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'time': time.time(), 'folded': archived,
+                       'metrics': {name: [[list(labels), value] for labels, value in values.items()]
+                                   for name, values in merged.items() if values}}, f)
+        os.replace(temp_path, path)
+        for filename in archived:
+            try:
+                os.remove(os.path.join(directory, filename))
+            except FileNotFoundError:
+                pass
+    except OSError as e:
+        print(f"归档指标快照时出错: {e}")
+    finally:
+        os.close(lock)
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
+
+
+def _merge_value(kind, current, value):
+    if current is None:
+        return Histogram._copy(value) if kind == 'histogram' else value
+    if kind == 'histogram':
+        return [[a + b for a, b in zip(current[0], value[0])], current[1] + value[1], current[2] + value[2]]
+    return current + value
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+# ==================== 服务指标 ====================
+
+REGISTRY = MetricsRegistry()
+
+REQUESTS = REGISTRY.register(Counter(
+    'photo_requests_total', '按端点和结果统计的请求数', ('endpoint', 'outcome')))
+REQUEST_DURATION = REGISTRY.register(Histogram(
+    'photo_request_duration_seconds', '请求处理耗时（秒）', ('endpoint',), LATENCY_BUCKETS))
+REQUESTS_IN_PROGRESS = REGISTRY.register(Gauge(
+    'photo_requests_in_progress', '正在处理的请求数', ('endpoint',)))
+INGESTED_BYTES = REGISTRY.register(Counter(
+    'photo_ingested_bytes_total', '接收的请求体字节数', ('endpoint',)))
+STAGE_DURATION = REGISTRY.register(Histogram(
+    'photo_stage_duration_seconds', '分析流程各阶段的耗时（秒，见 stage_timing.STAGES）', ('stage',), STAGE_BUCKETS))
+INTEGRITY_VERDICTS = REGISTRY.register(Counter(
+    'photo_integrity_verdicts_total', '完整性检查结论（modified/clean/unchecked）', ('verdict',)))
+POOL_PENDING = REGISTRY.register(Gauge(
+    'photo_pool_pending_tasks', '已提交到工作池、尚未完成的分析任务数', ('pool',)))
+CACHE_LOOKUPS = REGISTRY.register(Counter(
+    'photo_result_cache_lookups_total', '结果缓存的查找次数（hit/shared_hit/miss）', ('result',)))
+CACHE_BYTES = REGISTRY.register(Gauge(
+    'photo_result_cache_bytes', '进程内结果缓存占用的字节数'))
+ADMISSION_WAITING = REGISTRY.register(Gauge(
+    'photo_admission_waiting', '排队等待准入的请求数', ('gate',)))
+ADMISSION_RESERVED_BYTES = REGISTRY.register(Gauge(
+    'photo_admission_reserved_bytes', '已放行的请求占用的字节预算', ('gate',)))
+ADMISSION_SHED = REGISTRY.register(Counter(
+    'photo_admission_shed_total', '超出准入预算被拒绝的请求数（queue_full/timeout）', ('gate', 'reason')))
+
+
+@REGISTRY.add_collector
+def _collect_cache_stats():
+    """结果缓存自己维护命中统计，生成快照时同步"""
+    cache = get_result_cache()
+    if cache is None:
+        return
+    stats = cache.stats()
+    for key, result in (('hits', 'hit'), ('shared_hits', 'shared_hit'), ('misses', 'miss')):
+        CACHE_LOOKUPS.set(stats[key], result)
+    CACHE_BYTES.set(stats['bytes'])
+
+
+def request_outcome(status):
+    """按状态码归类请求结果"""
+    if status < 400:
+        return 'ok'
+    if status == 413:
+        return 'too_large'
+    if status in (429, 503):
+        return 'overloaded'
+    if status < 500:
+        return 'rejected'
+    return 'error'
+
+
+def observe_request(endpoint, status, elapsed, received_bytes=None):
+    """记录一个已完成的请求"""
+    REQUESTS.inc(endpoint, request_outcome(status))
+    REQUEST_DURATION.observe(elapsed, endpoint)
+    if received_bytes:
+        INGESTED_BYTES.inc(endpoint, amount=received_bytes)
+
+
+def observe_stages(timings):
+    """记录一个请求中各分析阶段的耗时（stage_timing.StageTimings，不含 total）"""
+    for name, elapsed in timings.durations.items():
+        if name != 'total':
+            STAGE_DURATION.observe(elapsed, name)
+
+
+def observe_result(result):
+    """记录分析结果的完整性结论（完整结果和紧凑结果都适用）"""
+    integrity = result.get('integrity_check') or {}
+    if not result.get('success') or 'is_modified' not in integrity:
+        verdict = 'unchecked'
+    else:
+        verdict = 'modified' if integrity['is_modified'] else 'clean'
+    INTEGRITY_VERDICTS.inc(verdict)
+
+
+def render_metrics(directory=None, interval=1.0):
+    """/metrics 的响应内容"""
+    return REGISTRY.render(directory, interval)
+
+
+# ==================== 多进程导出 ====================
+
+_exporter = None
+
+
+def start_exporter(directory, interval=1.0):
+    """
+    启动后台线程，定期把本进程的快照写入 directory（每个进程调用一次；fork后在子进程中自动重启）
+    """
+    global _exporter
+    if not directory:
+        return None
+    if _exporter is not None and _exporter[0] == os.getpid():
+        return _exporter[1]
+    os.makedirs(directory, exist_ok=True)
+    stop = threading.Event()
+
+    def export():
+        while not stop.wait(interval):
+            try:
+                REGISTRY.write_snapshot(directory)
+            except OSError as e:
+                print(f"写入指标快照时出错: {e}")
+
+    thread = threading.Thread(target=export, name='metrics-exporter', daemon=True)
+    thread.start()
+    _exporter = (os.getpid(), thread, directory, interval)
+    return thread
+
+
+def _flush_on_exit():
+    if _exporter is not None and _exporter[0] == os.getpid():
+        try:
+            REGISTRY.write_snapshot(_exporter[2])
+        except OSError:
+            pass
+
+
+def _after_fork():
+    """子进程不继承父进程的数值；父进程启动过导出线程时在子进程中重新启动"""
+    REGISTRY.reset()
+    if _exporter is not None:
+        start_exporter(_exporter[2], _exporter[3])
+
+
+atexit.register(_flush_on_exit)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
@@ -1,262 +1,261 @@
 from PIL import Image
 from PIL.ExifTags import TAGS
 import exifread
+import copy
 import os
-import io
 from datetime import datetime
+from functools import partial
 from config import Config
-from exif_integrity_checker import check_exif_integrity
+from exif_integrity_checker import MESSAGES, Finding, check_exif_integrity, compact_integrity
+from exif_parser import parse_exif, ExifTags
+from field_plan import (
+    build_record, read_signals, format_fields, compact_fields, DEVICE_PLAN, TECHNICAL_PLAN,
+    FIELD_IDS
+)
+from image_probe import probe_image, sniff_format, METADATA_LESS_FORMATS
+from stream_ingest import read_image_header, open_shared_buffer, BufferReader
+from result_cache import get_result_cache, content_key
+from result_store import cached_file_result
+from stage_timing import stage
+from thumbnail_check import has_image_data
 
 # ==================== 主要分析函数 ====================
 
-def analyze_photo_from_stream(file_stream):
+def analyze_photo_from_stream(file_stream, compact=False):
     """
     从文件流中分析照片的EXIF数据，提取设备信息
 
+    只按块读取到元数据结束为止（JPEG读到SOS段），不会把整个文件读入内存。
+
     Args:
         file_stream: Flask文件对象
+        compact: 为True时返回紧凑结果（见 analyze_photo_data）
 
     Returns:
         dict: 包含设备信息的字典
     """
-    result = {
-        'success': False,
-        'device_info': {},
-        'technical_info': {},
-        'integrity_check': {},
-        'error': None
-    }
-
     try:
-        # 读取文件内容到内存
         file_stream.seek(0)  # 确保从文件开头读取
-        file_content = file_stream.read()
-
-        # 创建BytesIO对象用于PIL
-        image_io = io.BytesIO(file_content)
-
-        # 创建BytesIO对象用于exifread
-        exifread_io = io.BytesIO(file_content)
-
-        # 使用PIL读取EXIF数据
-        pil_data = extract_exif_with_pil_stream(image_io)
-
-        # 使用exifread读取更详细的EXIF数据
-        exifread_data = extract_exif_with_exifread_stream(exifread_io)
-
-        # 合并数据
-        device_info = {}
-        technical_info = {}
-
-        # 提取设备信息
-        device_fields = ['Make', 'Model', 'Software', 'LensModel', 'LensMake']
-        for field in device_fields:
-            value = None
-            if field in pil_data:
-                value = pil_data[field]
-            elif f'Image {field}' in exifread_data:
-                value = str(exifread_data[f'Image {field}'])
-            elif f'EXIF {field}' in exifread_data:
-                value = str(exifread_data[f'EXIF {field}'])
-
-            if value:
-                chinese_name = Config.EXIF_FIELD_MAPPING.get(field, field)
-                device_info[chinese_name] = value
-
-        # 提取技术信息
-        technical_fields = ['DateTime', 'DateTimeOriginal', 'ExposureTime', 'FNumber',
-                          'ISOSpeedRatings', 'FocalLength', 'Flash', 'WhiteBalance',
-                          'ExposureMode', 'MeteringMode', 'Orientation']
-
-        for field in technical_fields:
-            value = None
-            if field in pil_data:
-                value = pil_data[field]
-            elif f'EXIF {field}' in exifread_data:
-                value = str(exifread_data[f'EXIF {field}'])
-            elif f'Image {field}' in exifread_data:
-                value = str(exifread_data[f'Image {field}'])
-
-            if value:
-                # 应用特殊格式化
-                if field in Config.SPECIAL_FIELDS:
-                    formatter = Config.SPECIAL_FIELDS[field]
-                    if callable(formatter):
-                        try:
-                            value = formatter(value)
-                        except Exception as e:
-                            print(f"格式化字段 {field} 时出错: {e}")
-                            value = str(value)
-                    elif isinstance(formatter, dict):
-                        try:
-                            # 对于字典映射，尝试转换为整数作为键
-                            key = int(float(str(value)))
-                            value = formatter.get(key, str(value))
-                        except:
-                            value = formatter.get(str(value), str(value))
+        with stage('read'):
+            file_content = read_image_header(file_stream,
+                                             chunk_size=Config.INGEST_CHUNK_SIZE,
+                                             max_size=Config.MAX_CONTENT_LENGTH)
+    except Exception as e:
+        result = _new_result(compact)
+        result['error'] = f'分析照片时出错: {str(e)}'
+        return result
 
-                chinese_name = Config.EXIF_FIELD_MAPPING.get(field, field)
-                technical_info[chinese_name] = value
+    return analyze_photo_data(file_content, compact)
 
-        # 获取图片基本信息
-        try:
-            image_io.seek(0)  # 重置到开头
-            with Image.open(image_io) as img:
-                technical_info['图片尺寸'] = f"{img.width} x {img.height}"
-                technical_info['图片格式'] = img.format
-                if hasattr(img, 'mode'):
-                    technical_info['颜色模式'] = img.mode
-        except Exception as e:
-            print(f"获取图片基本信息时出错: {e}")
+def analyze_photo_data(file_content, compact=False):
+    """
+    分析内存中的照片数据（完整文件或 read_image_header 得到的文件头部）
+
+    相同文件头部的分析结果会被缓存，命中时直接返回，不再解析。
+
+    Args:
+        file_content: 图片数据（bytes或只读memoryview，各阶段只读取切片，不复制）
+        compact: 为True时返回紧凑结果：字段为 [字段编号, 原始值]，图片信息为 [宽, 高, 格式, 颜色模式]，
+                 指标和警告为 [编号, 参数...]，不含中文名称和文本（编号见 compact_schema）
+
+    Returns:
+        dict: 包含设备信息的字典
+    """
+    cache = get_result_cache()
+    if cache is None:
+        return _analyze_photo_data(file_content, compact)
+
+    # 比较缩略图时结果取决于像素数据，缓存键覆盖完整文件
+    with stage('cache'):
+        key = content_key(file_content, full=has_image_data(file_content))
+        if compact:
+            key += b'compact'
+        result = cache.get(key)
+    if result is None:
+        result = _analyze_photo_data(file_content, compact)
+        if result['success']:
+            cache.put(key, result)
+    return result
+
+def _analyze_photo_data(file_content, compact=False):
+    """解析EXIF、格式化字段并检查完整性（不经过缓存）"""
+    result = _new_result(compact)
+
+    try:
+        # 按文件开头的字节识别格式；GIF、BMP不能携带EXIF，探测尺寸后直接返回
+        image_format = sniff_format(file_content)
+        if image_format in METADATA_LESS_FORMATS:
+            image_info = _probe_image_info(file_content, None, image_format)
+            return _finish_result(result, build_record(ExifTags()), image_info, _no_exif_integrity(), compact)
+
+        # 单次解析EXIF，得到统一的标签映射
+        # 按解析计划生成字段记录，提取、格式化和完整性检查共用
+        with stage('parse'):
+            exif_tags = parse_exif(file_content)
+            record = build_record(exif_tags)
+
+        # 同一份头部数据中的量化表等信号一并读入记录
+        # 完整文件还会比较嵌入的缩略图与主图（需启用 THUMBNAIL_CHECK）
+        with stage('signals'):
+            read_signals(record, file_content, exif_tags.thumbnail)
+
+        image_info = _probe_image_info(file_content, exif_tags, image_format)
 
         # 执行EXIF完整性检查（使用已解析的数据，避免重复解析）
         try:
-            integrity_result = check_exif_integrity(pil_data, exifread_data)
-            result['integrity_check'] = integrity_result
+            with stage('integrity'):
+                integrity_result = check_exif_integrity(record)
         except Exception as e:
             print(f"EXIF完整性检查时出错: {e}")
-            result['integrity_check'] = {
+            integrity_result = {
                 'is_modified': False,
                 'confidence': 0.0,
                 'indicators': [],
-                'warnings': [f'完整性检查失败: {str(e)}'],
+                'warnings': [Finding('integrity_check_failed', str(e))],
                 'details': {}
             }
 
-        result['device_info'] = device_info
-        result['technical_info'] = technical_info
-        result['success'] = True
-
-        # 如果没有找到设备信息，提供提示
-        if not device_info:
-            result['error'] = '未能从照片中提取到设备信息，可能是因为：\n1. 照片没有EXIF数据\n2. EXIF数据已被清除\n3. 照片格式不支持EXIF'
+        return _finish_result(result, record, image_info, integrity_result, compact)
 
     except Exception as e:
         result['error'] = f'分析照片时出错: {str(e)}'
 
     return result
 
-def analyze_photo(image_path):
+def _probe_image_info(file_content, exif_tags, image_format):
+    """获取图片基本信息（直接读取文件头，无法识别时才回退到PIL）"""
+    try:
+        with stage('probe'):
+            image_info = probe_image(file_content, exif_tags, image_format)
+            if image_info is None:
+                image_info = probe_image_with_pil(file_content)
+        return image_info
+    except Exception as e:
+        print(f"获取图片基本信息时出错: {e}")
+        return None
+
+def _no_exif_integrity():
+    """没有EXIF的文件的完整性检查结果（只计算一次，每次返回副本）"""
+    global _NO_EXIF_INTEGRITY
+    if _NO_EXIF_INTEGRITY is None:
+        _NO_EXIF_INTEGRITY = check_exif_integrity(build_record(ExifTags()))
+    return copy.deepcopy(_NO_EXIF_INTEGRITY)
+
+_NO_EXIF_INTEGRITY = None
+
+def _finish_result(result, record, image_info, integrity_result, compact):
+    """把字段记录、图片信息和完整性检查结果格式化为分析结果"""
+    if compact:
+        # 紧凑结果不经过展示格式化，也不生成提示文本
+        with stage('format'):
+            result['fields'] = compact_fields(record)
+            if image_info is not None:
+                result['image'] = [image_info['width'], image_info['height'],
+                                   image_info['format'], image_info['mode']]
+            result['integrity_check'] = compact_integrity(integrity_result)
+        result['success'] = True
+        return result
+
+    with stage('format'):
+        device_info = format_fields(record, DEVICE_PLAN)
+        technical_info = format_fields(record, TECHNICAL_PLAN)
+        if image_info is not None:
+            technical_info['图片尺寸'] = f"{image_info['width']} x {image_info['height']}"
+            technical_info['图片格式'] = image_info['format']
+            if image_info['mode']:
+                technical_info['颜色模式'] = image_info['mode']
+
+    result['integrity_check'] = integrity_result
+    result['device_info'] = device_info
+    result['technical_info'] = technical_info
+    result['success'] = True
+
+    # 如果没有找到设备信息，提供提示
+    if not device_info:
+        result['error'] = '未能从照片中提取到设备信息，可能是因为：\n1. 照片没有EXIF数据\n2. EXIF数据已被清除\n3. 照片格式不支持EXIF'
+    return result
+
+def _new_result(compact=False):
+    """创建空的分析结果"""
+    if compact:
+        return {
+            'success': False,
+            'fields': [],
+            'image': None,
+            'integrity_check': {},
+            'error': None
+        }
+    return {
+        'success': False,
+        'device_info': {},
+        'technical_info': {},
+        'integrity_check': {},
+        'error': None
+    }
+
+def analyze_photo(image_path, compact=False):
     """
     分析照片的EXIF数据，提取设备信息
+
+    文件以只读mmap方式映射，各解析阶段直接读取映射内存的切片。
+    启用结果存储时，未变化的文件直接返回上次的结果。
     
     Args:
         image_path (str): 图片文件路径
+        compact: 为True时返回紧凑结果（见 analyze_photo_data）
         
     Returns:
         dict: 包含设备信息的字典
     """
-    result = {
-        'success': False,
-        'device_info': {},
-        'technical_info': {},
-        'integrity_check': {},
-        'error': None
-    }
+    if compact:
+        return cached_file_result(image_path, 'analysis-compact', partial(_analyze_photo_file, compact=True))
+    return cached_file_result(image_path, 'analysis', _analyze_photo_file)
+
+def _analyze_photo_file(image_path, compact=False):
+    """映射文件并分析（不经过结果存储）"""
+    result = _new_result(compact)
     
     try:
         # 检查文件是否存在
         if not os.path.exists(image_path):
             result['error'] = '文件不存在'
             return result
-        
-        # 使用PIL读取EXIF数据
-        pil_data = extract_exif_with_pil(image_path)
-        
-        # 使用exifread读取更详细的EXIF数据
-        exifread_data = extract_exif_with_exifread(image_path)
-        
-        # 合并数据
-        device_info = {}
-        technical_info = {}
-        
-        # 提取设备信息
-        device_fields = ['Make', 'Model', 'Software', 'LensModel', 'LensMake']
-        for field in device_fields:
-            value = None
-            if field in pil_data:
-                value = pil_data[field]
-            elif f'Image {field}' in exifread_data:
-                value = str(exifread_data[f'Image {field}'])
-            elif f'EXIF {field}' in exifread_data:
-                value = str(exifread_data[f'EXIF {field}'])
-
-            if value:
-                chinese_name = Config.EXIF_FIELD_MAPPING.get(field, field)
-                device_info[chinese_name] = value
-        
-        # 提取技术信息
-        technical_fields = ['DateTime', 'DateTimeOriginal', 'ExposureTime', 'FNumber',
-                          'ISOSpeedRatings', 'FocalLength', 'Flash', 'WhiteBalance',
-                          'ExposureMode', 'MeteringMode', 'Orientation']
-
-        for field in technical_fields:
-            value = None
-            if field in pil_data:
-                value = pil_data[field]
-            elif f'EXIF {field}' in exifread_data:
-                value = str(exifread_data[f'EXIF {field}'])
-            elif f'Image {field}' in exifread_data:
-                value = str(exifread_data[f'Image {field}'])
-
-            if value:
-                # 应用特殊格式化
-                if field in Config.SPECIAL_FIELDS:
-                    formatter = Config.SPECIAL_FIELDS[field]
-                    if callable(formatter):
-                        try:
-                            value = formatter(value)
-                        except Exception as e:
-                            print(f"格式化字段 {field} 时出错: {e}")
-                            value = str(value)
-                    elif isinstance(formatter, dict):
-                        try:
-                            # 对于字典映射，尝试转换为整数作为键
-                            key = int(float(str(value)))
-                            value = formatter.get(key, str(value))
-                        except:
-                            value = formatter.get(str(value), str(value))
 
-                chinese_name = Config.EXIF_FIELD_MAPPING.get(field, field)
-                technical_info[chinese_name] = value
-        
-        # 获取图片基本信息
-        try:
-            with Image.open(image_path) as img:
-                technical_info['图片尺寸'] = f"{img.width} x {img.height}"
-                technical_info['图片格式'] = img.format
-                if hasattr(img, 'mode'):
-                    technical_info['颜色模式'] = img.mode
-        except Exception as e:
-            print(f"获取图片基本信息时出错: {e}")
-
-        # 执行EXIF完整性检查（使用已解析的数据，避免重复解析）
-        try:
-            integrity_result = check_exif_integrity(pil_data, exifread_data)
-            result['integrity_check'] = integrity_result
-        except Exception as e:
-            print(f"EXIF完整性检查时出错: {e}")
-            result['integrity_check'] = {
-                'is_modified': False,
-                'confidence': 0.0,
-                'indicators': [],
-                'warnings': [f'完整性检查失败: {str(e)}'],
-                'details': {}
-            }
-
-        result['device_info'] = device_info
-        result['technical_info'] = technical_info
-        result['success'] = True
-        
-        # 如果没有找到设备信息，提供提示
-        if not device_info:
-            result['error'] = '未能从照片中提取到设备信息，可能是因为：\n1. 照片没有EXIF数据\n2. EXIF数据已被清除\n3. 照片格式不支持EXIF'
+        with open_shared_buffer(image_path) as buffer:
+            return analyze_photo_data(buffer, compact)
         
     except Exception as e:
         result['error'] = f'分析照片时出错: {str(e)}'
     
     return result
 
+def compact_schema(config=Config):
+    """
+    紧凑结果中的编号说明，客户端据此还原字段名称和提示文本
+
+    Returns:
+        dict: {'fields': {字段编号: [字段名, 中文名称]}, 'messages': {编号: [名称, 文本模板]}}
+    """
+    return {
+        'fields': {field_id: [field, config.EXIF_FIELD_MAPPING.get(field, field)]
+                   for field, field_id in FIELD_IDS.items()},
+        'messages': {code: [name, template] for name, (code, template, _) in MESSAGES.items()},
+    }
+
+def probe_image_with_pil(file_content):
+    """使用PIL获取图片基本信息（image_probe 无法识别的格式）"""
+    # 在共享缓冲区上读取，不复制整个文件
+    with BufferReader(file_content) as reader, Image.open(reader) as img:
+        return {
+            'width': img.width,
+            'height': img.height,
+            'format': img.format,
+            'mode': getattr(img, 'mode', None),
+        }
+
+# ==================== 旧版解析函数 ====================
+# 分析流程已改用 exif_parser 的单次解析，以下函数保留用于兼容旧调用方和结果对比
+
 def extract_exif_with_pil(image_path):
     """使用PIL提取EXIF数据"""
     exif_data = {}
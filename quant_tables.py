@@ -0,0 +1,255 @@
+"""
+JPEG量化表指纹 - 只读取DQT段，不解码像素
+
+相机、手机和编辑软件各自使用固定的量化表，重新保存或重新压缩后量化表随之改变。
+EXIF文本可以随意改写，量化表却很少有人伪造，因此量化表的哈希可以作为独立的信号。
+
+DQT段位于SOS之前，流式读取的头部数据中已经包含；读取只需遍历几个标记段，
+对同一份头部数据操作，不增加额外的读取。
+
+已知量化表的索引由两部分组成：
+1. IJG（libjpeg）标准表按质量1-100缩放得到的表，大多数编码库和很多软件的默认输出
+2. data/quant_tables.csv 中从参考照片采集的相机、手机和编辑软件的量化表（用 learn 命令添加）
+
+采集:
+    python quant_tables.py learn --kind camera --make apple --model "iPhone 13 Pro" 参考照片.jpg ...
+    python quant_tables.py learn --kind editor --label "Adobe Photoshop 质量12" 导出的照片.jpg ...
+查看:
+    python quant_tables.py show 照片.jpg
+"""
+
+import argparse
+import csv
+import hashlib
+import os
+import struct
+import sys
+from collections import namedtuple
+from config import Config
+from device_catalog import model_key
+from exif_parser import iter_jpeg_segments
+
+# JPEG标准（ITU T.81 附录K）中的亮度和色度量化表（按行排列）
+STANDARD_LUMINANCE = (
+    16, 11, 10, 16, 24, 40, 51, 61,
+    12, 12, 14, 19, 26, 58, 60, 55,
+    14, 13, 16, 24, 40, 57, 69, 56,
+    14, 17, 22, 29, 51, 87, 80, 62,
+    18, 22, 37, 56, 68, 109, 103, 77,
+    24, 35, 55, 64, 81, 104, 113, 92,
+    49, 64, 78, 87, 103, 121, 120, 101,
+    72, 92, 95, 98, 112, 100, 103, 99,
+)
+STANDARD_CHROMINANCE = (
+    17, 18, 24, 47, 99, 99, 99, 99,
+    18, 21, 26, 66, 99, 99, 99, 99,
+    24, 26, 56, 99, 99, 99, 99, 99,
+    47, 66, 99, 99, 99, 99, 99, 99,
+    99, 99, 99, 99, 99, 99, 99, 99,
+    99, 99, 99, 99, 99, 99, 99, 99,
+    99, 99, 99, 99, 99, 99, 99, 99,
+    99, 99, 99, 99, 99, 99, 99, 99,
+)
+
+# DQT段中的系数按之字形顺序保存：ZIGZAG[i] 为第i个系数在按行排列中的位置
+ZIGZAG = (
+    0, 1, 8, 16, 9, 2, 3, 10, 17, 24, 32, 25, 18, 11, 4, 5,
+    12, 19, 26, 33, 40, 48, 41, 34, 27, 20, 13, 6, 7, 14, 21, 28,
+    35, 42, 49, 56, 57, 50, 43, 36, 29, 22, 15, 23, 30, 37, 44, 51,
+    58, 59, 52, 45, 38, 31, 39, 46, 53, 60, 61, 54, 47, 55, 62, 63,
+)
+
+# 索引条目：kind 为 camera（相机/手机原图）、editor（编辑软件）或 encoder（通用编码库）
+QuantEntry = namedtuple('QuantEntry', ['kind', 'make', 'model', 'label'])
+
+INDEX_FIELDS = ('fingerprint', 'kind', 'make', 'model', 'label')
+
+
+# ==================== 读取与指纹 ====================
+
+def read_quantization_tables(data):
+    """
+    读取JPEG中的全部量化表
+
+    Args:
+        data: 图片数据（bytes/bytearray/memoryview，头部即可）
+
+    Returns:
+        dict: 表编号 -> (精度, 64个系数的元组，按文件中的之字形顺序)；不是JPEG或没有DQT段时为空
+    """
+    tables = {}
+    for marker, offset, length in iter_jpeg_segments(data):
+        if marker != 0xDB:
+            continue
+        pos = offset
+        end = min(offset + length, len(data))
+        while pos < end:
+            precision, table_id = data[pos] >> 4, data[pos] & 0x0F
+            size = 128 if precision else 64
+            if pos + 1 + size > end:
+                break
+            if precision:
+                values = struct.unpack_from('>64H', data, pos + 1)
+            else:
+                values = tuple(data[pos + 1:pos + 65])
+            tables[table_id] = (precision, values)
+            pos += 1 + size
+    return tables
+
+
+def tables_fingerprint(tables):
+    """量化表的指纹（按表编号排序后哈希，16位十六进制）"""
+    if not tables:
+        return None
+    digest = hashlib.blake2b(digest_size=8)
+    for table_id in sorted(tables):
+        precision, values = tables[table_id]
+        digest.update(bytes((table_id, precision)))
+        digest.update(struct.pack('>64H', *values))
+    return digest.hexdigest()
+
+
+def quantization_fingerprint(data):
+    """从图片数据计算量化表指纹，不是JPEG或没有量化表时返回None"""
+    try:
+        return tables_fingerprint(read_quantization_tables(data))
+    except Exception as e:
+        print(f"读取量化表时出错: {e}")
+        return None
+
+
+def ijg_tables(quality, components=2):
+    """
+    按IJG（libjpeg jpeg_set_quality）的方法缩放标准表
+
+    Args:
+        quality: 质量 1-100
+        components: 1 为只有亮度表（灰度图），2 为亮度表和色度表
+
+    Returns:
+        dict: 与 read_quantization_tables 相同的格式
+    """
+    scale = 5000 // quality if quality < 50 else 200 - quality * 2
+    tables = {}
+    for table_id, base in enumerate((STANDARD_LUMINANCE, STANDARD_CHROMINANCE)[:components]):
+        # 与 force_baseline 一致，系数限制在 1-255
+        values = tuple(min(max((base[index] * scale + 50) // 100, 1), 255) for index in ZIGZAG)
+        tables[table_id] = (0, values)
+    return tables
+
+
+# ==================== 索引 ====================
+
+def load_index_rows(path):
+    """读取量化表索引文件中的条目（跳过 # 开头的注释行）"""
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, newline='', encoding='utf-8') as f:
+        return [row for row in csv.DictReader(line for line in f if line.strip() and not line.startswith('#'))]
+
+
+class QuantIndex:
+    """量化表指纹索引"""
+
+    def __init__(self, rows=()):
+        self.entries = {}   # 指纹 -> QuantEntry 列表
+        self.models = {}    # (制造商, 型号键) -> 该型号原图使用的指纹集合
+
+        for quality in range(1, 101):
+            label = f'IJG标准量化表(质量{quality})'
+            for components in (1, 2):
+                self.add(tables_fingerprint(ijg_tables(quality, components)), 'encoder', '', '', label)
+        for row in rows:
+            self.add(row['fingerprint'], row['kind'], row.get('make') or '', row.get('model') or '',
+                     row.get('label') or '')
+
+    def add(self, fingerprint, kind, make='', model='', label=''):
+        make = make.lower()
+        entry = QuantEntry(kind, make, model, label or ' '.join(filter(None, (make, model))))
+        self.entries.setdefault(fingerprint, []).append(entry)
+        if kind == 'camera' and make and model:
+            self.models.setdefault((make, model_key(make, model)), set()).add(fingerprint)
+
+    def lookup(self, fingerprint):
+        """
+        Returns:
+            QuantEntry: 指纹对应的条目（编辑软件优先，其次相机，最后通用编码库），未收录时为None
+        """
+        entries = self.entries.get(fingerprint)
+        if not entries:
+            return None
+        priority = {'editor': 0, 'camera': 1}
+        return min(entries, key=lambda entry: priority.get(entry.kind, 2))
+
+    def model_fingerprints(self, make, model):
+        """某型号原图已知的指纹集合（没有采集过时为空）"""
+        return self.models.get((make, model_key(make, model)), frozenset())
+
+
+_quant_index = None
+
+
+def get_quant_index(config=Config):
+    """获取进程内共享的量化表索引（首次调用时加载）"""
+    global _quant_index
+    if _quant_index is None:
+        _quant_index = QuantIndex(load_index_rows(config.QUANT_TABLE_INDEX_PATH))
+    return _quant_index
+
+
+# ==================== 命令行 ====================
+
+def _read_header(path):
+    from stream_ingest import open_shared_buffer
+
+    with open_shared_buffer(path) as buffer:
+        return read_quantization_tables(buffer)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='JPEG量化表指纹')
+    commands = parser.add_subparsers(dest='command', required=True)
+    show = commands.add_parser('show', help='显示照片的量化表指纹和匹配结果')
+    show.add_argument('files', nargs='+', help='JPEG文件')
+    learn = commands.add_parser('learn', help='从参考照片采集量化表，追加到索引文件')
+    learn.add_argument('files', nargs='+', help='参考照片（未经编辑的原图或软件导出的图片）')
+    learn.add_argument('--kind', required=True, choices=('camera', 'editor', 'encoder'), help='来源类型')
+    learn.add_argument('--make', default='', help='制造商（与设备目录中的名称一致）')
+    learn.add_argument('--model', default='', help='型号')
+    learn.add_argument('--label', default='', help='显示名称')
+    learn.add_argument('-i', '--index', default=Config.QUANT_TABLE_INDEX_PATH, help='索引文件')
+    args = parser.parse_args(argv)
+
+    if args.command == 'show':
+        index = get_quant_index()
+        for path in args.files:
+            fingerprint = tables_fingerprint(_read_header(path))
+            entry = index.lookup(fingerprint) if fingerprint else None
+            print(f"{path}: {fingerprint or '没有量化表'}  {entry.label if entry else '未收录'}")
+        return 0
+
+    known = {(row['fingerprint'], row['kind'], row['make'], row['model'])
+             for row in load_index_rows(args.index)}
+    new_file = not os.path.exists(args.index)
+    added = 0
+    with open(args.index, 'a', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(INDEX_FIELDS)
+        for path in args.files:
+            fingerprint = tables_fingerprint(_read_header(path))
+            if fingerprint is None:
+                print(f"{path}: 没有量化表，跳过", file=sys.stderr)
+                continue
+            row = (fingerprint, args.kind, args.make.lower(), args.model)
+            if row in known:
+                continue
+            known.add(row)
+            writer.writerow(row + (args.label,))
+            added += 1
+    print(f"新增 {added} 条量化表记录到 {args.index}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
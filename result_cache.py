@@ -0,0 +1,259 @@
+"""
+分析结果缓存 - 按元数据字节内容寻址
+
+同一张照片被重复上传（重试、重复提交、多个账号分享同一张图）时，
+元数据所在的文件头部完全相同。这里以文件头部的哈希为键缓存完整的分析结果，
+命中时跳过EXIF解析、格式化和完整性检查。
+
+一级缓存在进程内，按LRU淘汰并限制总字节数和存活时间；
+可选的二级缓存是SQLite文件，可以在多个工作进程之间共享，写入时按字节预算删除过期和最早写入的结果。
+"""
+
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from config import Config
+from exif_parser import metadata_extent, FULL_EXTENT
+
+
+def content_key(file_content, full=False):
+    """
+    计算缓存键：元数据所在字节的哈希
+
+    完整文件只对头部（metadata_extent）计算哈希，与流式读取得到的头部一致。
+    full 为True时对全部数据计算哈希（结果取决于像素数据时使用），与头部的键不会相同。
+    """
+    with memoryview(file_content) as view:
+        extent = metadata_extent(view)
+        if full or extent is None or extent == FULL_EXTENT:
+            extent = len(view)
+        with view[:extent] as header:
+            return hashlib.blake2b(header, digest_size=16).digest()
+
+
+class SharedResultStore:
+    """
+    基于SQLite文件的二级缓存，可在多个进程之间共享
+
+    usage 表记录所有结果的总字节数（由触发器维护），写入后超出 max_bytes 时
+    先删除已过期的结果，仍然超出时按写入顺序删除最早的结果；删除后空出的页面由之后的写入复用，
+    文件大小不随写入次数增长。
+    """
+
+    def __init__(self, path, ttl=None, max_bytes=None):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS results '
+                '(key BLOB PRIMARY KEY, expires REAL, value BLOB)')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS usage (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL)')
+            connection.execute(
+                'INSERT OR IGNORE INTO usage (id, bytes) '
+                'SELECT 0, COALESCE(SUM(LENGTH(value)), 0) FROM results')
+            connection.execute(
+                'CREATE TRIGGER IF NOT EXISTS results_insert AFTER INSERT ON results BEGIN '
+                'UPDATE usage SET bytes = bytes + LENGTH(NEW.value) WHERE id = 0; END')
+            connection.execute(
+                'CREATE TRIGGER IF NOT EXISTS results_delete AFTER DELETE ON results BEGIN '
+                'UPDATE usage SET bytes = bytes - LENGTH(OLD.value) WHERE id = 0; END')
+
+    def _connect(self):
+        """每个线程使用独立的连接（fork出的子进程重新连接）"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5)
+            if self.max_bytes:
+                # 检查点之后把WAL文件截断到预算以内
+                connection.execute(f'PRAGMA journal_size_limit={int(self.max_bytes)}')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, key):
+        """读取缓存的序列化结果，不存在或已过期时返回None"""
+        row = self._connect().execute(
+            'SELECT expires, value FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        expires, value = row
+        if expires is not None and expires < time.time():
+            return None
+        return value
+
+    def put(self, key, value):
+        """写入序列化结果，超出字节预算时删除过期和最早写入的结果"""
+        if self.max_bytes and len(value) > self.max_bytes:
+            return
+        now = time.time()
+        expires = now + self.ttl if self.ttl else None
+        with self._connect() as connection:
+            # 先删除再插入：REPLACE 隐式删除的行不会触发 results_delete
+            connection.execute('DELETE FROM results WHERE key = ?', (key,))
+            connection.execute(
+                'INSERT INTO results (key, expires, value) VALUES (?, ?, ?)', (key, expires, value))
+            if self.max_bytes and self.size(connection) > self.max_bytes:
+                connection.execute('DELETE FROM results WHERE expires < ?', (now,))
+                self._evict_oldest(connection, self.size(connection) - self.max_bytes)
+
+    def size(self, connection=None):
+        """所有结果的总字节数"""
+        connection = connection or self._connect()
+        return connection.execute('SELECT bytes FROM usage WHERE id = 0').fetchone()[0]
+
+    @staticmethod
+    def _evict_oldest(connection, excess):
+        """按写入顺序（rowid）删除最早的结果，直到释放 excess 字节"""
+        if excess <= 0:
+            return
+        freed = 0
+        cutoff = None
+        for rowid, length in connection.execute('SELECT rowid, LENGTH(value) FROM results ORDER BY rowid'):
+            freed += length
+            cutoff = rowid
+            if freed >= excess:
+                break
+        if cutoff is not None:
+            connection.execute('DELETE FROM results WHERE rowid <= ?', (cutoff,))
+
+    def purge_expired(self):
+        """删除已过期的记录"""
+        with self._connect() as connection:
+            connection.execute('DELETE FROM results WHERE expires < ?', (time.time(),))
+
+
+class ResultCache:
+    """
+    进程内LRU结果缓存
+
+    结果以pickle序列化后保存，既能准确统计占用的字节数，
+    也保证调用方修改返回的结果不会影响缓存内容。
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=3600, shared=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.shared = shared
+        self._entries = OrderedDict()  # key -> (过期时间, 序列化结果)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        # 统计
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """读取缓存结果，未命中时返回None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires is None or expires > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return pickle.loads(value)
+                self._remove(key)
+                self.expirations += 1
+
+        if self.shared is not None:
+            try:
+                value = self.shared.get(key)
+            except sqlite3.Error as e:
+                print(f"读取共享缓存时出错: {e}")
+                value = None
+            if value is not None:
+                with self._lock:
+                    self.shared_hits += 1
+                    self._store(key, value, now)
+                return pickle.loads(value)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, result):
+        """缓存分析结果"""
+        value = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._store(key, value, time.monotonic())
+
+        if self.shared is not None:
+            try:
+                self.shared.put(key, value)
+            except sqlite3.Error as e:
+                print(f"写入共享缓存时出错: {e}")
+
+    def _store(self, key, value, now):
+        """写入一级缓存并按字节预算淘汰最久未使用的结果（调用方持有锁）"""
+        if len(value) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        expires = now + self.ttl if self.ttl else None
+        self._entries[key] = (expires, value)
+        self._bytes += len(value)
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key):
+        _, value = self._entries.pop(key)
+        self._bytes -= len(value)
+
+    def clear(self):
+        """清空一级缓存（不影响统计和共享缓存）"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """缓存统计"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache(config=Config):
+    """
+    获取进程内共享的结果缓存（按配置首次创建），未启用时返回None
+
+    Args:
+        config: 配置类
+    """
+    global _result_cache
+    if not config.RESULT_CACHE_ENABLED:
+        return None
+    if _result_cache is None:
+        with _result_cache_lock:
+            if _result_cache is None:
+                shared = None
+                if config.RESULT_CACHE_SHARED_PATH:
+                    shared = SharedResultStore(config.RESULT_CACHE_SHARED_PATH, config.RESULT_CACHE_TTL,
+                                               config.RESULT_CACHE_SHARED_MAX_BYTES)
+                _result_cache = ResultCache(config.RESULT_CACHE_MAX_BYTES, config.RESULT_CACHE_TTL, shared)
+    return _result_cache
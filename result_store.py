@@ -0,0 +1,198 @@
+"""
+持久化结果存储 - 按文件路径保存分析结果
+
+以 (路径, 大小, 修改时间, inode) 判断文件是否变化，未变化的文件直接返回上次的结果，
+重复扫描大型照片库时只需要分析新增或修改过的文件。
+
+每条结果还记录分析器版本（分析相关模块源码的哈希），
+修改解析器、检测规则、数据文件或配置后版本随之变化，旧结果自动失效。
+"""
+
+import hashlib
+import importlib.util
+import os
+import pickle
+import sqlite3
+import threading
+from config import Config
+
+# 参与分析的模块，任何一个源码变化都会使已保存的结果失效
+ANALYZER_MODULES = (
+    'photo_analyzer',
+    'exif_parser',
+    'image_probe',
+    'exif_integrity_checker',
+    'field_plan',
+    'signature_matcher',
+    'device_catalog',
+    'quant_tables',
+    'exif_layout',
+    'exif_time',
+    'thumbnail_check',
+    'formatters',
+    'config',
+)
+
+# 参与分析的数据文件（Config 中的路径配置项），内容变化同样使已保存的结果失效
+ANALYZER_DATA_PATHS = (
+    'DEVICE_CATALOG_PATH',
+    'QUANT_TABLE_INDEX_PATH',
+    'EXIF_LAYOUT_INDEX_PATH',
+)
+
+_analyzer_version = None
+
+
+def analyzer_version():
+    """分析器版本：各分析模块源码和数据文件的哈希（进程内只计算一次）"""
+    global _analyzer_version
+    if _analyzer_version is None:
+        digest = hashlib.blake2b(digest_size=8)
+        for name in ANALYZER_MODULES:
+            spec = importlib.util.find_spec(name)
+            digest.update(name.encode())
+            if spec is not None and spec.origin and os.path.exists(spec.origin):
+                with open(spec.origin, 'rb') as f:
+                    digest.update(f.read())
+        for name in ANALYZER_DATA_PATHS:
+            path = getattr(Config, name, None)
+            if path and os.path.exists(path):
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+        _analyzer_version = digest.hexdigest()
+    return _analyzer_version
+
+
+def file_signature(file_path):
+    """文件签名：(大小, 修改时间（纳秒）, inode)"""
+    stat = os.stat(file_path)
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+
+def _path_key(file_path):
+    """
+    数据库中的路径键
+
+    文件名不是合法UTF-8时（路径中含代理字符）无法作为TEXT保存，改用原始字节（BLOB），
+    BLOB与TEXT不会相等，因此不会和其他路径冲突。
+    """
+    try:
+        file_path.encode('utf-8')
+    except UnicodeEncodeError:
+        return os.fsencode(file_path)
+    return file_path
+
+
+class ResultStore:
+    """基于SQLite的持久化结果存储"""
+
+    def __init__(self, path, version=None):
+        self.path = path
+        self.version = version or analyzer_version()
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                'path TEXT NOT NULL, kind TEXT NOT NULL, '
+                'size INTEGER, mtime_ns INTEGER, inode INTEGER, version TEXT, value BLOB, '
+                'PRIMARY KEY (path, kind))')
+
+    def _connect(self):
+        """每个线程使用独立的连接（fork出的子进程重新连接）"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, file_path, kind, signature):
+        """
+        读取文件的结果，文件已变化或分析器版本不同时返回None
+
+        Args:
+            file_path: 文件的绝对路径
+            kind: 结果类型（'analysis' 或 'integrity'）
+            signature: file_signature() 的返回值
+        """
+        row = self._connect().execute(
+            'SELECT size, mtime_ns, inode, version, value FROM results WHERE path = ? AND kind = ?',
+            (_path_key(file_path), kind)).fetchone()
+        if row is None or tuple(row[:3]) != tuple(signature) or row[3] != self.version:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return pickle.loads(row[4])
+
+    def put(self, file_path, kind, signature, result):
+        """保存文件的结果（覆盖旧记录）"""
+        value = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._connect() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO results '
+                '(path, kind, size, mtime_ns, inode, version, value) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (_path_key(file_path), kind) + tuple(signature) + (self.version, value))
+
+    def purge_stale(self):
+        """删除旧版本分析器留下的结果"""
+        with self._connect() as connection:
+            connection.execute('DELETE FROM results WHERE version != ?', (self.version,))
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+_result_store = None
+_result_store_configured = False
+_result_store_lock = threading.Lock()
+
+
+def configure_result_store(path):
+    """指定当前进程使用的存储文件（None 为不使用），覆盖 Config.RESULT_STORE_PATH"""
+    global _result_store, _result_store_configured
+    with _result_store_lock:
+        _result_store = ResultStore(path) if path else None
+        _result_store_configured = True
+
+
+def get_result_store(config=Config):
+    """获取当前进程的结果存储，未启用时返回None"""
+    if not _result_store_configured:
+        configure_result_store(config.RESULT_STORE_PATH)
+    return _result_store
+
+
+def cached_file_result(file_path, kind, analyze):
+    """
+    按路径读取已保存的结果，文件变化时调用 analyze(file_path) 重新分析并保存
+
+    只保存成功的分析结果；未启用存储或文件无法访问时直接分析。
+    """
+    store = get_result_store()
+    if store is None:
+        return analyze(file_path)
+
+    try:
+        file_path = os.path.abspath(file_path)
+        signature = file_signature(file_path)
+    except OSError:
+        # 文件不存在或无法访问，由分析函数报告错误
+        return analyze(file_path)
+
+    try:
+        result = store.get(file_path, kind, signature)
+    except sqlite3.Error as e:
+        print(f"读取结果存储时出错: {e}")
+        return analyze(file_path)
+
+    if result is None:
+        result = analyze(file_path)
+        if result.get('success', True):
+            try:
+                store.put(file_path, kind, signature, result)
+            except sqlite3.Error as e:
+                print(f"写入结果存储时出错: {e}")
+    return result
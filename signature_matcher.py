@@ -0,0 +1,85 @@
+"""
+多模式字符串匹配 - Aho-Corasick自动机
+
+所有模式编译进同一个自动机，扫描一遍文本即可找出全部命中的模式，
+耗时只与文本长度有关，不随模式数量增长。
+"""
+
+from collections import deque
+
+
+class SignatureMatcher:
+    """
+    大小写不敏感的多模式子串匹配器
+
+    构建后不再修改，可以在多个线程之间共享。
+    """
+
+    def __init__(self, patterns):
+        """
+        Args:
+            patterns: 模式列表，列表中的位置即模式的优先级（越靠前越优先）
+        """
+        self.patterns = tuple(patterns)
+        transitions = [{}]      # 状态 -> {字符: 下一状态}
+        best = [None]           # 状态 -> 在该状态结束的模式中最小的下标
+
+        # 构建字典树
+        for index, pattern in enumerate(self.patterns):
+            text = pattern.lower()
+            if not text:
+                continue
+            state = 0
+            for char in text:
+                next_state = transitions[state].get(char)
+                if next_state is None:
+                    next_state = len(transitions)
+                    transitions[state][char] = next_state
+                    transitions.append({})
+                    best.append(None)
+                state = next_state
+            if best[state] is None or index < best[state]:
+                best[state] = index
+
+        # 按广度优先计算失败指针，并把转移补全为确定性自动机
+        fail = [0] * len(transitions)
+        queue = deque(transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            fallback = fail[state]
+            # 沿失败指针可达的模式同样在该状态命中
+            if best[fallback] is not None and (best[state] is None or best[fallback] < best[state]):
+                best[state] = best[fallback]
+            for char, next_state in transitions[state].items():
+                queue.append(next_state)
+                target = fallback
+                while target and char not in transitions[target]:
+                    target = fail[target]
+                candidate = transitions[target].get(char, 0)
+                fail[next_state] = candidate if candidate != next_state else 0
+            # 补全缺失的转移（继承失败状态的转移）
+            for char, target in transitions[fallback].items():
+                transitions[state].setdefault(char, target)
+
+        self._transitions = transitions
+        self._best = best
+
+    def first_match(self, text):
+        """
+        在文本中查找优先级最高（列表中最靠前）的命中模式
+
+        Returns:
+            str: 命中的模式，没有命中时返回None
+        """
+        transitions = self._transitions
+        best = self._best
+        state = 0
+        found = None
+        for char in text.lower():
+            state = transitions[state].get(char, 0)
+            index = best[state]
+            if index is not None and (found is None or index < found):
+                found = index
+                if found == 0:
+                    break
+        return None if found is None else self.patterns[found]
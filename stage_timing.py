@@ -0,0 +1,114 @@
+"""
+分析流程的阶段计时 - 通过 Server-Timing 响应头返回
+
+请求开始时用 collect_timings() 启用计时，分析流程中的各阶段用 stage(name) 包裹：
+
+    with collect_timings() as timings:
+        with stage('parse'):
+            ...
+    response.headers['Server-Timing'] = timings.header()
+
+计时记录在 ContextVar 中，每个请求（线程或协程）独立。
+没有启用计时时 stage() 返回共享的空上下文，只多一次 ContextVar 读取。
+"""
+
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+# 分析流程中的阶段（按执行顺序，Server-Timing 中的名称）
+STAGES = (
+    'receive',      # 接收请求体（解析multipart）
+    'read',         # 从上传流中读取文件头部
+    'cache',        # 计算缓存键并查找结果缓存
+    'parse',        # 解析EXIF（exif_parser.parse_exif）并生成字段记录
+    'signals',      # 读取量化表等头部信号、比较缩略图
+    'probe',        # 探测图片尺寸和格式
+    'integrity',    # 完整性检查（check_exif_integrity）
+    'format',       # 格式化展示字段
+)
+
+_current = ContextVar('stage_timings', default=None)
+_NO_TIMING = nullcontext()
+
+
+class StageTimings:
+    """一个请求中各阶段的累计耗时（秒），按首次出现的顺序排列"""
+
+    __slots__ = ('durations',)
+
+    def __init__(self):
+        self.durations = {}
+
+    def add(self, name, elapsed):
+        self.durations[name] = self.durations.get(name, 0.0) + elapsed
+
+    def update(self, durations):
+        """合并其他进程中记录的耗时（as_seconds 的结果）"""
+        for name, elapsed in durations.items():
+            self.add(name, elapsed)
+
+    def as_seconds(self):
+        return dict(self.durations)
+
+    def as_milliseconds(self):
+        """各阶段耗时（毫秒），用于JSON结果"""
+        return {name: round(elapsed * 1000, 3) for name, elapsed in self.durations.items()}
+
+    def header(self):
+        """Server-Timing 响应头的值，如 'parse;dur=0.21, integrity;dur=0.08'"""
+        return ', '.join(f'{name};dur={elapsed * 1000:.2f}' for name, elapsed in self.durations.items())
+
+
+class _Stage:
+    """计时中的一个阶段（上下文管理器）"""
+
+    __slots__ = ('timings', 'name', 'start')
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.timings.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def stage(name):
+    """为一个阶段计时；当前请求没有启用计时时不做任何事"""
+    timings = _current.get()
+    if timings is None:
+        return _NO_TIMING
+    return _Stage(timings, name)
+
+
+def current_timings():
+    """当前请求的计时（StageTimings），没有启用时为None"""
+    return _current.get()
+
+
+@contextmanager
+def collect_timings(timings=None):
+    """在这个上下文中启用计时，产出 StageTimings"""
+    timings = timings if timings is not None else StageTimings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+def run_timed(func, *args, **kwargs):
+    """
+    启用计时后调用 func（用于工作进程：ContextVar 不会跨进程传递）
+
+    Returns:
+        tuple: (func 的返回值, 各阶段耗时的字典（秒）)
+    """
+    with collect_timings() as timings:
+        result = func(*args, **kwargs)
+    return result, timings.as_seconds()
@@ -0,0 +1,479 @@
+"""
+流式读取上传文件 - 只保留元数据所在的文件头部
+
+EXIF、标记段和图片尺寸都位于文件开头的几十KB内。这里按块读取请求体，
+一旦元数据读取完毕就停止保存数据，剩余部分直接丢弃，不再整体缓存。
+
+读取得到的数据以只读memoryview的形式在各解析阶段之间共享，
+路径分析则直接使用mmap，各阶段只读取切片，不再复制整个文件。
+"""
+
+import io
+import mmap
+import os
+from contextlib import contextmanager
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import MultipartDecoder, File, Data, Epilogue, NeedData
+from exif_parser import metadata_extent, FULL_EXTENT
+from image_probe import SNIFF_LENGTH
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+class HeaderCollector:
+    """累积单个文件的头部字节，元数据完整后不再保存后续数据"""
+
+    def __init__(self, max_size=None, check=None):
+        """
+        Args:
+            max_size: 最多保存的字节数
+            check: 可选的内容检查函数，参数为文件开头的 SNIFF_LENGTH 个字节，
+                   返回False时丢弃已保存的数据，不再保存后续数据
+        """
+        self.buffer = bytearray()
+        self.max_size = max_size
+        self.check = check
+        self.complete = False   # 头部是否已经完整
+        self.bytes_seen = 0     # 实际收到的字节数（含被丢弃的部分）
+        self.needs_full_file = False  # 格式的元数据位置不固定，需要完整文件
+        self.mismatched = False  # 内容未通过检查
+
+    def feed(self, data):
+        """
+        追加一块数据
+
+        Returns:
+            bool: 头部是否已经完整
+        """
+        self.bytes_seen += len(data)
+        if self.complete:
+            return True
+
+        self.buffer.extend(data)
+        if self.check is not None and len(self.buffer) >= SNIFF_LENGTH and not self.verify():
+            return True
+        extent = metadata_extent(self.buffer)
+        self.needs_full_file = extent == FULL_EXTENT
+        if extent is not None and extent != FULL_EXTENT and extent <= len(self.buffer):
+            del self.buffer[extent:]
+            self.complete = True
+        elif self.max_size is not None and len(self.buffer) >= self.max_size:
+            del self.buffer[self.max_size:]
+            self.complete = True
+        return self.complete
+
+    def verify(self):
+        """
+        用文件开头的字节检查内容（只检查一次；文件不足 SNIFF_LENGTH 字节时在文件结束后调用）
+
+        Returns:
+            bool: 内容是否通过检查
+        """
+        check, self.check = self.check, None
+        if check is not None and not check(bytes(self.buffer[:SNIFF_LENGTH])):
+            self.mismatched = True
+            self.complete = True
+            self.buffer = bytearray()
+        return not self.mismatched
+
+    def view(self):
+        """返回已保存数据的只读视图（不复制）"""
+        return memoryview(self.buffer).toreadonly()
+
+
+class BufferReader(io.RawIOBase):
+    """
+    共享缓冲区上的只读文件对象
+
+    供需要文件接口的库（如PIL）使用，只复制实际读取的片段，
+    而不是像 io.BytesIO(memoryview) 那样复制整个缓冲区。
+    """
+
+    def __init__(self, buffer):
+        super().__init__()
+        self._view = memoryview(buffer)
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, target):
+        remaining = len(self._view) - self._pos
+        count = min(len(target), max(remaining, 0))
+        target[:count] = self._view[self._pos:self._pos + count]
+        self._pos += count
+        return count
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        elif whence == io.SEEK_END:
+            self._pos = len(self._view) + offset
+        else:
+            raise ValueError(f'无效的whence参数: {whence}')
+        if self._pos < 0:
+            raise ValueError('负的文件位置')
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        if not self.closed:
+            self._view.release()
+        super().close()
+
+
+@contextmanager
+def open_shared_buffer(file_path):
+    """
+    以只读内存映射方式打开文件
+
+    Yields:
+        memoryview: 文件内容的只读视图（空文件为空视图），退出时释放映射
+    """
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield memoryview(b'')
+            return
+
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        try:
+            yield view
+        finally:
+            view.release()
+            try:
+                mapped.close()
+            except BufferError:
+                # 仍有切片未释放时交给垃圾回收处理
+                pass
+
+
+def trim_header(data):
+    """
+    只保留元数据所在的文件头部（与流式读取上传文件时保留的部分相同）
+
+    浏览器端截取的头部可能多带了一些数据，裁掉后缓存键和分析结果与上传完整文件时一致；
+    元数据位置不固定或数据不完整时原样返回。
+    """
+    extent = metadata_extent(data)
+    if extent is None or extent == FULL_EXTENT or extent >= len(data):
+        return data
+    return data[:extent]
+
+
+class UploadHeader:
+    """流式解析multipart请求得到的上传文件头部"""
+
+    def __init__(self):
+        self.filename = None    # None 表示请求中没有对应的文件字段
+        self.data = memoryview(b'')  # 文件头部的只读视图
+        self.complete = False   # 头部是否在文件结束前就已完整
+        self.rejected = False   # 文件名或内容未通过检查，不分析该文件
+        self.mismatched = False  # 文件开头的内容与扩展名不符或不是支持的格式，未读取其余内容
+        self.bytes_read = 0     # 从请求流中读取的总字节数
+
+
+def read_image_header(file_stream, chunk_size=DEFAULT_CHUNK_SIZE, max_size=None):
+    """
+    从文件流中按块读取，直到元数据完整为止
+
+    Args:
+        file_stream: 支持read()的文件对象
+        chunk_size: 每次读取的字节数
+        max_size: 最多保存的字节数
+
+    Returns:
+        memoryview: 文件头部的只读视图（元数据位置不固定的格式为完整文件）
+    """
+    collector = HeaderCollector(max_size)
+    while not collector.complete:
+        if collector.needs_full_file:
+            remaining = _remaining_size(file_stream)
+            if remaining is not None:
+                return _read_remaining(file_stream, collector, remaining, max_size)
+        chunk = file_stream.read(chunk_size)
+        if not chunk:
+            break
+        collector.feed(chunk)
+    return collector.view()
+
+
+def _remaining_size(file_stream):
+    """获取流中剩余的字节数，无法获取时返回None"""
+    try:
+        position = file_stream.tell()
+        end = file_stream.seek(0, io.SEEK_END)
+        file_stream.seek(position)
+        return end - position
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def _read_remaining(file_stream, collector, remaining, max_size):
+    """需要完整文件时一次性分配缓冲区并直接读入，避免bytearray扩容时的复制"""
+    prefix_length = len(collector.buffer)
+    total = prefix_length + remaining
+    if max_size is not None:
+        total = min(total, max_size)
+
+    buffer = bytearray(total)
+    buffer[:prefix_length] = collector.buffer
+    collector.buffer = bytearray()
+
+    view = memoryview(buffer)
+    position = prefix_length
+    readinto = getattr(file_stream, 'readinto', None)
+    while position < total:
+        if readinto is not None:
+            count = readinto(view[position:])
+        else:
+            chunk = file_stream.read(min(total - position, DEFAULT_CHUNK_SIZE))
+            count = len(chunk)
+            view[position:position + count] = chunk
+        if not count:
+            break
+        position += count
+    return view[:position].toreadonly()
+
+
+def _content_check(accept_content, filename):
+    """把 (文件名, 文件开头的字节) 形式的检查函数绑定到一个文件"""
+    if accept_content is None:
+        return None
+    return lambda head: accept_content(filename, head)
+
+
+def read_upload_header(stream, content_type, field_name='file', accept=None,
+                       chunk_size=DEFAULT_CHUNK_SIZE, max_size=None, drain=True, accept_content=None):
+    """
+    流式解析multipart/form-data请求，只保留指定文件字段的头部
+
+    Args:
+        stream: 请求体流（如 flask.request.stream）
+        content_type: 请求的Content-Type
+        field_name: 文件字段名
+        accept: 可选的文件名检查函数，返回False时不读取该文件内容
+        chunk_size: 每次从请求流读取的字节数
+        max_size: 单个文件最多保存的字节数
+        drain: 头部完整后是否继续读完并丢弃剩余请求体（保持连接可复用）
+        accept_content: 可选的内容检查函数 (文件名, 文件开头的字节)，返回False时不再读取该文件
+
+    Returns:
+        UploadHeader: 解析结果
+    """
+    upload = UploadHeader()
+    mimetype, options = parse_options_header(content_type)
+    boundary = options.get('boundary')
+    if mimetype != 'multipart/form-data' or not boundary:
+        return upload
+
+    decoder = MultipartDecoder(boundary.encode('latin-1'))
+    collector = None
+    collecting = False
+    finished = False
+
+    while not finished:
+        chunk = stream.read(chunk_size)
+        upload.bytes_read += len(chunk)
+        decoder.receive_data(chunk or None)
+
+        try:
+            while True:
+                event = decoder.next_event()
+                if isinstance(event, NeedData):
+                    break
+                if isinstance(event, File) and event.name == field_name and upload.filename is None:
+                    upload.filename = event.filename
+                    if upload.filename and (accept is None or accept(upload.filename)):
+                        collector = HeaderCollector(max_size, _content_check(accept_content, upload.filename))
+                        collecting = True
+                    else:
+                        upload.rejected = bool(upload.filename)
+                        finished = True
+                        break
+                elif isinstance(event, Data) and collecting:
+                    collector.feed(event.data)
+                    if not event.more_data:
+                        collector.verify()
+                    if collector.mismatched:
+                        upload.rejected = upload.mismatched = True
+                        collecting = False
+                        finished = True
+                        break
+                    if collector.complete or not event.more_data:
+                        upload.complete = collector.complete and event.more_data
+                        collecting = False
+                        finished = True
+                        break
+                elif isinstance(event, Epilogue):
+                    finished = True
+                    break
+        except ValueError:
+            # multipart格式错误，按没有文件处理
+            finished = True
+
+        if not chunk:
+            break
+
+    if collector is not None:
+        upload.data = collector.view()
+
+    if drain:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            upload.bytes_read += len(chunk)
+
+    return upload
+
+
+class UploadHeaderParser:
+    """
+    增量解析multipart/form-data请求体，每个文件只保留头部
+
+    数据由调用方逐块推入（feed），因此既可以用于同步的请求流，
+    也可以在事件循环中逐个处理ASGI消息，不需要阻塞线程等待慢速客户端。
+    """
+
+    def __init__(self, content_type, field_name='files', accept=None,
+                 max_size=None, max_files=None, accept_content=None):
+        """
+        Args:
+            content_type: 请求的Content-Type
+            field_name: 文件字段名（同名字段可出现多次）
+            accept: 可选的文件名检查函数，返回False时不保存该文件内容
+            max_size: 单个文件最多保存的字节数
+            max_files: 收到这么多个文件字段后停止解析
+            accept_content: 可选的内容检查函数 (文件名, 文件开头的字节)，返回False时不再保存该文件内容
+        """
+        self.uploads = []       # 按请求中顺序排列的 UploadHeader
+        self.finished = False   # 不再需要后续数据
+        self.bytes_read = 0     # 推入的总字节数
+        self.field_name = field_name
+        self.accept = accept
+        self.max_size = max_size
+        self.max_files = max_files
+        self.accept_content = accept_content
+        self._current = None
+        self._collector = None
+
+        mimetype, options = parse_options_header(content_type)
+        boundary = options.get('boundary')
+        if mimetype != 'multipart/form-data' or not boundary:
+            self._decoder = None
+            self.finished = True
+        else:
+            self._decoder = MultipartDecoder(boundary.encode('latin-1'))
+
+    def feed(self, chunk):
+        """
+        推入一块请求体数据，空数据表示请求体结束
+
+        Returns:
+            bool: 是否已解析完毕
+        """
+        self.bytes_read += len(chunk)
+        if self.finished:
+            return True
+
+        self._decoder.receive_data(chunk or None)
+        try:
+            self._process_events()
+        except ValueError:
+            # multipart格式错误，保留已解析的文件
+            self.finished = True
+
+        if not chunk:
+            self.finished = True
+        if self.finished and self._collector is not None:
+            # 请求体被截断时保留最后一个文件已收到的部分
+            self._current.data = self._collector.view()
+            self._current = self._collector = None
+        return self.finished
+
+    def _process_events(self):
+        while True:
+            event = self._decoder.next_event()
+            if isinstance(event, NeedData):
+                return
+            if isinstance(event, File):
+                self._current = self._collector = None
+                if event.name != self.field_name:
+                    continue
+                upload = UploadHeader()
+                upload.filename = event.filename
+                self.uploads.append(upload)
+                self._current = upload
+                if upload.filename and (self.accept is None or self.accept(upload.filename)):
+                    self._collector = HeaderCollector(self.max_size,
+                                                      _content_check(self.accept_content, upload.filename))
+                else:
+                    upload.rejected = bool(upload.filename)
+                    self._file_done()
+            elif isinstance(event, Data):
+                upload, collector = self._current, self._collector
+                if upload is None:
+                    continue
+                upload.bytes_read += len(event.data)
+                if collector is not None and not collector.complete:
+                    collector.feed(event.data)
+                    if not event.more_data:
+                        collector.verify()
+                    if collector.mismatched:
+                        upload.rejected = upload.mismatched = True
+                        self._collector = None
+                if not event.more_data:
+                    if self._collector is not None:
+                        upload.complete = collector.complete and upload.bytes_read > len(collector.buffer)
+                        upload.data = collector.view()
+                    self._current = self._collector = None
+                    self._file_done()
+            elif isinstance(event, Epilogue):
+                self.finished = True
+            if self.finished:
+                return
+
+    def _file_done(self):
+        """一个文件字段处理完毕，达到文件数上限时停止解析"""
+        if self.max_files is not None and len(self.uploads) >= self.max_files:
+            self.finished = True
+
+
+def read_upload_headers(stream, content_type, field_name='files', accept=None,
+                        chunk_size=DEFAULT_CHUNK_SIZE, max_size=None, max_files=None, drain=True,
+                        accept_content=None):
+    """
+    流式解析包含多个文件的multipart/form-data请求，每个文件只保留头部
+
+    Args:
+        stream: 请求体流
+        content_type: 请求的Content-Type
+        field_name: 文件字段名（同名字段可出现多次）
+        accept: 可选的文件名检查函数，返回False时不保存该文件内容
+        chunk_size: 每次从请求流读取的字节数
+        max_size: 单个文件最多保存的字节数
+        max_files: 最多接收的文件数，超出时多返回一项后停止解析
+        drain: 解析结束后是否读完并丢弃剩余请求体
+        accept_content: 可选的内容检查函数 (文件名, 文件开头的字节)，返回False时不再保存该文件内容
+
+    Returns:
+        list: 按请求中顺序排列的 UploadHeader
+    """
+    parser = UploadHeaderParser(content_type, field_name, accept, max_size,
+                                None if max_files is None else max_files + 1, accept_content)
+    while not parser.finished:
+        parser.feed(stream.read(chunk_size))
+
+    if drain:
+        while stream.read(chunk_size):
+            pass
+
+    return parser.uploads
@@ -0,0 +1,221 @@
+"""
+测试准入控制：并发和字节预算、有界等待队列、超出时在读取请求体之前返回503
+"""
+
+import asyncio
+import io
+import threading
+import time
+import app as app_module
+from admission import AdmissionGate, AsyncAdmissionGate, Overloaded, buffer_limit, request_cost
+from asgi_app import AsgiApp
+from test_asgi_app import ThreadConfig
+from test_exif_parser import create_corpus
+from test_stream_ingest import multipart_body
+
+
+def expect_overloaded(acquire, reason):
+    try:
+        acquire()
+    except Overloaded as e:
+        assert e.reason == reason and e.retry_after == 1
+        return
+    raise AssertionError(f"应当因 {reason} 被拒绝")
+
+
+def test_in_flight_limit():
+    """并发名额用完后排队，队列满时立即拒绝，释放后按顺序放行"""
+    gate = AdmissionGate(max_in_flight=1, queue_size=1, timeout=5.0)
+    first = gate.acquire(10)
+    admitted = []
+    waiter = threading.Thread(target=lambda: admitted.append(gate.acquire(10)))
+    waiter.start()
+    while gate.waiting == 0:
+        time.sleep(0.001)
+
+    start = time.perf_counter()
+    expect_overloaded(lambda: gate.acquire(10), 'queue_full')
+    assert time.perf_counter() - start < 0.1
+
+    first.release()
+    first.release()   # 重复释放不影响记账
+    waiter.join()
+    assert gate.in_flight == 1 and gate.reserved == 10 and gate.waiting == 0
+    admitted[0].release()
+    assert gate.in_flight == 0 and gate.reserved == 0
+
+
+def test_queue_timeout():
+    """排队超过期限时拒绝，并离开队列"""
+    gate = AdmissionGate(max_in_flight=1, queue_size=4, timeout=0.05)
+    held = gate.acquire(1)
+    expect_overloaded(lambda: gate.acquire(1), 'timeout')
+    assert gate.waiting == 0 and gate.in_flight == 1
+    held.release()
+
+
+def test_byte_budget():
+    """字节预算独立于并发数；空闲时超出预算的单个请求也会放行"""
+    gate = AdmissionGate(max_bytes=100, queue_size=0)
+    big = gate.acquire(1000)
+    expect_overloaded(lambda: gate.acquire(1), 'queue_full')
+    big.release()
+
+    first = gate.acquire(80)
+    second = gate.acquire(20)
+    expect_overloaded(lambda: gate.acquire(1), 'queue_full')
+    first.release()
+    second.release()
+
+    assert request_cost(None, 500) == 500
+    assert request_cost(120, 500) == 120
+    assert request_cost(10 ** 9, 500) == 500
+
+    # 只读取文件头部时按头部上限计，而不是请求体上限
+    config = {'HEADER_UPLOAD_MAX_BYTES': 100, 'MAX_CONTENT_LENGTH': 1000, 'BATCH_MAX_TOTAL_BYTES': 5000}
+    assert buffer_limit(config, 'upload') == buffer_limit(config, 'batch') == buffer_limit(config, 'header') == 100
+    assert buffer_limit(config, 'upload', header_only=False) == 1000
+
+
+def test_async_gate():
+    """事件循环中等待不占用线程；排队时被取消会归还预算"""
+    async def run():
+        gate = AsyncAdmissionGate(max_in_flight=1, queue_size=2, timeout=5.0)
+        held = await gate.acquire(5)
+        waiting = asyncio.ensure_future(gate.acquire(5))
+        cancelled = asyncio.ensure_future(gate.acquire(5))
+        await asyncio.sleep(0)
+        assert gate.waiting == 2
+
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        assert gate.waiting == 1
+
+        held.release()
+        (await waiting).release()
+        assert gate.in_flight == 0 and gate.reserved == 0
+
+        gate.timeout = 0.01
+        held = await gate.acquire(5)
+        try:
+            await gate.acquire(5)
+        except Overloaded as e:
+            assert e.reason == 'timeout'
+        else:
+            raise AssertionError("应当因等待超时被拒绝")
+        held.release()
+
+    asyncio.run(run())
+
+
+class CountingStream(io.BytesIO):
+    """记录请求体被读取的字节数"""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.read_bytes = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.read_bytes += len(data)
+        return data
+
+    def readinto(self, buffer):
+        count = super().readinto(buffer)
+        self.read_bytes += count
+        return count
+
+
+def test_flask_sheds_before_reading_body():
+    """Flask: 预算用完时返回503和 Retry-After，不读取请求体"""
+    client = app_module.app.test_client()
+    body, content_type = multipart_body('photo.jpg', create_corpus()['edited_jpeg'])
+    saved = app_module.admission
+    app_module.admission = AdmissionGate(max_in_flight=1, queue_size=0, retry_after=1)
+    try:
+        held = app_module.admission.acquire(0)
+        stream = CountingStream(body)
+        response = client.post('/upload', input_stream=stream, content_type=content_type,
+                               content_length=len(body))
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+        assert stream.read_bytes == 0
+
+        held.release()
+        response = client.post('/upload', data=body, content_type=content_type)
+        assert response.status_code == 200
+        assert app_module.admission.in_flight == 0
+
+        # 只读取头部的大文件上传按头部上限占用字节预算，不会因 Content-Length 大而排队
+        header_limit = app_module.app.config['HEADER_UPLOAD_MAX_BYTES']
+        app_module.admission = AdmissionGate(max_bytes=header_limit + 1, queue_size=0, retry_after=1)
+        held = app_module.admission.acquire(1)
+        large, large_type = multipart_body('photo.jpg', create_corpus()['edited_jpeg'] + b'\x00' * (4 * header_limit))
+        assert len(large) > app_module.admission.max_bytes
+        saved_header_only = app_module.app.config['HEADER_ONLY_INGEST']
+        try:
+            app_module.app.config['HEADER_ONLY_INGEST'] = True
+            assert client.post('/upload', data=large, content_type=large_type).status_code == 200
+            app_module.app.config['HEADER_ONLY_INGEST'] = False
+            assert client.post('/upload', data=large, content_type=large_type).status_code == 503
+        finally:
+            app_module.app.config['HEADER_ONLY_INGEST'] = saved_header_only
+        held.release()
+
+        # 流式批量响应在响应关闭时才释放
+        response = client.post('/analyze/batch?stream=1', data=body.replace(b'name="file"', b'name="files"'),
+                               content_type=content_type)
+        assert response.status_code == 200 and response.get_data()
+        response.close()
+        assert app_module.admission.in_flight == 0
+    finally:
+        app_module.admission = saved
+
+
+def test_asgi_sheds_before_reading_body():
+    """ASGI: 预算用完时返回503和 Retry-After，不接收请求体"""
+    asgi = AsgiApp(ThreadConfig)
+    asgi.admission = AsyncAdmissionGate(max_in_flight=1, queue_size=0, retry_after=1)
+    assert asgi.admission_limit('/upload') == asgi.admission_limit('/analyze/batch') == \
+        ThreadConfig.HEADER_UPLOAD_MAX_BYTES
+    assert asgi.admission_limit('/metrics') is None
+    body, content_type = multipart_body('photo.jpg', create_corpus()['edited_jpeg'])
+
+    async def run():
+        held = await asgi.admission.acquire(0)
+        received = []
+        sent = []
+
+        async def receive():
+            received.append(True)
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': 'POST', 'path': '/upload', 'query_string': b'',
+                 'headers': [(b'content-length', str(len(body)).encode()),
+                             (b'content-type', content_type.encode())]}
+        await asgi(scope, receive, send)
+        assert sent[0]['status'] == 503 and not received
+        assert (b'retry-after', b'1') in sent[0]['headers']
+
+        held.release()
+        sent.clear()
+        await asgi(scope, receive, send)
+        assert sent[0]['status'] == 200 and asgi.admission.in_flight == 0
+
+    try:
+        asyncio.run(run())
+    finally:
+        asgi.stop()
+
+
+if __name__ == "__main__":
+    test_in_flight_limit()
+    test_queue_timeout()
+    test_byte_budget()
+    test_async_gate()
+    test_flask_sheds_before_reading_body()
+    test_asgi_sheds_before_reading_body()
+    print("所有测试通过")
@@ -0,0 +1,158 @@
+"""
+测试异步服务入口：响应与Flask应用相同，请求体分块到达时正常解析
+"""
+
+import asyncio
+import json
+from asgi_app import AsgiApp
+from config import Config
+from test_exif_parser import create_corpus
+from test_stream_ingest import make_large_jpeg, multipart_body
+
+
+class ThreadConfig(Config):
+    ASGI_EXECUTOR = 'thread'
+    ASGI_WORKERS = 2
+
+
+def call_app(app, method, path, body=b'', content_type=None, chunk_size=8192, query=b''):
+    """调用ASGI应用，请求体按块发送，返回 (状态码, 响应体)"""
+    async def run():
+        headers = [(b'content-length', str(len(body)).encode())]
+        if content_type:
+            headers.append((b'content-type', content_type.encode()))
+        scope = {'type': 'http', 'method': method, 'path': path, 'headers': headers,
+                 'query_string': query}
+        chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)] or [b'']
+        messages = [{'type': 'http.request', 'body': chunk, 'more_body': i < len(chunks) - 1}
+                    for i, chunk in enumerate(chunks)]
+        sent = []
+
+        async def receive():
+            await asyncio.sleep(0)
+            return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        await app(scope, receive, send)
+        return sent[0]['status'], b''.join(m.get('body', b'') for m in sent[1:])
+
+    return asyncio.run(run())
+
+
+def batch_body(files, boundary='batchboundary'):
+    """构造包含多个 files 字段的multipart请求体"""
+    body = b''
+    for filename, data in files:
+        body += (f'--{boundary}\r\n'
+                 f'Content-Disposition: form-data; name="files"; filename="{filename}"\r\n'
+                 f'Content-Type: application/octet-stream\r\n\r\n').encode() + data + b'\r\n'
+    body += f'--{boundary}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+def test_same_responses_as_flask():
+    """/upload、/analyze、/analyze/batch 与Flask应用返回相同的JSON"""
+    from app import app as flask_app
+    client = flask_app.test_client()
+    asgi = AsgiApp(ThreadConfig)
+    corpus = create_corpus()
+
+    requests = [
+        ('/upload',) + multipart_body('photo.jpg', make_large_jpeg()),
+        ('/analyze',) + multipart_body('photo.png', corpus['png_with_exif']),
+        ('/upload',) + multipart_body('photo.exe', corpus['phone_jpeg']),
+        ('/upload', b'', 'multipart/form-data; boundary=empty'),
+        ('/analyze/batch',) + batch_body([('a.jpg', corpus['phone_jpeg']),
+                                          ('b.txt', b'text'),
+                                          ('c.gif', corpus['plain_gif'])]),
+    ]
+    try:
+        for path, body, content_type in requests:
+            expected = client.post(path, data=body, content_type=content_type)
+            status, response = call_app(asgi, 'POST', path, body, content_type)
+            assert status == expected.status_code, path
+            assert json.loads(response) == expected.get_json(), path
+    finally:
+        asgi.stop()
+
+
+def test_header_endpoint():
+    """/analyze/header 与Flask应用返回相同的JSON"""
+    from app import app as flask_app
+    client = flask_app.test_client()
+    asgi = AsgiApp(ThreadConfig)
+    data = make_large_jpeg()
+    header = data[:4096]
+    try:
+        for query, body in ((b'filename=photo.jpg', header), (b'filename=photo.png', header),
+                            (b'compact=1', header), (b'', b'')):
+            expected = client.post('/analyze/header?' + query.decode(), data=body,
+                                   content_type='application/octet-stream')
+            status, response = call_app(asgi, 'POST', '/analyze/header', body,
+                                        'application/octet-stream', query=query)
+            assert status == expected.status_code, query
+            assert json.loads(response) == expected.get_json(), query
+    finally:
+        asgi.stop()
+
+
+def test_routing_and_limits():
+    """页面、未知路径和请求体大小限制"""
+    class SmallConfig(ThreadConfig):
+        MAX_CONTENT_LENGTH = 1024
+
+    asgi = AsgiApp(SmallConfig)
+    try:
+        status, body = call_app(asgi, 'GET', '/')
+        assert status == 200 and b'<html' in body.lower()
+        assert call_app(asgi, 'GET', '/missing')[0] == 404
+        assert call_app(asgi, 'GET', '/upload')[0] == 405
+
+        body, content_type = multipart_body('photo.jpg', make_large_jpeg())
+        assert call_app(asgi, 'POST', '/upload', body, content_type)[0] == 413
+    finally:
+        asgi.stop()
+
+
+def test_process_executor():
+    """默认使用进程池执行分析"""
+    asgi = AsgiApp()
+    body, content_type = multipart_body('photo.jpg', create_corpus()['phone_jpeg'])
+    try:
+        status, response = call_app(asgi, 'POST', '/upload', body, content_type, chunk_size=512)
+        assert status == 200
+        assert json.loads(response)['success']
+    finally:
+        asgi.stop()
+
+
+def test_streaming_batch():
+    """?stream=1 时每个文件一行，条目与Flask的流式响应相同"""
+    from app import app as flask_app
+    client = flask_app.test_client()
+    asgi = AsgiApp(ThreadConfig)
+    corpus = create_corpus()
+    body, content_type = batch_body([('a.jpg', corpus['phone_jpeg']), ('b.txt', b'text'),
+                                     ('c.png', corpus['png_with_exif'])])
+    try:
+        status, response = call_app(asgi, 'POST', '/analyze/batch', body, content_type, query=b'stream=1')
+        expected = client.post('/analyze/batch?stream=1', data=body, content_type=content_type)
+        assert status == 200
+        lines = [json.loads(line) for line in response.decode().splitlines()]
+        expected_lines = [json.loads(line) for line in expected.get_data(as_text=True).splitlines()]
+        assert sorted(lines, key=lambda item: item['index']) == \
+            sorted(expected_lines, key=lambda item: item['index'])
+        assert [item['index'] for item in lines][0] == 1
+    finally:
+        asgi.stop()
+
+
+if __name__ == "__main__":
+    test_same_responses_as_flask()
+    test_header_endpoint()
+    test_routing_and_limits()
+    test_process_executor()
+    test_streaming_batch()
+    print("所有测试通过")
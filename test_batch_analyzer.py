@@ -0,0 +1,136 @@
+"""
+测试批量分析：进程池并行分析，结果按输入顺序返回
+"""
+
+import io
+import time
+import json
+from batch_analyzer import analyze_batch, iter_batch, shutdown_executor
+from photo_analyzer import analyze_photo_data
+from test_exif_parser import create_corpus
+from test_stream_ingest import make_large_jpeg
+
+
+def test_batch_order():
+    """进程池结果与逐个分析一致，顺序不变"""
+    contents = list(create_corpus().values()) * 3
+    expected = [analyze_photo_data(content) for content in contents]
+
+    assert analyze_batch(contents, workers=0) == expected
+    assert analyze_batch(contents, workers=2) == expected
+    assert analyze_batch([], workers=2) == []
+    shutdown_executor()
+
+
+def test_batch_endpoint():
+    """/analyze/batch 返回每个文件的结果"""
+    from app import app
+    corpus = create_corpus()
+    saved = {key: app.config[key] for key in ('BATCH_WORKERS', 'BATCH_MAX_FILES', 'BATCH_MAX_TOTAL_BYTES')}
+    try:
+        app.config['BATCH_WORKERS'] = 2
+        client = app.test_client()
+
+        files = [(io.BytesIO(corpus['phone_jpeg']), 'a.jpg'),
+                 (io.BytesIO(b'not an image'), 'b.exe'),
+                 (io.BytesIO(corpus['png_with_exif']), 'c.png')]
+        response = client.post('/analyze/batch', data={'files': files},
+                               content_type='multipart/form-data')
+        assert response.status_code == 200
+        body = response.get_json()
+        assert body['count'] == 3
+        assert [item['filename'] for item in body['results']] == ['a.jpg', 'b.exe', 'c.png']
+        assert body['results'][0]['result'] == analyze_photo_data(corpus['phone_jpeg'])
+        assert body['results'][1]['error'] == '不支持的文件格式'
+        assert body['results'][2]['result'] == analyze_photo_data(corpus['png_with_exif'])
+
+        response = client.post('/analyze/batch', data={}, content_type='multipart/form-data')
+        assert response.status_code == 400
+
+        app.config['BATCH_MAX_FILES'] = 2
+        files = [(io.BytesIO(corpus['phone_jpeg']), f'{i}.jpg') for i in range(3)]
+        response = client.post('/analyze/batch', data={'files': files},
+                               content_type='multipart/form-data')
+        assert response.status_code == 400
+
+        app.config['BATCH_MAX_TOTAL_BYTES'] = 1024
+        files = [(io.BytesIO(corpus['phone_jpeg']), 'a.jpg')]
+        response = client.post('/analyze/batch', data={'files': files},
+                               content_type='multipart/form-data')
+        assert response.status_code == 413
+    finally:
+        app.config.update(saved)
+        shutdown_executor()
+
+
+def test_iter_batch():
+    """按完成顺序产出，每个下标恰好一次，结果与逐个分析一致"""
+    contents = list(create_corpus().values()) * 3
+    expected = [analyze_photo_data(content) for content in contents]
+
+    for workers in (0, 2):
+        produced = list(iter_batch(contents, workers=workers))
+        assert sorted(index for index, _ in produced) == list(range(len(contents)))
+        assert all(result == expected[index] for index, result in produced)
+
+    # 提前关闭生成器时取消剩余任务
+    stream = iter_batch(contents, workers=2)
+    next(stream)
+    stream.close()
+    assert list(iter_batch([], workers=2)) == []
+    shutdown_executor()
+
+
+def test_streaming_endpoint():
+    """?stream=1 返回NDJSON，每个文件一行，被拒绝的文件最先输出"""
+    from app import app
+    corpus = create_corpus()
+    client = app.test_client()
+    files = [(io.BytesIO(corpus['phone_jpeg']), 'a.jpg'),
+             (io.BytesIO(b'not an image'), 'b.exe'),
+             (io.BytesIO(corpus['png_with_exif']), 'c.png')]
+    response = client.post('/analyze/batch?stream=1', data={'files': files},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.headers.get('Content-Length') is None
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert lines[0] == {'index': 1, 'filename': 'b.exe', 'error': '不支持的文件格式'}
+    results = {item['index']: item for item in lines[1:]}
+    assert results[0]['filename'] == 'a.jpg'
+    assert results[0]['result'] == analyze_photo_data(corpus['phone_jpeg'])
+    assert results[2]['result'] == analyze_photo_data(corpus['png_with_exif'])
+
+    # 也可以通过 Accept 头请求
+    files = [(io.BytesIO(corpus['phone_jpeg']), 'a.jpg')]
+    response = client.post('/analyze/batch', data={'files': files}, content_type='multipart/form-data',
+                           headers={'Accept': 'application/x-ndjson'})
+    assert response.mimetype == 'application/x-ndjson'
+    shutdown_executor()
+
+
+def test_batch_speed():
+    """对比逐个分析与进程池批量分析的耗时"""
+    data = make_large_jpeg((800, 600))
+    contents = [data] * 200
+
+    start = time.perf_counter()
+    for content in contents:
+        analyze_photo_data(content)
+    serial_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    analyze_batch(contents)
+    batch_time = time.perf_counter() - start
+    shutdown_executor()
+
+    print(f"逐个分析: {serial_time:.3f}秒, 进程池批量: {batch_time:.3f}秒")
+
+
+if __name__ == "__main__":
+    test_batch_order()
+    test_batch_endpoint()
+    test_iter_batch()
+    test_streaming_endpoint()
+    test_batch_speed()
+    print("所有测试通过")
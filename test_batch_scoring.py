@@ -0,0 +1,218 @@
+"""
+测试向量化批量评分：与逐张调用 check_integrity 的结果完全一致
+"""
+
+import random
+import time
+from batch_scoring import (
+    np, score_batch, records_to_columns, parse_timestamps, describe_bits, WARNING_BITS
+)
+from exif_integrity_checker import ExifIntegrityChecker, check_exif_integrity
+from exif_layout import LayoutIndex
+from exif_parser import parse_exif
+from exif_time import parse_datetime
+from field_plan import PhotoRecord, build_record
+from quant_tables import QuantIndex
+from thumbnail_check import ThumbnailComparison
+from test_exif_parser import create_corpus
+
+
+def make_record(**fields):
+    record = PhotoRecord()
+    for name, value in fields.items():
+        setattr(record, name, value)
+    return record
+
+
+def edge_records():
+    """构造覆盖各条规则边界的记录"""
+    base = {'Make': 'Apple', 'Model': 'iPhone 13', 'DateTime': '2024:01:01 10:00:00'}
+    times = ['2024:01:01 10:00:00', '2024:01:01 11:00:00', '2024:01:01 11:00:01',
+             '2024:1:1 10:0:0', '2024:01:01\t10:00:00', ' 2024:01:01 10:00:00',
+             '2024:02:29 10:00:00', '2023:02:29 10:00:00', '2024:02:30 10:00:00',
+             '2024:01:01 10:00:60', '0000:01:01 10:00:00', '0001:01:01 00:00:00',
+             '1969:12:31 23:59:59', '9999:12:31 23:59:59', '2024-01-01 10:00:00',
+             '2024:13:01 10:00:00', '2024:01:01 24:00:00', '', None, '    :  :     :  :  ',
+             '2024:01:01 10:00:00\x00', '2024:01:01 10:00:0\x00', '\x002024:01:01 10:00:00',
+             '2024:01:01 10:00:00\x00\x00']
+    records = []
+    for dt in times:
+        for dto in (None, '2024:01:01 10:00:00', '2023:12:31 10:00:00'):
+            records.append(make_record(**{**base, 'DateTime': dt, 'DateTimeOriginal': dto,
+                                          'DateTimeDigitized': '2024:01:01 10:30:00'}))
+    for software in (None, '', 'Adobe Photoshop CC', 'GIMP 2.10', 'iOS 17.0', 'MyEditor v1',
+                     'Snapseed', 'photoshop'):
+        records.append(make_record(**base, Software=software, HostComputer=software))
+    for make, model in (('Apple', 'Galaxy S23'), ('SAMSUNG', 'SM-G991'), ('Acme', 'X1'),
+                        ('', 'X1'), (None, 'X1'), ('Canon', None), ('Canon', '')):
+        records.append(make_record(**{**base, 'Make': make, 'Model': model}))
+    # 小数秒、时区和GPS时间
+    for subsec in (None, '', '5', '999999', '9999999', 'ab', '  '):
+        for offset in (None, '', '+01:00', '-05:30', '+15:00', 'bad', '   :  '):
+            records.append(make_record(**{**base, 'DateTime': '2024:01:01 11:00:00', 'SubSecTime': subsec,
+                                          'DateTimeOriginal': '2024:01:01 10:00:00',
+                                          'OffsetTime': offset, 'OffsetTimeOriginal': '+00:00'}))
+    for date in (None, '', '2024:01:01', '2024:01:02', '2023:12:31', '2024:02:30', 'bad'):
+        for gps_time in (None, 0, 10 * 3600 * 10 ** 6, 23 * 3600 * 10 ** 6):
+            for offset in (None, '+10:00', '-08:00'):
+                records.append(make_record(**{**base, 'DateTimeOriginal': '2024:01:01 10:00:00',
+                                              'OffsetTimeOriginal': offset,
+                                              'GPSDate': date, 'GPSTimeStamp': gps_time}))
+    for iso in (None, 0, 24, 25, 102400, 102401):
+        records.append(make_record(**base, ISOSpeedRatings=iso))
+        records.append(make_record(**{**base, 'Make': 'Canon', 'Model': 'Canon EOS R5'}, ISOSpeedRatings=iso))
+    for focal in (None, 0.0, 0.5, 1.0, 1000.0, 1000.5, float('nan'), float('inf')):
+        records.append(make_record(**base, FocalLength=focal))
+    for focal in (None, 1.57, 1.5, 5.7, 9.0, 9.1, float('nan')):
+        records.append(make_record(**{**base, 'Model': 'iPhone 13 Pro'}, FocalLength=focal))
+    return records
+
+
+def corpus_records():
+    records = []
+    for data in create_corpus().values():
+        records.append(build_record(parse_exif(data)))
+    return records
+
+
+def assert_matches(records, quant_index=None, layout_index=None):
+    """逐条比较批量评分与 check_integrity 的结果"""
+    full_checker = ExifIntegrityChecker(confidence_ceiling=None, quant_index=quant_index,
+                                        layout_index=layout_index)
+    checker = ExifIntegrityChecker(quant_index=quant_index, layout_index=layout_index)
+    scores = score_batch(records_to_columns(records), checker)
+    for index, record in enumerate(records):
+        full = full_checker.check_integrity(record)
+        default = checker.check_integrity(record)
+        assert scores['indicator_count'][index] == len(full['indicators']), (index, full)
+        assert scores['warning_count'][index] == len(full['warnings']), (index, full)
+        assert scores['confidence'][index] == full['confidence'] == default['confidence']
+        assert bool(scores['is_modified'][index]) == default['is_modified']
+
+
+def test_matches_check_integrity():
+    """语料和边界记录的评分与逐张检查一致"""
+    records = corpus_records() + edge_records()
+    assert_matches(records)
+    print(f"共比较 {len(records)} 条记录")
+
+
+def test_quantization():
+    """量化表规则的评分与逐张检查一致"""
+    index = QuantIndex([
+        {'fingerprint': 'e1', 'kind': 'editor', 'make': '', 'model': '', 'label': '编辑软件'},
+        {'fingerprint': 'c1', 'kind': 'camera', 'make': 'apple', 'model': 'iPhone 13', 'label': ''},
+        {'fingerprint': 'c2', 'kind': 'camera', 'make': 'canon', 'model': 'EOS R5', 'label': ''},
+    ])
+    records = []
+    for fingerprint in (None, 'e1', 'c1', 'c2', 'unknown'):
+        for make, model in (('Apple', 'iPhone 13'), ('Canon', 'Canon EOS R5'), ('Acme', 'X1'), (None, None)):
+            records.append(make_record(Make=make, Model=model, DateTime='2024:01:01 10:00:00',
+                                       quantization=fingerprint))
+    assert_matches(records, index)
+
+
+def test_exif_layout():
+    """EXIF结构布局规则的评分与逐张检查一致"""
+    index = LayoutIndex([
+        {'make': 'apple', 'model': '', 'byte_order': 'MM'},
+        {'make': 'canon', 'model': 'EOS R5', 'byte_order': 'II', 'ifd_order': '0EI1', 'unsorted': '-'},
+    ])
+    layouts = [None] + [tags.layout for tags in map(parse_exif, create_corpus().values()) if tags.layout]
+    records = []
+    for layout in layouts:
+        for make, model in (('Apple', 'iPhone 13'), ('Canon', 'Canon EOS R5'), ('Acme', 'X1'), (None, None)):
+            records.append(make_record(Make=make, Model=model, DateTime='2024:01:01 10:00:00',
+                                       exif_layout=layout))
+    assert_matches(records, layout_index=index)
+    scores = score_batch(records_to_columns(records), ExifIntegrityChecker(layout_index=index))
+    assert 'exif_layout_mismatch' in describe_bits(scores['indicators'][4])
+
+
+def test_thumbnail():
+    """缩略图规则的评分与逐张检查一致"""
+    records = [make_record(Make='Canon', Model='EOS R5', DateTime='2024:01:01 10:00:00',
+                           thumbnail=None if difference is None else
+                           ThumbnailComparison(difference, (160, 120), (8192, 5464)))
+               for difference in (None, 0.0, 0.05, 0.08, 0.0801, 0.5)]
+    assert_matches(records)
+    scores = score_batch(records_to_columns(records))
+    assert [describe_bits(mask) for mask in scores['indicators']] == [[]] * 4 + [['thumbnail_mismatch']] * 2
+
+
+def test_bits():
+    """位掩码指出具体命中的规则"""
+    records = [make_record(Make='Canon', Model='Galaxy S21', Software='Adobe Photoshop',
+                           DateTime='2024:01:01 10:00:00', DateTimeOriginal='2024:01:02 10:00:00',
+                           DateTimeDigitized='bad', ISOSpeedRatings=10)]
+    scores = score_batch(records_to_columns(records))
+    assert describe_bits(scores['indicators'][0]) == [
+        'editing_software:Software', 'suspicious_software:Software',
+        'timestamp_mismatch:DateTime:DateTimeOriginal',
+        'device_mismatch', 'abnormal_iso']
+    assert describe_bits(scores['warnings'][0], WARNING_BITS) == ['unparsable_time:DateTimeDigitized']
+
+    records = [make_record(Make='Nikon', Model='Q 9000', DateTime='2024:01:01 10:00:00')]
+    assert_matches(records)
+    scores = score_batch(records_to_columns(records))
+    assert scores['indicators'][0] == 0 and scores['warnings'][0] == 0
+
+
+def test_parse_timestamps():
+    """快速解析与 datetime.strptime 得到相同的秒数"""
+    values = ['1970:01:01 00:00:01', '2000:02:29 12:34:56', '2024:1:5 1:2:3', None, 'x']
+    present, valid, seconds = parse_timestamps(values)
+    assert list(present) == [True, True, True, False, True]
+    assert list(valid) == [True, True, True, False, False]
+    assert seconds[0] == 1 and seconds[1] == 951827696 and seconds[2] == 1704416523
+
+    # numpy 字符串数组会去掉末尾的NUL，判断结果仍与 parse_datetime 一致
+    values = ['2023:01:01 10:00:00\x00', '2023:01:01 10:00:0\x00', '2023:01:01 10:00:\x00\x00',
+              '2023:01:01 10:00:00', '2023:01:01\x0010:00:00', '\x00' * 19]
+    present, valid, seconds = parse_timestamps(values)
+    assert list(valid) == [parse_datetime(value) is not None for value in values] == \
+        [False, False, False, True, False, False]
+
+
+def test_random_batch():
+    """随机组合字段的大批量评分"""
+    rng = random.Random(13)
+    choices = {
+        'Make': [None, '', 'Apple', 'Canon', 'Sony', 'Acme'],
+        'Model': [None, 'iPhone 15', 'EOS R5', 'ILCE-7M4', 'Pixel 8'],
+        'Software': [None, '', '17.1', 'Adobe Lightroom', 'Picsart'],
+        'DateTime': [None, '', '2024:05:01 09:00:00', '2024:05:01 11:00:00', '2024:5:1 9:0:0', 'bad'],
+        'DateTimeOriginal': [None, '2024:05:01 09:00:00', '2024:05:01 09:59:59'],
+        'DateTimeDigitized': [None, '2024:05:01 09:00:00', '2024:04:30 09:00:00'],
+        'ISOSpeedRatings': [None, 0, 12, 100, 204800],
+        'FocalLength': [None, 0.0, 0.2, 5.7, 2000.0],
+    }
+    records = [make_record(**{field: rng.choice(values) for field, values in choices.items()})
+               for _ in range(20000)]
+
+    start = time.perf_counter()
+    for record in records:
+        check_exif_integrity(record)
+    per_photo = time.perf_counter() - start
+
+    columns = records_to_columns(records)
+    start = time.perf_counter()
+    score_batch(columns)
+    batched = time.perf_counter() - start
+    print(f"{len(records)} 张: 逐张 {per_photo * 1000:.1f} 毫秒, 批量 {batched * 1000:.1f} 毫秒")
+
+    assert_matches(records[:2000])
+
+
+if __name__ == "__main__":
+    if np is None:
+        print("未安装NumPy，跳过批量评分测试")
+    else:
+        test_matches_check_integrity()
+        test_quantization()
+        test_exif_layout()
+        test_thumbnail()
+        test_bits()
+        test_parse_timestamps()
+        test_random_batch()
+        print("所有测试通过")
@@ -0,0 +1,132 @@
+"""
+测试批量扫描目录：并行分析、JSONL输出和断点续扫
+"""
+
+import json
+import os
+import tempfile
+from bulk_scan import scan, iter_image_files, load_checkpoint
+from test_exif_parser import create_corpus
+
+
+def create_tree(directory, copies=5):
+    """生成包含子目录的测试目录树"""
+    corpus = create_corpus()
+    for index in range(copies):
+        subdirectory = os.path.join(directory, f'album{index}', 'nested')
+        os.makedirs(subdirectory)
+        for name, data in corpus.items():
+            extension = 'png' if name.startswith('png') else 'gif' if name.endswith('gif') else 'jpg'
+            with open(os.path.join(subdirectory, f'{name}.{extension}'), 'wb') as f:
+                f.write(data)
+        with open(os.path.join(subdirectory, 'notes.txt'), 'w') as f:
+            f.write('not a photo')
+    return copies * len(corpus)
+
+
+def read_records(path):
+    with open(path, 'r', encoding='utf-8', errors='surrogateescape') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_scan_and_resume():
+    """扫描全部文件，重复运行时跳过已完成的文件"""
+    with tempfile.TemporaryDirectory() as directory:
+        photos = os.path.join(directory, 'photos')
+        total = create_tree(photos)
+        output = os.path.join(directory, 'results.jsonl')
+
+        paths = list(iter_image_files([photos]))
+        assert len(paths) == total
+        assert not any(path.endswith('.txt') for path in paths)
+
+        summary = scan([photos], output, workers=2, batch_size=4, quiet=True)
+        print(f"扫描结果: {summary}")
+        assert summary['processed'] == total
+        records = read_records(output)
+        assert sorted(record['path'] for record in records) == sorted(paths)
+        assert all(record['result']['success'] for record in records)
+        assert load_checkpoint(output + '.checkpoint') == set(paths)
+
+        summary = scan([photos], output, workers=2, quiet=True)
+        assert summary['processed'] == 0
+        assert summary['skipped'] == total
+        assert len(read_records(output)) == total
+
+
+def test_resume_after_interrupt():
+    """检查点只包含部分文件时只分析剩余文件"""
+    with tempfile.TemporaryDirectory() as directory:
+        photos = os.path.join(directory, 'photos')
+        total = create_tree(photos, copies=2)
+        output = os.path.join(directory, 'results.jsonl')
+        paths = list(iter_image_files([photos]))
+
+        with open(output + '.checkpoint', 'w', encoding='utf-8') as f:
+            f.write(''.join(path + '\n' for path in paths[:5]))
+
+        summary = scan([photos], output, workers=0, quiet=True)
+        assert summary['processed'] == total - 5
+        assert summary['skipped'] == 5
+        assert {record['path'] for record in read_records(output)} == set(paths[5:])
+
+
+def test_non_utf8_filename():
+    """文件名不是合法UTF-8时按原始字节写出，不影响其他文件"""
+    if os.name != 'posix':
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        photos = os.path.join(directory, 'photos')
+        os.makedirs(photos)
+        data = create_corpus()['phone_jpeg']
+        for name in (b'caf\xe9.jpg', b'ok.jpg'):
+            with open(os.path.join(os.fsencode(photos), name), 'wb') as f:
+                f.write(data)
+        output = os.path.join(directory, 'results.jsonl')
+
+        store = os.path.join(directory, 'store.db')
+        summary = scan([photos], output, workers=0, quiet=True, store_path=store)
+        assert summary['processed'] == 2 and summary['failed'] == 0
+        paths = {record['path'] for record in read_records(output)}
+        assert os.path.join(photos, os.fsdecode(b'caf\xe9.jpg')) in paths
+        assert load_checkpoint(output + '.checkpoint') == paths
+        assert scan([photos], output, workers=0, quiet=True)['skipped'] == 2
+
+
+def test_resume_after_partial_write():
+    """中断时写了一半的结果行和检查点行在重新运行时被截掉"""
+    with tempfile.TemporaryDirectory() as directory:
+        photos = os.path.join(directory, 'photos')
+        total = create_tree(photos, copies=1)
+        output = os.path.join(directory, 'results.jsonl')
+        paths = list(iter_image_files([photos]))
+
+        scan([photos], output, workers=0, quiet=True)
+        records = read_records(output)
+        # 模拟在写入最后两条结果和一条检查点时被中断
+        with open(output, 'r+b') as f:
+            lines = f.read().splitlines(keepends=True)
+            f.seek(0)
+            f.truncate()
+            f.write(b''.join(lines[:-2]) + lines[-2][:20])
+        with open(output + '.checkpoint', 'r+b') as f:
+            lines = f.read().splitlines(keepends=True)
+            f.seek(0)
+            f.truncate()
+            f.write(b''.join(lines[:-2]) + lines[-2][:-5])
+
+        assert len(load_checkpoint(output + '.checkpoint')) == total - 2
+        summary = scan([photos], output, workers=0, quiet=True)
+        assert summary['processed'] == 2
+        resumed = read_records(output)
+        assert len(resumed) == total
+        assert sorted(record['path'] for record in resumed) == sorted(paths)
+        assert resumed[:-2] == records[:-2]
+
+
+if __name__ == "__main__":
+    test_scan_and_resume()
+    test_resume_after_interrupt()
+    test_non_utf8_filename()
+    test_resume_after_partial_write()
+    print("所有测试通过")
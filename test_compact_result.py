@@ -0,0 +1,118 @@
+"""
+测试紧凑结果：固定的字段编号和指标编号、原始数值、与完整结果对应
+"""
+
+import json
+import pickle
+from asgi_app import compact_requested
+from batch_analyzer import analyze_batch
+from exif_integrity_checker import MESSAGES, ExifIntegrityChecker, Finding, compact_message
+from field_plan import FIELD_IDS, FIELD_NAMES, SIGNAL_NAMES, build_record
+from photo_analyzer import analyze_photo_data, compact_schema
+from test_exif_parser import create_corpus
+from test_stream_ingest import multipart_body
+
+
+def test_stable_codes():
+    """编号不重复，覆盖所有字段；已发布的编号不能改变"""
+    assert set(FIELD_IDS) == set(FIELD_NAMES + SIGNAL_NAMES)
+    assert len(set(FIELD_IDS.values())) == len(FIELD_IDS)
+    codes = [code for code, _, _ in MESSAGES.values()]
+    assert len(set(codes)) == len(codes) and 0 not in codes
+
+    assert (FIELD_IDS['Make'], FIELD_IDS['DateTime'], FIELD_IDS['ISOSpeedRatings']) == (1, 8, 21)
+    assert MESSAGES['editing_software'][0] == 1
+    assert MESSAGES['timestamp_mismatch'][0] == 3
+    assert MESSAGES['missing_critical_fields'][0] == 14
+    assert MESSAGES['unknown_manufacturer'][0] == 104
+
+
+def test_finding():
+    """文本与模板一致，序列化后保留编号和参数，普通文本编号为0"""
+    finding = Finding('timestamp_mismatch', 'DateTime', 'DateTimeOriginal', 2.25)
+    assert finding == '时间戳不一致: DateTime和DateTimeOriginal相差2.2小时'
+    assert finding.compact() == [3, 8, 9, 2.25]
+
+    restored = pickle.loads(pickle.dumps(finding))
+    assert restored == finding and restored.compact() == finding.compact()
+    assert json.dumps([finding], ensure_ascii=False) == json.dumps([str(finding)], ensure_ascii=False)
+
+    assert compact_message('自定义规则的输出') == [0, '自定义规则的输出']
+    missing = Finding('missing_critical_fields', ['Make', 'DateTime'], text='缺失关键EXIF字段: Make, DateTime')
+    assert missing.compact() == [14, [1, 8]]
+
+
+def test_check_integrity():
+    """紧凑的完整性结果与完整结果一一对应，不含 details"""
+    checker = ExifIntegrityChecker(confidence_ceiling=None)
+    record = build_record({'Make': 'Canon', 'Model': 'D850', 'Software': 'Adobe Photoshop CC',
+                           'DateTimeOriginal': '2024:01:01 10:00:00', 'DateTimeDigitized': '2024:01:01 13:00:00',
+                           'ISOSpeedRatings': 204800})
+    full = checker.check_integrity(record)
+    compact = checker.check_integrity(record, compact=True)
+
+    assert set(compact) == {'is_modified', 'confidence', 'indicators', 'warnings'}
+    assert compact['confidence'] == full['confidence']
+    assert len(compact['indicators']) == len(full['indicators'])
+    assert [1, 'Adobe Photoshop'] in compact['indicators']
+    assert [3, 9, 10, 3.0] in compact['indicators']
+    assert [14, [8]] in compact['indicators']
+    assert [15, 204800] in compact['indicators']
+
+    schema = compact_schema()
+    templates = {code: template for code, (name, template) in schema['messages'].items()}
+    assert templates[15].format(204800) in full['indicators']
+
+
+def test_analysis_result():
+    """紧凑结果使用原始数值，体积比完整结果小数倍"""
+    corpus = create_corpus()
+    data = corpus['edited_jpeg']
+    full = analyze_photo_data(data)
+    compact = analyze_photo_data(data, compact=True)
+
+    assert compact['success'] and compact['error'] is None
+    fields = dict(compact['fields'])
+    assert fields[FIELD_IDS['Make']] == 'Canon' and fields[FIELD_IDS['ISOSpeedRatings']] == 204800
+    assert fields[FIELD_IDS['ExposureTime']] == 2.0 and fields[FIELD_IDS['FocalLength']] == 1200.0
+    assert compact['image'][2] == 'JPEG'
+    assert len(compact['integrity_check']['indicators']) == len(full['integrity_check']['indicators'])
+
+    # 与Flask响应相同的序列化方式（非ASCII字符转义）
+    full_size = len(json.dumps(analyze_photo_data(corpus['phone_jpeg']), separators=(',', ':')))
+    compact_size = len(json.dumps(analyze_photo_data(corpus['phone_jpeg'], compact=True), separators=(',', ':')))
+    print(f"完整结果 {full_size} 字节, 紧凑结果 {compact_size} 字节")
+    assert compact_size * 3 < full_size
+
+    # 两种结果分别缓存，互不覆盖
+    assert analyze_photo_data(data) == full
+    assert analyze_photo_data(data, compact=True) == compact
+    assert analyze_batch([data, corpus['phone_jpeg']], workers=0, compact=True)[0] == compact
+
+
+def test_endpoints():
+    """?compact=1 返回紧凑结果，/analyze/codes 返回编号说明"""
+    from app import app
+    client = app.test_client()
+    body, content_type = multipart_body('photo.jpg', create_corpus()['phone_jpeg'])
+
+    result = client.post('/analyze?compact=1', data=body, content_type=content_type).get_json()
+    assert result['success'] and 'device_info' not in result
+    assert [FIELD_IDS['Model'], 'iPhone 13 Pro'] in result['fields']
+    assert 'device_info' in client.post('/analyze', data=body, content_type=content_type).get_json()
+
+    codes = client.get('/analyze/codes').get_json()
+    assert codes['fields'][str(FIELD_IDS['Make'])][0] == 'Make'
+    assert codes['messages']['1'][0] == 'editing_software'
+
+    assert compact_requested({'query_string': b'compact=true'})
+    assert not compact_requested({'query_string': b''}) and not compact_requested({})
+
+
+if __name__ == "__main__":
+    test_stable_codes()
+    test_finding()
+    test_check_integrity()
+    test_analysis_result()
+    test_endpoints()
+    print("所有测试通过")
@@ -0,0 +1,123 @@
+"""
+测试设备目录：编译、mmap查找、与完整性检查的集成
+"""
+
+import os
+import random
+import tempfile
+import time
+from config import Config
+from device_catalog import DeviceCatalog, build_catalog, load_source, normalize_key
+from exif_integrity_checker import ExifIntegrityChecker
+from field_plan import build_record
+
+SOURCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'device_catalog.csv')
+
+
+def test_prebuilt_catalog_up_to_date():
+    """仓库中的二进制目录与源文件一致"""
+    makes, models = load_source(SOURCE_PATH)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'catalog.bin')
+        build_catalog(makes, models, path)
+        with open(path, 'rb') as f:
+            rebuilt = f.read()
+    with open(Config.DEVICE_CATALOG_PATH, 'rb') as f:
+        assert f.read() == rebuilt, '请运行 python device_catalog.py build data/device_catalog.csv'
+    print(f"目录包含 {len(models)} 个型号, {len(rebuilt)} 字节")
+
+
+def test_lookup():
+    """规范化键查找：忽略大小写和标点，去掉型号中的制造商前缀"""
+    catalog = DeviceCatalog(Config.DEVICE_CATALOG_PATH)
+    try:
+        assert normalize_key('NIKON Z 6_2') == 'nikonz62'
+        # 全角字符、重音字母和连字按ASCII折叠，其他文字中的形似字符去掉
+        assert normalize_key('ＳＯＮＹ ＩＬＣＥ－７Ｍ４') == 'sonyilce7m4'
+        assert normalize_key('Léica Q³') == normalize_key('LEICA Q3') == 'leicaq3'
+        assert normalize_key('ﬁlm') == 'film'
+        assert normalize_key('\u0421anon') == 'anon'   # 西里尔字母 С
+        assert normalize_key('Nikon\u0660') == 'nikon'  # 阿拉伯数字 ٠
+        assert catalog.manufacturer('ＣＡＮＯＮ') == 'canon'
+        assert catalog.manufacturer('\u0421anon') is None
+        assert catalog.manufacturer('NIKON CORPORATION') == 'nikon'
+        assert catalog.manufacturer('Canon Inc. Japan') == 'canon'
+        assert catalog.manufacturer('UnknownBrand') is None
+
+        manufacturer, entry, others = catalog.resolve('Canon', 'Canon EOS R5')
+        assert manufacturer == 'canon' and entry.model == 'EOS R5' and entry.iso_range == (50, 102400)
+        assert catalog.resolve('NIKON CORPORATION', 'NIKON Z 7II')[1].model == 'Z 7_2'
+        assert catalog.resolve('samsung', 'SM-G991U')[1].model == 'Galaxy S21'
+
+        # 型号属于其他制造商
+        manufacturer, entry, others = catalog.resolve('Canon', 'D850')
+        assert manufacturer == 'canon' and entry is None and others == ('nikon',)
+        # 没有收录的型号
+        assert catalog.resolve('Canon', 'EOS 9999')[1:] == (None, ())
+    finally:
+        catalog.close()
+
+
+def test_large_catalog():
+    """数千个型号时查找耗时不随目录大小增长"""
+    rng = random.Random(14)
+    makes = {f'brand{index}': [] for index in range(40)}
+    models = [(f'brand{index % 40}', f'Model {index}-{rng.randrange(10 ** 6)}', [], 0, 0, 0, 0)
+              for index in range(5000)]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'catalog.bin')
+        count = build_catalog(makes, models, path)
+        catalog = DeviceCatalog(path)
+        try:
+            assert catalog.entry_count == count == 5000
+            start = time.perf_counter()
+            for make, model, *_ in models:
+                assert catalog.lookup(model)[0].make == make
+            elapsed = time.perf_counter() - start
+            assert catalog.lookup('No Such Model') == []
+        finally:
+            catalog.close()
+    print(f"5000个型号查找共 {elapsed * 1000:.1f} 毫秒, 文件 {count} 条")
+
+
+def test_checker_integration():
+    """目录中的型号精确匹配，并检查该型号的ISO和焦距范围；没有收录的型号不影响置信度"""
+    checker = ExifIntegrityChecker(confidence_ceiling=None)
+    result = checker.check_integrity(build_record({'Make': 'Apple', 'Model': 'iPhone 13 Pro',
+                                                   'DateTime': '2024:01:01 10:00:00', 'FocalLength': 26.0}))
+    assert result['details']['device_info']['catalog_model'] == 'iPhone 13 Pro'
+    assert any('焦距超出' in indicator for indicator in result['indicators'])
+
+    result = checker.check_integrity(build_record({'Make': 'Canon', 'Model': 'Canon EOS R5',
+                                                   'DateTime': '2024:01:01 10:00:00',
+                                                   'ISOSpeedRatings': 40}))
+    assert result['indicators'] == ['ISO值超出EOS R5的范围(50-102400): 40']
+
+    # 单字母特征不再把其他品牌的型号当作匹配
+    result = checker.check_integrity(build_record({'Make': 'Huawei', 'Model': 'Pixel 8',
+                                                   'DateTime': '2024:01:01 10:00:00'}))
+    assert result['indicators'] == ['制造商与型号可能不匹配: Huawei - Pixel 8']
+
+    # 目录中没有收录的型号只在详情中注明，不按型号中的子串猜测是否匹配
+    for make, model in [('Nikon', 'Q 9000'), ('Xiaomi', '23127PN0CC'), ('DJI', 'FC3170')]:
+        result = checker.check_integrity(build_record({'Make': make, 'Model': model,
+                                                       'DateTime': '2024:01:01 10:00:00'}))
+        assert result['indicators'] == [] and result['warnings'] == [] and result['confidence'] == 0
+        assert result['details']['device_info']['catalog_model'] is None
+    result = checker.check_integrity(build_record({'Make': 'samsung', 'Model': 'SM-S9180',
+                                                   'DateTime': '2024:01:01 10:00:00'}))
+    assert result['details']['device_info']['catalog_model'] == 'Galaxy S23 Ultra'
+
+    # 没有目录时只识别制造商
+    checker.device_catalog = None
+    result = checker.check_integrity(build_record({'Make': 'Huawei', 'Model': 'Pixel 8',
+                                                   'DateTime': '2024:01:01 10:00:00'}))
+    assert result['indicators'] == [] and result['warnings'] == []
+
+
+if __name__ == "__main__":
+    test_prebuilt_catalog_up_to_date()
+    test_lookup()
+    test_large_catalog()
+    test_checker_integration()
+    print("所有测试通过")
@@ -0,0 +1,119 @@
+"""
+测试EXIF结构布局：解析时记录布局、与索引比较、采集命令
+"""
+
+import os
+import struct
+import tempfile
+import time
+from exif_integrity_checker import ExifIntegrityChecker
+from exif_layout import LayoutIndex, load_layout_rows, main as layout_main
+from exif_parser import parse_exif
+from field_plan import build_record
+from test_exif_parser import create_corpus
+
+
+def rewritten_jpeg():
+    """
+    手工构造重写过的EXIF：IFD0中标签乱序，数据之间留有空隙，外部数据从奇数偏移开始
+    """
+    entries = [(0x0110, 2, 14, 61), (0x010F, 2, 6, 38)]     # Model 在 Make 之前
+    tiff = bytearray(b'II*\x00' + struct.pack('<I', 8))
+    tiff += struct.pack('<H', len(entries))
+    for tag, kind, count, offset in entries:
+        tiff += struct.pack('<HHII', tag, kind, count, offset)
+    tiff += struct.pack('<I', 0)
+    tiff += b'Apple\x00'
+    tiff += b'\x00' * (61 - len(tiff)) + b'iPhone 13 Pro\x00'
+    app1 = b'Exif\x00\x00' + bytes(tiff)
+    return b'\xFF\xD8\xFF\xE1' + struct.pack('>H', len(app1) + 2) + app1 + b'\xFF\xD9'
+
+
+def test_corpus_layouts():
+    """PIL写出的语料的布局，以及手工构造的重写布局"""
+    corpus = create_corpus()
+    assert parse_exif(corpus['phone_jpeg']).layout.fingerprint == 'II|8|0EG|packed|even|'
+    assert parse_exif(corpus['phone_jpeg_big_endian']).layout.fingerprint == 'MM|8|0EG|packed|even|'
+    assert parse_exif(corpus['edited_jpeg']).layout.fingerprint == 'II|8|0E|packed|even|'
+    assert parse_exif(corpus['plain_jpeg']).layout is None
+
+    tags = parse_exif(rewritten_jpeg())
+    assert tags.get('Make') == 'Apple' and tags.get('Model') == 'iPhone 13 Pro'
+    assert tags.layout.fingerprint == 'II|8|0|gap|odd|0'
+
+
+def test_compare():
+    """型号的记录优先于制造商的记录，任意一条一致即可，否则报告差异最少的一条"""
+    index = LayoutIndex([
+        {'make': 'Apple', 'model': '', 'byte_order': 'MM'},
+        {'make': 'apple', 'model': 'iPhone 15', 'byte_order': 'II', 'ifd_order': '0EIG1',
+         'alignment': 'odd', 'unsorted': '-'},
+        {'make': 'apple', 'model': 'iPhone 15', 'byte_order': 'II', 'ifd_order': '0EG1'},
+    ])
+    layout = parse_exif(create_corpus()['phone_jpeg']).layout
+    assert index.compare(layout, 'apple', 'iPhone 13 Pro') == [('byte_order', 'II', 'MM')]
+    assert index.compare(layout, 'apple', 'Apple iPhone 15') == [('ifd_order', '0EG', '0EG1')]
+    assert index.compare(layout, 'canon', 'EOS R5') == []
+
+    rewritten = parse_exif(rewritten_jpeg()).layout
+    assert index.compare(rewritten, 'apple', 'iPhone 15') == [('ifd_order', '0', '0EG1')]
+
+
+def test_integrity_rule():
+    """字节序与该型号的原图不符时给出指标，布局写入详情"""
+    index = LayoutIndex([{'make': 'apple', 'model': 'iPhone 13 Pro', 'byte_order': 'MM'}])
+    checker = ExifIntegrityChecker(confidence_ceiling=None, layout_index=index)
+    corpus = create_corpus()
+
+    result = checker.check_integrity(build_record(parse_exif(corpus['phone_jpeg'])))
+    assert result['details']['exif_layout'] == 'II|8|0EG|packed|even|'
+    assert 'EXIF结构与Apple设备的原始布局不符: 字节序为II（应为MM）' in result['indicators']
+
+    result = checker.check_integrity(build_record(parse_exif(corpus['phone_jpeg_big_endian'])))
+    assert not any(indicator.startswith('EXIF结构') for indicator in result['indicators'])
+
+    # 没有布局（旧版数据来源）时不检查
+    result = checker.check_integrity(build_record({'Make': 'Apple', 'Model': 'iPhone 13 Pro',
+                                                   'DateTime': '2024:01:01 10:00:00'}))
+    assert 'exif_layout' not in result['details']
+
+
+def test_learn():
+    """采集命令写出的记录可以重新读入，空值写作 '-'"""
+    corpus = create_corpus()
+    with tempfile.TemporaryDirectory() as directory:
+        photo = os.path.join(directory, 'photo.jpg')
+        with open(photo, 'wb') as f:
+            f.write(corpus['phone_jpeg'])
+        index_path = os.path.join(directory, 'layouts.csv')
+        layout_main(['learn', '--make', 'Apple', '--model', 'iPhone 13 Pro', '-i', index_path, photo, photo])
+        layout_main(['learn', '--make', 'Apple', '--model', 'iPhone 13 Pro', '-i', index_path, photo])
+        rows = load_layout_rows(index_path)
+
+    assert len(rows) == 1 and rows[0]['unsorted'] == '-' and rows[0]['make'] == 'apple'
+    index = LayoutIndex(rows)
+    assert index.compare(parse_exif(corpus['phone_jpeg']).layout, 'apple', 'iPhone 13 Pro') == []
+    assert index.compare(parse_exif(rewritten_jpeg()).layout, 'apple', 'iPhone 13 Pro') == [
+        ('ifd_order', '0', '0EG'), ('placement', 'gap', 'packed'),
+        ('alignment', 'odd', 'even'), ('unsorted', '0', '')]
+
+
+def test_parse_cost():
+    """记录布局不增加遍历，解析耗时与之前相当"""
+    data = create_corpus()['phone_jpeg']
+    rounds = 2000
+    start = time.perf_counter()
+    for _ in range(rounds):
+        parse_exif(data)
+    elapsed = (time.perf_counter() - start) / rounds
+    print(f"解析并记录布局: 每张 {elapsed * 1e6:.1f} 微秒")
+    assert elapsed < 0.001
+
+
+if __name__ == "__main__":
+    test_corpus_layouts()
+    test_compare()
+    test_integrity_rule()
+    test_learn()
+    test_parse_cost()
+    print("所有测试通过")
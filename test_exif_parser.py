@@ -0,0 +1,150 @@
+"""
+测试原生EXIF解析器：与旧版 PIL + exifread 合并结果保持一致
+"""
+
+import io
+from PIL import Image
+from PIL.TiffImagePlugin import IFDRational
+from exif_parser import parse_exif, Ratio
+from exif_integrity_checker import check_exif_integrity
+from photo_analyzer import (
+    analyze_photo_from_stream, extract_exif_with_pil_stream, extract_exif_with_exifread_stream
+)
+
+DEVICE_FIELDS = ['Make', 'Model', 'Software', 'LensModel', 'LensMake']
+TECHNICAL_FIELDS = ['DateTime', 'DateTimeOriginal', 'ExposureTime', 'FNumber',
+                    'ISOSpeedRatings', 'FocalLength', 'Flash', 'WhiteBalance',
+                    'ExposureMode', 'MeteringMode', 'Orientation']
+
+
+def build_exif(ifd0=None, exif_ifd=None, gps_ifd=None, endian='<'):
+    """使用PIL构造EXIF数据"""
+    exif = Image.Exif()
+    exif.endian = endian
+    for tag, value in (ifd0 or {}).items():
+        exif[tag] = value
+    if exif_ifd:
+        exif[0x8769] = dict(exif_ifd)
+    if gps_ifd:
+        exif[0x8825] = dict(gps_ifd)
+    return exif
+
+
+def make_image(fmt, exif=None, size=(64, 48), mode='RGB'):
+    """生成测试图片数据"""
+    buffer = io.BytesIO()
+    image = Image.new(mode, size, color=(120, 160, 200) if mode == 'RGB' else 128)
+    if exif is not None:
+        image.save(buffer, fmt, exif=exif)
+    else:
+        image.save(buffer, fmt)
+    return buffer.getvalue()
+
+
+def create_corpus():
+    """构造共享测试语料"""
+    R = IFDRational
+    phone_ifd0 = {0x010F: 'Apple', 0x0110: 'iPhone 13 Pro', 0x0131: '15.0',
+                  0x0132: '2023:12:01 14:30:00', 0x0112: 6,
+                  0x011A: R(72, 1), 0x011B: R(72, 1), 0x0128: 2}
+    phone_exif = {0x9003: '2023:12:01 14:30:00', 0x9004: '2023:12:01 14:30:00',
+                  0x829A: R(1, 120), 0x829D: R(18, 10), 0x8827: 100, 0x920A: R(57, 10),
+                  0x9209: 16, 0xA403: 0, 0xA402: 0, 0x9207: 5,
+                  0xA433: 'Apple', 0xA434: 'iPhone 13 Pro back camera 5.7mm f/1.5'}
+    gps = {0x0001: 'N', 0x0002: (R(31, 1), R(14, 1), R(65, 10)),
+           0x0003: 'E', 0x0004: (R(121, 1), R(28, 1), R(91, 10))}
+
+    edited_ifd0 = {0x010F: 'Canon', 0x0110: 'D850', 0x0131: 'Adobe Photoshop CC 2023 (Windows)',
+                   0x0132: '2024:03:05 10:00:00'}
+    edited_exif = {0x9003: '2024:03:01 08:00:00', 0x8827: 204800, 0x920A: R(1200, 1),
+                   0x829A: R(2, 1), 0x829D: R(11, 1), 0x9209: 25}
+
+    return {
+        'phone_jpeg': make_image('JPEG', build_exif(phone_ifd0, phone_exif, gps)),
+        'phone_jpeg_big_endian': make_image('JPEG', build_exif(phone_ifd0, phone_exif, gps, endian='>')),
+        'edited_jpeg': make_image('JPEG', build_exif(edited_ifd0, edited_exif)),
+        'broken_time_jpeg': make_image('JPEG', build_exif({0x010F: 'Nikon', 0x0110: 'Z7 II',
+                                                           0x0132: '2024-01-01 10:00'})),
+        'png_with_exif': make_image('PNG', build_exif(phone_ifd0, phone_exif)),
+        'plain_jpeg': make_image('JPEG'),
+        'plain_gif': make_image('GIF', mode='L'),
+    }
+
+
+def legacy_lookup(pil_data, exifread_data, field, device):
+    """旧版字段合并逻辑"""
+    if field in pil_data:
+        return pil_data[field]
+    order = ('Image', 'EXIF') if device else ('EXIF', 'Image')
+    for prefix in order:
+        key = f'{prefix} {field}'
+        if key in exifread_data:
+            return str(exifread_data[key])
+    return None
+
+
+def test_parity_with_legacy_merge():
+    """字段提取和完整性检查结果与旧版一致"""
+    print("=== 原生解析器一致性测试 ===\n")
+
+    for name, data in create_corpus().items():
+        pil_data = extract_exif_with_pil_stream(io.BytesIO(data))
+        exifread_data = extract_exif_with_exifread_stream(io.BytesIO(data))
+        tags = parse_exif(data)
+
+        for field in DEVICE_FIELDS + TECHNICAL_FIELDS:
+            expected = legacy_lookup(pil_data, exifread_data, field, field in DEVICE_FIELDS)
+            actual = tags.display(field)
+            assert actual == expected, f'{name} {field}: {actual!r} != {expected!r}'
+
+        legacy_result = check_exif_integrity(pil_data, exifread_data)
+        # 结构布局只有原生解析器能记录，不参与比较
+        tags.layout = None
+        native_result = check_exif_integrity(tags)
+        assert native_result == legacy_result, f'{name}: {native_result} != {legacy_result}'
+        print(f"✅ {name}: {len(tags)} 个标签，指标 {len(native_result['indicators'])} 个")
+
+
+def test_parsed_values():
+    """解析值类型"""
+    tags = parse_exif(create_corpus()['phone_jpeg'])
+
+    assert tags.byte_order == 'II'
+    assert tags['Make'] == 'Apple'
+    assert tags['ISOSpeedRatings'] == 100
+    assert isinstance(tags['FNumber'], Ratio)
+    assert tags.display('ExposureTime') == '1/120'
+    assert tags['GPSLatitudeRef'] == 'N'
+    assert 'Make' in tags.primary and 'FNumber' not in tags.primary
+
+    big_endian = parse_exif(create_corpus()['phone_jpeg_big_endian'])
+    assert big_endian.byte_order == 'MM'
+    assert big_endian['Model'] == 'iPhone 13 Pro'
+
+
+def test_malformed_input():
+    """损坏或非图片数据不应抛出异常"""
+    samples = [b'', b'\xff\xd8', b'\xff\xd8\xff\xe1\x00\x10Exif\x00\x00II*\x00\xff\xff\xff\x7f',
+               b'MM\x00*\x00\x00\x00\x08\xff\xff', b'not an image at all']
+    for sample in samples:
+        assert len(parse_exif(sample)) == 0
+
+
+def test_analyzer_uses_native_parser():
+    """分析结果与旧版一致"""
+    data = create_corpus()['phone_jpeg']
+    result = analyze_photo_from_stream(io.BytesIO(data))
+
+    assert result['success']
+    assert result['device_info']['制造商'] == 'Apple'
+    assert result['technical_info']['光圈'] == 'f/1.8'
+    assert result['technical_info']['闪光灯'] == 'Flash did not fire, compulsory flash mode'
+    assert result['technical_info']['方向'] == '顺时针旋转90度'
+
+
+if __name__ == "__main__":
+    test_parity_with_legacy_merge()
+    test_parsed_values()
+    test_malformed_input()
+    test_analyzer_uses_native_parser()
+    print("\n所有测试通过")
@@ -0,0 +1,155 @@
+"""
+测试EXIF时间解析：固定宽度解析、小数秒、时区、GPS时间和跨字段比较
+"""
+
+import io
+import random
+import time
+from datetime import datetime
+from PIL.TiffImagePlugin import IFDRational
+from exif_integrity_checker import ExifIntegrityChecker, check_exif_integrity
+from exif_parser import parse_exif
+from exif_time import (
+    DATETIME_FORMAT, MICROSECONDS, gps_time_of_day, gps_timestamp, parse_datetime,
+    parse_offset, parse_subsec, time_difference
+)
+from field_plan import PhotoRecord, build_record
+from photo_analyzer import extract_exif_with_pil_stream, extract_exif_with_exifread_stream
+from test_exif_parser import build_exif, make_image
+
+
+def strptime_seconds(text):
+    try:
+        return int((datetime.strptime(text, DATETIME_FORMAT) - datetime(1970, 1, 1)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def make_record(**fields):
+    record = PhotoRecord()
+    for name, value in fields.items():
+        setattr(record, name, value)
+    return record
+
+
+def test_parse_datetime_matches_strptime():
+    """能否解析以及解析结果与 strptime 一致"""
+    rng = random.Random(18)
+    values = ['2024:02:29 23:59:59', '2023:02:29 10:00:00', '0001:01:01 00:00:00', '9999:12:31 23:59:59',
+              '2024:01:01 24:00:00', '2024:01:01 10:00:60', '2024:1:1 1:2:3', '2024:01:01\t10:00:00',
+              '2024-01-01 10:00:00', '    :  :     :  :  ', '', '２０２４:01:01 10:00:00', None, 20240101]
+    for _ in range(20000):
+        values.append('%04d:%02d:%02d %02d:%02d:%02d' % (
+            rng.randrange(0, 10000), rng.randrange(0, 14), rng.randrange(0, 33),
+            rng.randrange(0, 26), rng.randrange(0, 62), rng.randrange(0, 62)))
+    for value in values:
+        assert parse_datetime(value) == strptime_seconds(value), value
+
+
+def test_subsec_and_offset():
+    assert parse_subsec('5') == 500000
+    assert parse_subsec('123 ') == 123000
+    assert parse_subsec('1234567') == 123456
+    assert parse_subsec('') == parse_subsec(None) == parse_subsec('1a') == 0
+
+    assert parse_offset('+08:00') == 8 * 3600
+    assert parse_offset('-05:30') == -(5 * 3600 + 1800)
+    assert parse_offset('+14:00\x00') == 14 * 3600
+    assert parse_offset('+15:00') is None and parse_offset('+08:60') is None
+    assert parse_offset('+0800') is None and parse_offset('   :  ') is None and parse_offset(None) is None
+
+
+def test_gps_time():
+    R = IFDRational
+    assert gps_time_of_day((R(6, 1), R(30, 1), R(13, 2))) == (6 * 3600 + 30 * 60 + 6.5) * MICROSECONDS
+    assert gps_time_of_day((24, 0, 0)) is None and gps_time_of_day((1, 2)) is None
+    assert gps_timestamp('1970:01:02', 0) == 86400 * MICROSECONDS
+    assert gps_timestamp('2024:02:30', 0) is None and gps_timestamp('2024:01:01', None) is None
+
+    # 两者都有时区时按UTC比较，否则按本地时间比较
+    beijing = (parse_datetime('2024:01:01 18:00:00') * MICROSECONDS, 8 * 3600)
+    london = (parse_datetime('2024:01:01 10:00:00') * MICROSECONDS, 0)
+    assert time_difference(beijing, london) == 0
+    assert time_difference(beijing, (london[0], None)) == 8 * 3600 * MICROSECONDS
+
+
+def test_rule():
+    """小数秒、时区和GPS时间参与时间一致性检查"""
+    checker = ExifIntegrityChecker(confidence_ceiling=None)
+    base = {'Make': 'Apple', 'Model': 'iPhone 13', 'DateTime': '2024:01:01 11:00:00',
+            'DateTimeOriginal': '2024:01:01 10:00:00'}
+
+    def indicators(**fields):
+        result = checker.check_integrity(make_record(**{**base, **fields}))
+        return result['indicators'], result['warnings']
+
+    # 恰好1小时不算不一致，多出的小数秒则超过
+    assert indicators() == ([], [])
+    assert indicators(SubSecTime='5')[0] == ['时间戳不一致: DateTime和DateTimeOriginal相差1.0小时']
+
+    # 不同时区的同一时刻
+    assert indicators(DateTime='2024:01:01 18:00:00', OffsetTime='+08:00', OffsetTimeOriginal='+00:00')[0] == []
+    assert indicators(DateTime='2024:01:01 18:00:00', OffsetTime='+08:00')[0] == [
+        '时间戳不一致: DateTime和DateTimeOriginal相差8.0小时']
+    assert indicators(OffsetTime='+8')[1] == ['无法解析时区字段 OffsetTime: +8']
+
+    # GPS时间：有时区时直接比较，没有时区时差值应在时区范围内
+    gps = {'GPSDate': '2024:01:01', 'GPSTimeStamp': 2 * 3600 * MICROSECONDS}
+    assert indicators(**gps, OffsetTimeOriginal='+08:00')[0] == []
+    assert indicators(**gps, OffsetTimeOriginal='+01:00')[0] == [
+        '拍摄时间与GPS时间不一致: DateTimeOriginal与GPS时间相差7.0小时']
+    assert indicators(**gps)[0] == []
+    assert indicators(GPSDate='2023:12:31', GPSTimeStamp=0)[0] == [
+        '拍摄时间与GPS时间不一致: DateTimeOriginal与GPS时间(UTC)相差+34.0小时，超出时区范围']
+    assert indicators(GPSDate='2024/01/01', GPSTimeStamp=0)[1] == ['无法解析GPS日期 GPSDate: 2024/01/01']
+
+
+def test_native_and_legacy_sources():
+    """原生解析器和旧版 PIL + exifread 数据得到相同的时间字段和检查结果"""
+    R = IFDRational
+    ifd0 = {0x010F: 'Apple', 0x0110: 'iPhone 13 Pro', 0x0132: '2023:12:01 14:30:05'}
+    exif = {0x9003: '2023:12:01 14:30:00', 0x9004: '2023:12:01 14:30:00', 0x9011: '+08:00',
+            0x9291: '25', 0x9010: '+08:00'}
+    for hour, expected in ((6, 0), (14, 1)):
+        gps = {0x0001: 'N', 0x0002: (R(31, 1), R(14, 1), R(65, 10)),
+               0x0007: (R(hour, 1), R(30, 1), R(13, 2)), 0x001D: '2023:12:01'}
+        data = make_image('JPEG', build_exif(ifd0, exif, gps, endian='>'))
+
+        record = build_record(parse_exif(data))
+        assert record.SubSecTimeOriginal == '25' and record.OffsetTimeOriginal == '+08:00'
+        assert record.GPSTimeStamp == (hour * 3600 + 30 * 60 + 6.5) * MICROSECONDS
+        native = check_exif_integrity(parse_exif(data))
+        assert len([i for i in native['indicators'] if i.startswith('拍摄时间与GPS时间')]) == expected
+
+        pil_data = extract_exif_with_pil_stream(io.BytesIO(data))
+        exifread_data = extract_exif_with_exifread_stream(io.BytesIO(data))
+        legacy = build_record(pil_data, exifread_data)
+        assert legacy.GPSTimeStamp == record.GPSTimeStamp and legacy.GPSDate == record.GPSDate
+        native['details'].pop('exif_layout', None)
+        assert check_exif_integrity(pil_data, exifread_data) == native
+
+
+def test_parse_speed():
+    """固定宽度解析比 strptime 快"""
+    values = ['2024:%02d:%02d %02d:%02d:%02d' % (month, day, day % 24, month * 4, day)
+              for month in range(1, 13) for day in range(1, 29)] * 50
+    start = time.perf_counter()
+    for value in values:
+        parse_datetime(value)
+    fast = time.perf_counter() - start
+    start = time.perf_counter()
+    for value in values:
+        datetime.strptime(value, DATETIME_FORMAT)
+    slow = time.perf_counter() - start
+    print(f"{len(values)} 个时间: 固定宽度 {fast * 1000:.1f} 毫秒, strptime {slow * 1000:.1f} 毫秒")
+    assert fast < slow
+
+
+if __name__ == "__main__":
+    test_parse_datetime_matches_strptime()
+    test_subsec_and_offset()
+    test_gps_time()
+    test_rule()
+    test_native_and_legacy_sources()
+    test_parse_speed()
+    print("所有测试通过")
@@ -0,0 +1,77 @@
+"""
+测试字段解析计划：每个标签只解析一次，提取和完整性检查共用同一条记录
+"""
+
+import time
+from exif_parser import parse_exif, ExifTags
+from exif_integrity_checker import check_exif_integrity
+from field_plan import build_record, format_fields, FIELD_NAMES, DEVICE_PLAN, TECHNICAL_PLAN
+from test_exif_parser import create_corpus
+
+
+class CountingTags(ExifTags):
+    """记录每个标签被读取的次数"""
+
+    def __init__(self, tags):
+        super().__init__()
+        self.update(tags)
+        self.primary = tags.primary
+        self.byte_order = tags.byte_order
+        self.reads = {}
+
+    def get(self, name, default=None):
+        self.reads[name] = self.reads.get(name, 0) + 1
+        return super().get(name, default)
+
+    def __getitem__(self, name):
+        self.reads[name] = self.reads.get(name, 0) + 1
+        return super().__getitem__(name)
+
+
+def test_each_tag_resolved_once():
+    """生成记录、格式化和完整性检查过程中每个标签只读取一次"""
+    tags = CountingTags(parse_exif(create_corpus()['phone_jpeg']))
+    record = build_record(tags)
+    format_fields(record, DEVICE_PLAN)
+    format_fields(record, TECHNICAL_PLAN)
+    check_exif_integrity(record)
+
+    assert set(tags.reads) == set(FIELD_NAMES)
+    assert all(count == 1 for count in tags.reads.values())
+
+
+def test_record_values():
+    """记录中的规范化值"""
+    record = build_record(parse_exif(create_corpus()['phone_jpeg']))
+    assert record.Make == 'Apple'
+    assert record.ISOSpeedRatings == 100
+    assert record.FocalLength == 5.7
+    assert record.HostComputer is None
+
+    legacy = build_record({}, {'EXIF ISOSpeedRatings': '800', 'EXIF FocalLength': '85/2',
+                               'Image Make': 'Canon'})
+    assert legacy.ISOSpeedRatings == 800
+    assert legacy.FocalLength == 42.5
+    assert legacy.Make == 'Canon'
+    assert legacy.display is None
+    assert build_record(None).Make is None
+
+
+def test_record_speed():
+    """生成记录并完成检查的耗时"""
+    tags = parse_exif(create_corpus()['edited_jpeg'])
+    rounds = 5000
+    start = time.perf_counter()
+    for _ in range(rounds):
+        record = build_record(tags)
+        format_fields(record, TECHNICAL_PLAN)
+        check_exif_integrity(record)
+    elapsed = time.perf_counter() - start
+    print(f"生成记录+格式化+完整性检查: {elapsed / rounds * 1e6:.1f} 微秒/次")
+
+
+if __name__ == "__main__":
+    test_each_tag_resolved_once()
+    test_record_values()
+    test_record_speed()
+    print("所有测试通过")
@@ -0,0 +1,114 @@
+"""
+测试图片尺寸与格式探测：结果与PIL一致，且不解码像素
+"""
+
+import io
+import time
+from PIL import Image
+from image_probe import probe_image, sniff_format, extension_matches
+from photo_analyzer import _analyze_photo_data
+from stage_timing import run_timed
+from test_exif_parser import create_corpus
+
+
+def make_samples():
+    """生成各种格式和颜色模式的测试图片"""
+    samples = {}
+    for fmt, modes in (('JPEG', ('L', 'RGB', 'CMYK')),
+                       ('PNG', ('1', 'L', 'P', 'RGB', 'RGBA', 'LA', 'I')),
+                       ('GIF', ('L', 'P')),
+                       ('BMP', ('1', 'L', 'P', 'RGB', 'RGBA')),
+                       ('TIFF', ('1', 'L', 'P', 'RGB', 'RGBA', 'CMYK'))):
+        for mode in modes:
+            image = Image.new('RGB', (37, 21), (200, 30, 90))
+            if mode == 'P':
+                image = image.quantize(16)
+            else:
+                image = image.convert(mode)
+            buffer = io.BytesIO()
+            image.save(buffer, fmt)
+            samples[f'{fmt}-{mode}'] = buffer.getvalue()
+    for name, data in create_corpus().items():
+        samples[name] = data
+    return samples
+
+
+def pil_info(data):
+    """PIL打开图片得到的基本信息"""
+    with Image.open(io.BytesIO(data)) as img:
+        return {'width': img.width, 'height': img.height, 'format': img.format, 'mode': img.mode}
+
+
+def test_matches_pil():
+    """探测结果与PIL一致"""
+    for name, data in make_samples().items():
+        info = probe_image(data)
+        assert info is not None, name
+        assert info == pil_info(data), (name, info, pil_info(data))
+
+
+def test_malformed_input():
+    """无法识别或被截断的数据返回None"""
+    jpeg = make_samples()['JPEG-RGB']
+    assert probe_image(b'') is None
+    assert probe_image(b'not an image') is None
+    assert probe_image(jpeg[:20]) is None
+    assert probe_image(b'\x89PNG\r\n\x1a\n' + b'\x00' * 4) is None
+    assert probe_image(b'BM' + b'\xff' * 60) is None
+
+
+def test_sniff_format():
+    """按文件开头的字节识别的格式与PIL一致，扩展名检查区分大小写无关"""
+    for name, data in make_samples().items():
+        expected = pil_info(data)['format']
+        assert sniff_format(data[:12]) == ('JPEG' if expected == 'MPO' else expected), name
+    assert sniff_format(b'RIFF\x00\x00\x00\x00WEBPVP8 ') == 'WEBP'
+    assert sniff_format(b'not an image') is None
+    assert sniff_format(b'') is None
+
+    assert extension_matches('photo.JPG', 'JPEG')
+    assert extension_matches('scan.tif', 'TIFF')
+    assert not extension_matches('photo.jpg', 'PNG')
+    assert not extension_matches('photo.jpg', None)
+    assert not extension_matches('photo', 'JPEG')
+
+
+def test_metadata_less_short_circuit():
+    """GIF和BMP不能携带EXIF：只探测尺寸和格式化，结果与其他没有EXIF的图片相同"""
+    samples = make_samples()
+    png_result = _analyze_photo_data(samples['PNG-RGB'])
+    for name in ('GIF-P', 'BMP-RGB'):
+        result, durations = run_timed(_analyze_photo_data, samples[name])
+        assert list(durations) == ['probe', 'format'], (name, durations)
+        assert result['success'] and result['integrity_check'] == png_result['integrity_check']
+        assert result['technical_info']['图片格式'] == name.split('-')[0]
+        assert result['error'] == png_result['error']
+        compact = _analyze_photo_data(samples[name], compact=True)
+        assert compact['image'] == [37, 21, name.split('-')[0], name.split('-')[1]]
+
+
+def test_probe_speed():
+    """对比探测与PIL打开的耗时"""
+    data = make_samples()['JPEG-RGB']
+    rounds = 2000
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        probe_image(data)
+    probe_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        pil_info(data)
+    pil_time = time.perf_counter() - start
+
+    print(f"探测: {probe_time / rounds * 1e6:.1f} 微秒/次, PIL: {pil_time / rounds * 1e6:.1f} 微秒/次")
+
+
+if __name__ == "__main__":
+    test_matches_pil()
+    test_malformed_input()
+    test_sniff_format()
+    test_metadata_less_short_circuit()
+    test_probe_speed()
+    print("所有测试通过")
@@ -0,0 +1,80 @@
+"""
+测试完整性规则引擎：按开销执行、达到置信度上限时提前结束、统计各规则耗时
+"""
+
+from exif_integrity_checker import (
+    ExifIntegrityChecker, integrity_rule_stats, check_exif_integrity, COST_TRIVIAL, COST_EXPENSIVE
+)
+from exif_parser import parse_exif
+from test_exif_parser import create_corpus
+
+
+def test_execution_order():
+    """开销小的规则先执行，输出仍按注册顺序排列"""
+    checker = ExifIntegrityChecker(confidence_ceiling=None)
+    names = [rule.name for rule in checker.rules]
+    assert names == ['software_signatures', 'timestamp_consistency', 'device_consistency',
+                     'device_expectations', 'quantization_tables', 'exif_layout', 'thumbnail_consistency',
+                     'missing_critical_fields', 'suspicious_values']
+    executed = [rule.name for rule in checker._execution_order]
+    assert executed[:3] == ['thumbnail_consistency', 'missing_critical_fields', 'suspicious_values']
+    assert executed[-1] == 'timestamp_consistency'
+
+    tags = parse_exif(create_corpus()['edited_jpeg'])
+    result = checker.check_integrity(tags)
+    assert result['indicators'][0].startswith('检测到图像编辑软件')
+    assert result['indicators'][-1].startswith('异常')
+    assert 'skipped_rules' not in result['details']
+
+
+def test_early_exit():
+    """置信度达到上限后跳过剩余规则"""
+    tags = parse_exif(create_corpus()['edited_jpeg'])
+    full = ExifIntegrityChecker(confidence_ceiling=None).check_integrity(tags)
+    checker = ExifIntegrityChecker(confidence_ceiling=0.5)
+    result = checker.check_integrity(tags)
+
+    assert full['confidence'] == 1.0
+    assert result['confidence'] >= 0.5 and result['is_modified']
+    assert 'timestamp_consistency' in result['details']['skipped_rules']
+    assert set(result['indicators']) < set(full['indicators'])
+
+    stats = checker.rule_stats()
+    assert stats['timestamp_consistency']['calls'] == 0
+    assert stats['timestamp_consistency']['skipped'] == 1
+    assert stats['missing_critical_fields']['calls'] == 1
+
+
+def test_custom_rules_and_stats():
+    """注册自定义规则，统计调用次数和耗时"""
+    checker = ExifIntegrityChecker(confidence_ceiling=None)
+
+    def lens_rule(record, result):
+        if record.LensModel is None:
+            result['warnings'].append('缺少镜头信息')
+
+    checker.register_rule('lens_present', lens_rule, COST_TRIVIAL, ('LensModel',))
+    tags = parse_exif(create_corpus()['edited_jpeg'])
+    for _ in range(3):
+        result = checker.check_integrity(tags)
+    assert result['warnings'][-1] == '缺少镜头信息'
+    assert checker.rule_stats()['lens_present']['calls'] == 3
+
+    try:
+        checker.register_rule('broken', lens_rule, COST_EXPENSIVE, ('NoSuchField',))
+        assert False, '未知字段应该报错'
+    except ValueError:
+        pass
+
+    check_exif_integrity(tags)
+    stats = integrity_rule_stats()
+    for name, item in sorted(stats.items(), key=lambda pair: -pair[1]['total_time']):
+        print(f"{name:<26}开销{item['cost']}  调用{item['calls']:>4}  跳过{item['skipped']:>4}  "
+              f"{item['total_time'] * 1e6:>10.1f} 微秒")
+
+
+if __name__ == "__main__":
+    test_execution_order()
+    test_early_exit()
+    test_custom_rules_and_stats()
+    print("所有测试通过")
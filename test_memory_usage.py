@@ -0,0 +1,94 @@
+"""
+内存基准测试：各解析阶段共享同一个缓冲区，单次请求峰值内存不超过文件大小
+"""
+
+import io
+import os
+import tempfile
+import tracemalloc
+from PIL import Image
+from photo_analyzer import (
+    analyze_photo, analyze_photo_from_stream,
+    extract_exif_with_pil_stream, extract_exif_with_exifread_stream
+)
+from exif_integrity_checker import check_exif_integrity
+from test_exif_parser import create_corpus
+
+
+def legacy_analyze(file_stream):
+    """旧版流程：完整读入 + 两个BytesIO + PIL和exifread各解析一次"""
+    file_stream.seek(0)
+    file_content = file_stream.read()
+    image_io = io.BytesIO(file_content)
+    exifread_io = io.BytesIO(file_content)
+    pil_data = extract_exif_with_pil_stream(image_io)
+    exifread_data = extract_exif_with_exifread_stream(exifread_io)
+    image_io.seek(0)
+    with Image.open(image_io) as img:
+        img.size
+    return check_exif_integrity(pil_data, exifread_data)
+
+
+def measure_peak(func, *args):
+    """测量调用期间Python分配的峰值内存"""
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    try:
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def create_samples(directory):
+    """生成较大的测试文件：JPEG（头部即可）和TIFF（需要完整文件）"""
+    exif = Image.open(io.BytesIO(create_corpus()['phone_jpeg'])).getexif()
+    image = Image.effect_noise((2000, 1500), 60).convert('RGB')
+
+    jpeg_path = os.path.join(directory, 'large.jpg')
+    image.save(jpeg_path, 'JPEG', exif=exif, quality=95)
+
+    tiff_path = os.path.join(directory, 'large.tif')
+    image.save(tiff_path, 'TIFF')
+    return {'JPEG': jpeg_path, 'TIFF': tiff_path}
+
+
+def test_peak_memory():
+    """峰值内存 <= 1倍文件大小"""
+    print("=== 单次请求峰值内存 ===\n")
+    print(f"{'格式':<6}{'文件大小':>12}{'旧版流程':>12}{'流式':>12}{'路径(mmap)':>14}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name, path in create_samples(directory).items():
+            file_size = os.path.getsize(path)
+
+            with open(path, 'rb') as f:
+                legacy_peak = measure_peak(legacy_analyze, f)
+            with open(path, 'rb') as f:
+                stream_peak = measure_peak(analyze_photo_from_stream, f)
+            path_peak = measure_peak(analyze_photo, path)
+
+            print(f"{name:<6}{file_size:>12,}{legacy_peak:>12,}{stream_peak:>12,}{path_peak:>14,}")
+
+            assert stream_peak <= file_size * 1.05 + 256 * 1024
+            assert path_peak <= file_size * 0.1 + 256 * 1024
+            if name == 'JPEG':
+                # 只需要头部的格式，峰值内存不再随文件大小增长
+                assert stream_peak < legacy_peak / 10
+
+
+def test_results_unchanged():
+    """共享缓冲区不改变分析结果"""
+    with tempfile.TemporaryDirectory() as directory:
+        for path in create_samples(directory).values():
+            with open(path, 'rb') as f:
+                stream_result = analyze_photo_from_stream(f)
+            assert analyze_photo(path) == stream_result
+            assert stream_result['success']
+
+
+if __name__ == "__main__":
+    test_peak_memory()
+    test_results_unchanged()
+    print("\n所有测试通过")
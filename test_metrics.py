@@ -0,0 +1,224 @@
+"""
+测试服务指标：Prometheus文本格式、多进程快照合并、/metrics 端点
+"""
+
+import json
+import os
+import tempfile
+import time
+from batch_analyzer import analyze_batch, shutdown_executor
+from metrics import (
+    ARCHIVE_FILENAME, POOL_PENDING, REGISTRY, Counter, Gauge, Histogram, MetricsRegistry, request_outcome
+)
+from test_exif_parser import create_corpus
+from test_stream_ingest import multipart_body
+
+
+def make_registry():
+    registry = MetricsRegistry()
+    requests = registry.register(Counter('requests_total', '请求数', ('endpoint', 'outcome')))
+    in_progress = registry.register(Gauge('in_progress', '进行中'))
+    latency = registry.register(Histogram('latency_seconds', '耗时', ('endpoint',), (0.01, 0.1)))
+    return registry, requests, in_progress, latency
+
+
+def mark_stale(registry, directory):
+    """把快照的写入时间改到一分钟前，模拟已退出的进程"""
+    path = registry.snapshot_path(directory)
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    data['time'] = time.time() - 60
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+
+
+def test_text_format():
+    """计数器、仪表和累计分桶的直方图，标签值转义"""
+    registry, requests, in_progress, latency = make_registry()
+    requests.inc('/upload', 'ok')
+    requests.inc('/upload', 'ok')
+    requests.inc('/a"b', 'error')
+    in_progress.inc()
+    for value in (0.005, 0.01, 0.05, 3.0):
+        latency.observe(value, '/upload')
+
+    text = registry.render()
+    assert '# TYPE requests_total counter' in text
+    assert 'requests_total{endpoint="/upload",outcome="ok"} 2' in text
+    assert 'requests_total{endpoint="/a\\"b",outcome="error"} 1' in text
+    assert 'in_progress 1' in text
+    assert 'latency_seconds_bucket{endpoint="/upload",le="0.01"} 2' in text
+    assert 'latency_seconds_bucket{endpoint="/upload",le="0.1"} 3' in text
+    assert 'latency_seconds_bucket{endpoint="/upload",le="+Inf"} 4' in text
+    assert 'latency_seconds_count{endpoint="/upload"} 4' in text
+    assert 'latency_seconds_sum{endpoint="/upload"} 3.065' in text
+
+    assert [request_outcome(status) for status in (200, 400, 413, 503, 500)] == \
+        ['ok', 'rejected', 'too_large', 'overloaded', 'error']
+
+
+def test_merge_snapshots():
+    """计数器和直方图跨进程求和，已停止写入快照的进程不计入仪表"""
+    with tempfile.TemporaryDirectory() as directory:
+        first, first_requests, first_gauge, first_latency = make_registry()
+        second, second_requests, second_gauge, second_latency = make_registry()
+        second.started += 1    # 模拟另一个进程的快照文件
+        third, third_requests, third_gauge, _ = make_registry()
+        third.started += 2
+
+        first_requests.inc('/upload', 'ok')
+        first_gauge.set(2)
+        first_latency.observe(0.05, '/upload')
+        second_requests.inc('/upload', 'ok', amount=3)
+        second_gauge.set(5)
+        second_latency.observe(0.005, '/upload')
+        second.write_snapshot(directory)
+        third_requests.inc('/upload', 'error')
+        third_gauge.set(7)
+        third.write_snapshot(directory)
+
+        # 第三个进程的快照已过期
+        mark_stale(third, directory)
+
+        merged = first.collect(directory, interval=1.0)
+        assert merged['requests_total'] == {('/upload', 'ok'): 4, ('/upload', 'error'): 1}
+        assert merged['in_progress'] == {(): 7}
+        assert merged['latency_seconds'][('/upload',)] == [[1, 1, 0], 0.055, 2]
+
+
+def test_archive_stale_snapshots():
+    """已退出进程的快照并入归档后删除，计数器和直方图的合计不变"""
+    with tempfile.TemporaryDirectory() as directory:
+        current, current_requests, _, _ = make_registry()
+        current_requests.inc('/upload', 'ok')
+        for index in range(5):
+            registry, requests, gauge, latency = make_registry()
+            registry.started += index + 1
+            requests.inc('/upload', 'ok', amount=2)
+            gauge.set(3)
+            latency.observe(0.05, '/upload')
+            registry.write_snapshot(directory)
+            mark_stale(registry, directory)
+
+        for _ in range(2):
+            merged = current.collect(directory, interval=1.0)
+            assert merged['requests_total'] == {('/upload', 'ok'): 11}
+            assert merged['in_progress'] == {}
+            assert merged['latency_seconds'][('/upload',)] == [[0, 5, 0], 0.25, 5]
+            assert sorted(os.listdir(directory)) == [ARCHIVE_FILENAME]
+
+        # 归档之后退出的进程再次并入
+        registry, requests, _, _ = make_registry()
+        registry.started += 10
+        requests.inc('/upload', 'error')
+        registry.write_snapshot(directory)
+        mark_stale(registry, directory)
+        assert current.collect(directory, interval=1.0)['requests_total'] == \
+            {('/upload', 'ok'): 11, ('/upload', 'error'): 1}
+        assert current.collect(directory, interval=1.0)['requests_total'] == \
+            {('/upload', 'ok'): 11, ('/upload', 'error'): 1}
+        assert sorted(os.listdir(directory)) == [ARCHIVE_FILENAME]
+
+
+def test_forked_process():
+    """fork出的子进程不重复计入父进程的数值"""
+    if not hasattr(os, 'fork'):
+        return
+    registry, requests, _, _ = make_registry()
+    requests.inc('/upload', 'ok', amount=10)
+    with tempfile.TemporaryDirectory() as directory:
+        pid = os.fork()
+        if pid == 0:
+            try:
+                requests.reset()
+                registry.started += 1
+                requests.inc('/upload', 'ok')
+                registry.write_snapshot(directory)
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        assert registry.collect(directory)['requests_total'] == {('/upload', 'ok'): 11}
+
+
+def sample(text, line_prefix):
+    for line in text.splitlines():
+        if line.startswith(line_prefix + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    return 0.0
+
+
+def test_metrics_endpoint():
+    """/metrics 报告请求数、字节数、阶段耗时、完整性结论、缓存和工作池"""
+    from app import app
+    client = app.test_client()
+    body, content_type = multipart_body('photo.jpg', create_corpus()['edited_jpeg'])
+
+    before = client.get('/metrics').get_data(as_text=True)
+    assert client.post('/upload', data=body, content_type=content_type).status_code == 200
+    assert client.post('/upload', data=body, content_type='text/plain').status_code == 400
+    response = client.get('/metrics')
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    after = response.get_data(as_text=True)
+
+    def delta(prefix):
+        return sample(after, prefix) - sample(before, prefix)
+
+    assert delta('photo_requests_total{endpoint="/upload",outcome="ok"}') == 1
+    assert delta('photo_requests_total{endpoint="/upload",outcome="rejected"}') == 1
+    assert delta('photo_ingested_bytes_total{endpoint="/upload"}') == 2 * len(body)
+    assert delta('photo_request_duration_seconds_count{endpoint="/upload"}') == 2
+    assert delta('photo_integrity_verdicts_total{verdict="modified"}') == 1
+    assert delta('photo_stage_duration_seconds_count{stage="cache"}') == 1
+    assert sample(after, 'photo_requests_in_progress{endpoint="/upload"}') == 0
+    assert 'photo_result_cache_lookups_total{result="hit"}' in after
+
+    analyze_batch([body] * 4, workers=2)
+    shutdown_executor()
+    assert dict(POOL_PENDING.samples())[('batch',)] == 0
+    print(after.splitlines()[0])
+
+
+def test_streaming_request_duration():
+    """流式批量响应在响应体发送完毕、响应关闭时才计入耗时，期间仍算作进行中的请求"""
+    from app import app
+    client = app.test_client()
+    body, content_type = multipart_body('photo.jpg', create_corpus()['edited_jpeg'])
+    body = body.replace(b'name="file"', b'name="files"')
+    count = 'photo_request_duration_seconds_count{endpoint="/analyze/batch"}'
+    in_progress = 'photo_requests_in_progress{endpoint="/analyze/batch"}'
+
+    before = REGISTRY.render()
+    response = client.post('/analyze/batch?stream=1', data=body, content_type=content_type, buffered=False)
+    during = REGISTRY.render()
+    assert sample(during, count) == sample(before, count)
+    assert sample(during, in_progress) == sample(before, in_progress) + 1
+
+    assert b'"result"' in b''.join(response.response)
+    response.close()
+    after = REGISTRY.render()
+    assert sample(after, count) == sample(before, count) + 1
+    assert sample(after, in_progress) == sample(before, in_progress)
+
+
+def test_update_cost():
+    """每次更新只是一次加锁的字典操作"""
+    histogram = Histogram('cost_seconds', '耗时', ('stage',))
+    rounds = 100000
+    start = time.perf_counter()
+    for _ in range(rounds):
+        histogram.observe(0.003, 'parse')
+    elapsed = (time.perf_counter() - start) / rounds
+    print(f"直方图更新: 每次 {elapsed * 1e9:.0f} 纳秒")
+    assert elapsed < 2e-5
+    assert REGISTRY.metrics
+
+
+if __name__ == "__main__":
+    test_text_format()
+    test_merge_snapshots()
+    test_archive_stale_snapshots()
+    test_forked_process()
+    test_metrics_endpoint()
+    test_streaming_request_duration()
+    test_update_cost()
+    print("所有测试通过")
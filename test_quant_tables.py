@@ -0,0 +1,102 @@
+"""
+测试JPEG量化表指纹：读取DQT段、IJG标准表识别、完整性规则
+"""
+
+import io
+import struct
+import time
+from PIL import Image
+from exif_integrity_checker import ExifIntegrityChecker
+from field_plan import build_record, read_signals
+from photo_analyzer import analyze_photo_data
+from quant_tables import (
+    QuantIndex, get_quant_index, ijg_tables, quantization_fingerprint,
+    read_quantization_tables, tables_fingerprint
+)
+from stream_ingest import read_image_header
+from test_exif_parser import create_corpus
+
+
+def encode_jpeg(quality, mode='RGB'):
+    output = io.BytesIO()
+    Image.new(mode, (64, 48), 128).save(output, 'JPEG', quality=quality)
+    return output.getvalue()
+
+
+def test_ijg_tables_match_encoder():
+    """PIL（libjpeg）输出的量化表与按IJG方法缩放的标准表相同"""
+    index = get_quant_index()
+    for quality in (10, 50, 75, 90, 95, 100):
+        data = encode_jpeg(quality)
+        assert read_quantization_tables(data) == ijg_tables(quality)
+        assert index.lookup(quantization_fingerprint(data)).label == f'IJG标准量化表(质量{quality})'
+    grey = encode_jpeg(85, 'L')
+    assert quantization_fingerprint(grey) == tables_fingerprint(ijg_tables(85, components=1))
+
+
+def test_header_only():
+    """只需要头部数据；非JPEG和16位精度的量化表"""
+    data = create_corpus()['phone_jpeg']
+    header = read_image_header(io.BytesIO(data))
+    assert quantization_fingerprint(header) == quantization_fingerprint(data) is not None
+    assert quantization_fingerprint(create_corpus()['png_with_exif']) is None
+
+    # 一个DQT段中包含一张16位精度的表
+    values = tuple(range(1, 65))
+    segment = bytes([0x10]) + struct.pack('>64H', *values)
+    jpeg = b'\xFF\xD8\xFF\xDB' + struct.pack('>H', len(segment) + 2) + segment + b'\xFF\xD9'
+    assert read_quantization_tables(jpeg) == {0: (1, values)}
+
+
+def test_integrity_rule():
+    """量化表来自编辑软件、与原图不符或来自其他设备"""
+    edited = encode_jpeg(80)
+    original = encode_jpeg(92)
+    other = encode_jpeg(60)
+    index = QuantIndex([
+        {'fingerprint': quantization_fingerprint(edited), 'kind': 'editor',
+         'make': '', 'model': '', 'label': '测试编辑器'},
+        {'fingerprint': quantization_fingerprint(original), 'kind': 'camera',
+         'make': 'apple', 'model': 'iPhone 13 Pro', 'label': ''},
+        {'fingerprint': quantization_fingerprint(other), 'kind': 'camera',
+         'make': 'canon', 'model': 'EOS R5', 'label': 'Canon EOS R5 原图'},
+    ])
+    checker = ExifIntegrityChecker(confidence_ceiling=None, quant_index=index)
+    tags = {'Make': 'Apple', 'Model': 'iPhone 13 Pro', 'DateTime': '2024:01:01 10:00:00'}
+
+    def indicators(data):
+        result = checker.check_integrity(read_signals(build_record(tags), data))
+        return result['indicators'], result['details'].get('quantization')
+
+    assert indicators(original)[0] == []
+    assert indicators(edited)[0] == ['量化表与编辑软件的输出一致: 测试编辑器']
+    assert indicators(encode_jpeg(70))[0] == ['量化表与iPhone 13 Pro的原图不符，可能经过重新压缩']
+    assert indicators(create_corpus()['png_with_exif'])[1] is None
+
+    tags = {'Make': 'Google', 'Model': 'Pixel 8', 'DateTime': '2024:01:01 10:00:00'}
+    found, details = indicators(other)
+    assert found == ['量化表来自其他设备: Canon EOS R5 原图']
+    assert details['source'] == 'Canon EOS R5 原图'
+
+
+def test_analysis_details():
+    """分析结果中包含量化表指纹，读取耗时远小于1毫秒"""
+    data = create_corpus()['phone_jpeg']
+    result = analyze_photo_data(data)
+    assert result['integrity_check']['details']['quantization']['fingerprint'] == quantization_fingerprint(data)
+
+    rounds = 2000
+    start = time.perf_counter()
+    for _ in range(rounds):
+        quantization_fingerprint(data)
+    elapsed = (time.perf_counter() - start) / rounds
+    print(f"量化表指纹: 每张 {elapsed * 1e6:.1f} 微秒")
+    assert elapsed < 0.001
+
+
+if __name__ == "__main__":
+    test_ijg_tables_match_encoder()
+    test_header_only()
+    test_integrity_rule()
+    test_analysis_details()
+    print("所有测试通过")
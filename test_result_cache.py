@@ -0,0 +1,115 @@
+"""
+测试分析结果缓存：按文件头部内容寻址、LRU字节预算、过期时间和共享缓存
+"""
+
+import io
+import os
+import tempfile
+import time
+from stream_ingest import read_image_header
+from result_cache import ResultCache, SharedResultStore, content_key, get_result_cache
+from photo_analyzer import analyze_photo_data, analyze_photo_from_stream, _analyze_photo_data
+from test_exif_parser import create_corpus
+from test_stream_ingest import make_large_jpeg
+
+
+def test_content_key():
+    """完整文件和流式读取的头部得到相同的键"""
+    data = make_large_jpeg()
+    header = read_image_header(io.BytesIO(data))
+    assert len(header) < len(data)
+    assert content_key(data) == content_key(header)
+    corpus = create_corpus()
+    assert content_key(corpus['phone_jpeg']) != content_key(corpus['edited_jpeg'])
+    assert len(content_key(b'')) == 16
+
+
+def test_lru_budget_and_ttl():
+    """超出字节预算时淘汰最久未使用的结果，过期结果不再返回"""
+    result = {'success': True, 'device_info': {'制造商': 'x' * 100}}
+    cache = ResultCache(max_bytes=1000, ttl=3600)
+    for index in range(20):
+        cache.put(bytes([index]), result)
+    stats = cache.stats()
+    assert stats['bytes'] <= 1000
+    assert stats['evictions'] > 0
+    assert cache.get(bytes([19])) == result
+    assert cache.get(bytes([0])) is None
+
+    returned = cache.get(bytes([19]))
+    returned['device_info']['制造商'] = 'changed'
+    assert cache.get(bytes([19])) == result
+
+    short = ResultCache(ttl=0.01)
+    short.put(b'key', result)
+    time.sleep(0.02)
+    assert short.get(b'key') is None
+    assert short.stats()['expirations'] == 1
+
+
+def test_shared_tier():
+    """二级缓存在不同的进程内缓存之间共享"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'cache.sqlite')
+        first = ResultCache(shared=SharedResultStore(path, ttl=60))
+        second = ResultCache(shared=SharedResultStore(path, ttl=60))
+        first.put(b'key', {'success': True})
+        assert second.get(b'key') == {'success': True}
+        assert second.stats()['shared_hits'] == 1
+        assert second.get(b'key') == {'success': True}
+        assert second.stats()['hits'] == 1
+
+
+def test_shared_budget():
+    """共享缓存超出字节预算时删除最早写入的结果，文件大小不随写入次数增长"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'cache.sqlite')
+        budget = 64 * 1024
+        store = SharedResultStore(path, ttl=60, max_bytes=budget)
+        sizes = []
+        for index in range(400):
+            store.put(index.to_bytes(4, 'big'), os.urandom(3000))
+            assert store.size() <= budget
+            if index % 100 == 99:
+                store._connect().execute('PRAGMA wal_checkpoint(TRUNCATE)')
+                sizes.append(os.path.getsize(path) + os.path.getsize(path + '-wal'))
+        assert store.get((399).to_bytes(4, 'big')) is not None
+        assert store.get((0).to_bytes(4, 'big')) is None
+        assert sizes[-1] == sizes[1] and sizes[-1] < 2 * budget, sizes
+
+        # 重复写入同一个键不重复计算字节数
+        store.put(b'same', b'x' * 1000)
+        store.put(b'same', b'y' * 500)
+        total = store._connect().execute('SELECT SUM(LENGTH(value)) FROM results').fetchone()[0]
+        assert store.size() == total <= budget
+        store.put(b'huge', b'z' * (budget + 1))
+        assert store.get(b'huge') is None
+
+        # 已有的缓存文件在打开时统计字节数
+        assert SharedResultStore(path, ttl=60, max_bytes=budget).size() == total
+        print(f"共享缓存文件: {sizes} 字节")
+
+
+def test_analyzer_cache_hit():
+    """重复上传命中缓存，结果与不经过缓存的分析一致"""
+    cache = get_result_cache()
+    data = make_large_jpeg()
+    before = cache.stats()
+
+    first = analyze_photo_from_stream(io.BytesIO(data))
+    second = analyze_photo_from_stream(io.BytesIO(data))
+    assert first == second == _analyze_photo_data(data)
+    assert analyze_photo_data(data) == first
+
+    after = cache.stats()
+    assert after['hits'] - before['hits'] >= 2
+    print(f"缓存统计: {after}")
+
+
+if __name__ == "__main__":
+    test_content_key()
+    test_lru_budget_and_ttl()
+    test_shared_tier()
+    test_shared_budget()
+    test_analyzer_cache_hit()
+    print("所有测试通过")
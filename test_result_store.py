@@ -0,0 +1,75 @@
+"""
+测试持久化结果存储：未变化的文件不再重新分析，文件或分析器变化时自动失效
+"""
+
+import os
+import tempfile
+import photo_analyzer
+from result_store import ResultStore, configure_result_store, get_result_store, file_signature
+from photo_analyzer import analyze_photo
+from exif_integrity_checker import check_exif_integrity_from_file
+from test_exif_parser import create_corpus
+
+
+def test_store_roundtrip():
+    """签名或版本不一致时视为未命中"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'photo.jpg')
+        with open(path, 'wb') as f:
+            f.write(create_corpus()['phone_jpeg'])
+        signature = file_signature(path)
+
+        store = ResultStore(os.path.join(directory, 'store.sqlite'), version='v1')
+        store.put(path, 'analysis', signature, {'success': True})
+        assert store.get(path, 'analysis', signature) == {'success': True}
+        assert store.get(path, 'integrity', signature) is None
+        assert store.get(path, 'analysis', (signature[0] + 1,) + signature[1:]) is None
+
+        upgraded = ResultStore(store.path, version='v2')
+        assert upgraded.get(path, 'analysis', signature) is None
+        upgraded.purge_stale()
+        assert store.get(path, 'analysis', signature) is None
+
+
+def test_analyze_photo_uses_store():
+    """重复分析未变化的文件直接返回保存的结果，修改后重新分析"""
+    corpus = create_corpus()
+    calls = []
+    original = photo_analyzer._analyze_photo_file
+
+    def counting(path):
+        calls.append(path)
+        return original(path)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'photo.jpg')
+        with open(path, 'wb') as f:
+            f.write(corpus['phone_jpeg'])
+
+        configure_result_store(os.path.join(directory, 'store.sqlite'))
+        photo_analyzer._analyze_photo_file = counting
+        try:
+            first = analyze_photo(path)
+            second = analyze_photo(path)
+            assert first == second and first['success']
+            assert len(calls) == 1
+
+            with open(path, 'wb') as f:
+                f.write(corpus['edited_jpeg'])
+            os.utime(path, ns=(0, 0))
+            third = analyze_photo(path)
+            assert len(calls) == 2
+            assert third != first
+
+            integrity = check_exif_integrity_from_file(path)
+            assert check_exif_integrity_from_file(path) == integrity
+            assert get_result_store().stats()['hits'] >= 2
+        finally:
+            photo_analyzer._analyze_photo_file = original
+            configure_result_store(None)
+
+
+if __name__ == "__main__":
+    test_store_roundtrip()
+    test_analyze_photo_uses_store()
+    print("所有测试通过")
@@ -0,0 +1,72 @@
+"""
+测试多模式签名匹配和共享的完整性检测器
+"""
+
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from signature_matcher import SignatureMatcher
+from exif_integrity_checker import ExifIntegrityChecker, check_exif_integrity, EDITING_SOFTWARE_SIGNATURES
+
+
+def first_match_linear(patterns, text):
+    """旧版逐个签名匹配的结果"""
+    for pattern in patterns:
+        if pattern.lower() in text.lower():
+            return pattern
+    return None
+
+
+def test_matches_linear_scan():
+    """命中结果与逐个匹配相同（列表中最靠前的签名优先）"""
+    matcher = SignatureMatcher(EDITING_SOFTWARE_SIGNATURES)
+    for text in ['Adobe Photoshop Express 3.1', 'photoshop express', 'GIMP 2.10',
+                 'Snapseed', 'iOS 17.1', '', 'Lightroom Classic', 'picsart editor']:
+        assert matcher.first_match(text) == first_match_linear(EDITING_SOFTWARE_SIGNATURES, text), text
+
+    rng = random.Random(7)
+    for _ in range(2000):
+        patterns = [''.join(rng.choice('abAc') for _ in range(rng.randint(1, 4)))
+                    for _ in range(rng.randint(1, 8))]
+        text = ''.join(rng.choice('abcAB ') for _ in range(rng.randint(0, 15)))
+        assert SignatureMatcher(patterns).first_match(text) == first_match_linear(patterns, text)
+
+
+def test_large_signature_list():
+    """签名数量增加时单次扫描的耗时基本不变"""
+    rng = random.Random(1)
+    text = 'Samsung Camera Application 14.2 build 2023'
+    for count in (10, 1000, 10000):
+        signatures = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(8))
+                      for _ in range(count)] + ['build 2023']
+        matcher = SignatureMatcher(signatures)
+        rounds = 2000
+        start = time.perf_counter()
+        for _ in range(rounds):
+            assert matcher.first_match(text) == 'build 2023'
+        elapsed = time.perf_counter() - start
+        print(f"{count:>6} 个签名: {elapsed / rounds * 1e6:.2f} 微秒/次")
+
+
+def test_shared_checker():
+    """共享检测器在多线程下结果一致，自定义签名列表生效"""
+    pil_data = {'Make': 'Canon', 'Model': 'EOS R5', 'Software': 'Adobe Photoshop CC 2023',
+                'DateTime': '2024:01:15 14:30:25'}
+    expected = check_exif_integrity(pil_data)
+    assert '检测到图像编辑软件: Adobe Photoshop' in expected['indicators']
+    assert '检测到可疑软件模式: Adobe Photoshop CC 2023' in expected['indicators']
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: check_exif_integrity(pil_data), range(200)))
+    assert all(result == expected for result in results)
+
+    custom = ExifIntegrityChecker(editing_software_signatures=['CC 2023'])
+    result = custom.check_integrity(pil_data)
+    assert '检测到图像编辑软件: CC 2023' in result['indicators']
+
+
+if __name__ == "__main__":
+    test_matches_linear_scan()
+    test_large_signature_list()
+    test_shared_checker()
+    print("所有测试通过")
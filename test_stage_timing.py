@@ -0,0 +1,104 @@
+"""
+测试阶段计时：各阶段写入 Server-Timing，未启用时开销可以忽略
+"""
+
+import json
+import time
+from asgi_app import AsgiApp
+from config import Config
+from photo_analyzer import _analyze_photo_data
+from stage_timing import StageTimings, collect_timings, current_timings, run_timed, stage
+from test_asgi_app import ThreadConfig, call_app
+from test_exif_parser import create_corpus
+from test_stream_ingest import multipart_body
+
+
+def test_collect():
+    """计时只在 collect_timings 中生效，同名阶段累加"""
+    with stage('parse'):
+        pass
+    assert current_timings() is None
+
+    with collect_timings() as timings:
+        for _ in range(2):
+            with stage('parse'):
+                time.sleep(0.001)
+        with stage('integrity'):
+            pass
+    assert current_timings() is None
+    assert list(timings.durations) == ['parse', 'integrity']
+    assert timings.durations['parse'] >= 0.002
+    assert timings.header().startswith('parse;dur=')
+
+    result, durations = run_timed(_analyze_photo_data, create_corpus()['phone_jpeg'])
+    assert result['success']
+    assert list(durations) == ['parse', 'signals', 'probe', 'integrity', 'format']
+
+    merged = StageTimings()
+    merged.update(durations)
+    merged.update(durations)
+    assert merged.durations['parse'] == durations['parse'] * 2
+
+
+def test_disabled_overhead():
+    """未启用时每个阶段只多一次 ContextVar 读取"""
+    rounds = 100000
+    start = time.perf_counter()
+    for _ in range(rounds):
+        with stage('parse'):
+            pass
+    elapsed = (time.perf_counter() - start) / rounds
+    print(f"未启用计时: 每个阶段 {elapsed * 1e9:.0f} 纳秒")
+    assert elapsed < 5e-6
+
+
+def test_server_timing_header():
+    """SERVER_TIMING 启用时返回响应头，?timing=1 时结果中也包含各阶段耗时"""
+    from app import app
+    client = app.test_client()
+    body, content_type = multipart_body('photo.jpg', create_corpus()['edited_jpeg'])
+    saved = app.config['SERVER_TIMING']
+    Config.RESULT_CACHE_ENABLED = False
+    try:
+        app.config['SERVER_TIMING'] = False
+        response = client.post('/upload', data=body, content_type=content_type)
+        assert 'Server-Timing' not in response.headers and 'timings' not in response.get_json()
+
+        app.config['SERVER_TIMING'] = True
+        response = client.post('/upload', data=body, content_type=content_type)
+        header = response.headers['Server-Timing']
+        for name in ('receive', 'parse', 'signals', 'probe', 'integrity', 'format', 'total'):
+            assert f'{name};dur=' in header, header
+        assert 'timings' not in response.get_json()
+        print(f"Server-Timing: {header}")
+
+        app.config['SERVER_TIMING'] = False
+        response = client.post('/upload?timing=1', data=body, content_type=content_type)
+        assert 'Server-Timing' in response.headers
+        assert set(response.get_json()['timings']) >= {'receive', 'parse', 'integrity'}
+    finally:
+        app.config['SERVER_TIMING'] = saved
+        Config.RESULT_CACHE_ENABLED = True
+
+
+def test_asgi_timings():
+    """ASGI应用在执行器中计时，结果中的阶段与Flask相同"""
+    asgi = AsgiApp(ThreadConfig)
+    body, content_type = multipart_body('photo.jpg', create_corpus()['edited_jpeg'])
+    Config.RESULT_CACHE_ENABLED = False
+    try:
+        status, response = call_app(asgi, 'POST', '/upload', body, content_type, query=b'timing=1')
+        assert status == 200
+        timings = json.loads(response)['timings']
+        assert set(timings) == {'receive', 'parse', 'signals', 'probe', 'integrity', 'format'}
+    finally:
+        Config.RESULT_CACHE_ENABLED = True
+        asgi.stop()
+
+
+if __name__ == "__main__":
+    test_collect()
+    test_disabled_overhead()
+    test_server_timing_header()
+    test_asgi_timings()
+    print("所有测试通过")
@@ -0,0 +1,210 @@
+"""
+测试流式读取：只保留元数据所在的文件头部
+"""
+
+import io
+from PIL import Image
+from exif_parser import metadata_extent, FULL_EXTENT
+from stream_ingest import read_image_header, read_upload_header, read_upload_headers, HeaderCollector
+from image_probe import extension_matches, sniff_format
+from photo_analyzer import analyze_photo_data, analyze_photo_from_stream
+from test_exif_parser import create_corpus
+
+
+def make_large_jpeg(size=(1600, 1200)):
+    """生成像素数据较大的JPEG，元数据与测试语料相同"""
+    source = Image.open(io.BytesIO(create_corpus()['phone_jpeg']))
+    noise = Image.effect_noise(size, 80).convert('RGB')
+    buffer = io.BytesIO()
+    noise.save(buffer, 'JPEG', exif=source.getexif(), quality=95)
+    return buffer.getvalue()
+
+
+def multipart_body(filename, data, boundary='testboundary'):
+    """构造multipart/form-data请求体"""
+    body = (f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n').encode() + data
+    body += f'\r\n--{boundary}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+def test_metadata_extent():
+    """各格式的头部长度"""
+    corpus = create_corpus()
+    jpeg = corpus['phone_jpeg']
+    extent = metadata_extent(jpeg)
+    assert 0 < extent < len(jpeg)
+    assert metadata_extent(jpeg[:extent - 1]) is None
+
+    png = corpus['png_with_exif']
+    assert 0 < metadata_extent(png) < len(png)
+
+    gif = corpus['plain_gif']
+    assert 0 < metadata_extent(gif) <= len(gif)
+
+    assert metadata_extent(b'II*\x00' + b'\x00' * 20) == FULL_EXTENT
+    assert metadata_extent(b'\xff\xd8') is None
+
+
+def test_header_only_read():
+    """大文件只读取头部，分析结果与完整文件一致"""
+    data = make_large_jpeg()
+    stream = io.BytesIO(data)
+    header = read_image_header(stream, chunk_size=4096)
+
+    print(f"文件大小: {len(data)} 字节, 读取头部: {len(header)} 字节, 流位置: {stream.tell()}")
+    assert len(header) < 64 * 1024
+    assert stream.tell() < len(data)
+
+    full_result = analyze_photo_data(data)
+    header_result = analyze_photo_from_stream(io.BytesIO(data))
+    assert header_result == full_result
+
+
+def test_collector_discards_after_header():
+    """头部完整后不再保存数据"""
+    data = make_large_jpeg()
+    collector = HeaderCollector()
+    for offset in range(0, len(data), 8192):
+        collector.feed(data[offset:offset + 8192])
+    assert collector.complete
+    assert collector.bytes_seen == len(data)
+    assert len(collector.buffer) == metadata_extent(data)
+
+
+def test_multipart_streaming():
+    """流式解析multipart请求"""
+    data = make_large_jpeg()
+    body, content_type = multipart_body('photo.jpg', data)
+
+    upload = read_upload_header(io.BytesIO(body), content_type, chunk_size=4096, drain=False)
+    assert upload.filename == 'photo.jpg'
+    assert upload.complete
+    assert upload.data == data[:metadata_extent(data)]
+    assert upload.bytes_read < len(body)
+
+    drained = read_upload_header(io.BytesIO(body), content_type, chunk_size=4096)
+    assert drained.bytes_read == len(body)
+
+    rejected = read_upload_header(io.BytesIO(body), content_type, accept=lambda name: False, drain=False)
+    assert rejected.rejected and rejected.data == b''
+
+    missing = read_upload_header(io.BytesIO(b''), 'application/json')
+    assert missing.filename is None
+
+
+def test_content_sniffing():
+    """文件开头的内容与扩展名不符时拒绝，不再保存或读取该文件的其余部分"""
+    def check(filename, head):
+        return extension_matches(filename, sniff_format(head))
+
+    data = make_large_jpeg()
+    png = io.BytesIO()
+    Image.new('RGB', (300, 200)).save(png, 'PNG')
+
+    body, content_type = multipart_body('photo.jpg', data)
+    upload = read_upload_header(io.BytesIO(body), content_type, chunk_size=4096, drain=False,
+                                accept_content=check)
+    assert not upload.rejected and upload.data == data[:metadata_extent(data)]
+
+    body, content_type = multipart_body('photo.png', data)
+    upload = read_upload_header(io.BytesIO(body), content_type, chunk_size=4096, drain=False,
+                                accept_content=check)
+    assert upload.rejected and upload.mismatched and upload.data == b''
+    assert upload.bytes_read <= 2 * 4096 < len(body)
+
+    body, content_type = multipart_body('tiny.jpg', b'GIF8')
+    upload = read_upload_header(io.BytesIO(body), content_type, drain=False, accept_content=check)
+    assert upload.mismatched
+
+    # 批量请求中被拒绝的文件不影响其他文件
+    body = b''
+    for filename, content in (('a.jpg', data), ('b.jpg', png.getvalue()), ('c.png', png.getvalue())):
+        part, content_type = multipart_body(filename, content)
+        body += part[:part.rindex(b'--testboundary--')].replace(b'name="file"', b'name="files"')
+    body += b'--testboundary--\r\n'
+    uploads = read_upload_headers(io.BytesIO(body), content_type, chunk_size=4096, accept_content=check)
+    assert [(u.filename, u.mismatched) for u in uploads] == [('a.jpg', False), ('b.jpg', True), ('c.png', False)]
+    assert uploads[2].data == png.getvalue()[:metadata_extent(png.getvalue())]
+
+    from app import app
+    client = app.test_client()
+    for header_only in (True, False):
+        app.config['HEADER_ONLY_INGEST'] = header_only
+        response = client.post('/upload', data={'file': (io.BytesIO(png.getvalue()), 'photo.jpg')},
+                               content_type='multipart/form-data')
+        assert response.status_code == 400
+        assert response.get_json()['error'] == '文件内容与扩展名不符或不是支持的图片格式'
+    app.config['HEADER_ONLY_INGEST'] = True
+
+
+def test_header_endpoint():
+    """/analyze/header 只收到SOS段之前的头部，结果与上传完整文件时相同"""
+    from app import app
+    client = app.test_client()
+    samples = dict(create_corpus(), large=make_large_jpeg())
+    for name, data in samples.items():
+        if data[:2] != b'\xff\xd8':
+            continue
+        body, content_type = multipart_body('photo.jpg', data)
+        expected = client.post('/upload', data=body, content_type=content_type).get_json()
+        header = data[:metadata_extent(data)]
+        # 浏览器端多截取的数据会被裁掉
+        for payload in (header, data[:len(header) + 5000]):
+            response = client.post('/analyze/header?filename=photo.jpg', data=payload,
+                                   content_type='application/octet-stream')
+            assert response.status_code == 200, name
+            assert response.get_json() == expected, name
+    large = samples['large']
+    print(f"完整文件: {len(large)} 字节, 上传头部: {metadata_extent(large)} 字节")
+    assert metadata_extent(large) * 1000 < len(large)
+
+    png = io.BytesIO()
+    Image.new('RGB', (30, 20)).save(png, 'PNG')
+    response = client.post('/analyze/header?filename=photo.jpg', data=png.getvalue(),
+                           content_type='application/octet-stream')
+    assert response.status_code == 400
+    response = client.post('/analyze/header?filename=photo.exe', data=header,
+                           content_type='application/octet-stream')
+    assert response.get_json()['error'] == '不支持的文件格式'
+    assert client.post('/analyze/header', data=b'').status_code == 400
+    oversized = b'\xff\xd8' + b'\x00' * app.config['HEADER_UPLOAD_MAX_BYTES']
+    assert client.post('/analyze/header', data=oversized).status_code == 413
+
+
+def test_upload_endpoint():
+    """/upload 流式模式与原模式返回相同结果"""
+    from app import app
+    data = make_large_jpeg()
+    client = app.test_client()
+
+    responses = []
+    for header_only in (True, False):
+        app.config['HEADER_ONLY_INGEST'] = header_only
+        response = client.post('/upload', data={'file': (io.BytesIO(data), 'photo.jpg')},
+                               content_type='multipart/form-data')
+        responses.append((response.status_code, response.get_json()))
+    app.config['HEADER_ONLY_INGEST'] = True
+
+    assert responses[0] == responses[1]
+    assert responses[0][0] == 200
+
+    response = client.post('/upload', data={'file': (io.BytesIO(data), 'photo.exe')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == '不支持的文件格式'
+
+    response = client.post('/upload', data={}, content_type='multipart/form-data')
+    assert response.status_code == 400
+
+
+if __name__ == "__main__":
+    test_metadata_extent()
+    test_header_only_read()
+    test_collector_discards_after_header()
+    test_multipart_streaming()
+    test_content_sniffing()
+    test_header_endpoint()
+    test_upload_endpoint()
+    print("所有测试通过")
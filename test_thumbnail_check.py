@@ -0,0 +1,165 @@
+"""
+测试嵌入缩略图与主图的一致性检查
+"""
+
+import io
+import struct
+import time
+from PIL import Image, ImageDraw
+from config import Config
+from exif_integrity_checker import ExifIntegrityChecker
+from exif_parser import parse_exif
+from field_plan import build_record, read_signals
+from photo_analyzer import analyze_photo_data
+from result_cache import content_key
+from stream_ingest import read_image_header
+from thumbnail_check import compare_thumbnail
+
+
+class ThumbnailConfig(Config):
+    THUMBNAIL_CHECK = True
+
+
+def make_photo(size):
+    """有明显结构的测试照片：水平渐变加几个色块"""
+    image = Image.linear_gradient('L').resize(size).convert('RGB')
+    draw = ImageDraw.Draw(image)
+    width, height = size
+    draw.ellipse((width // 8, height // 8, width // 2, height // 2), fill=(220, 40, 40))
+    draw.rectangle((width * 5 // 8, height // 2, width * 7 // 8, height * 7 // 8), fill=(20, 20, 160))
+    return image
+
+
+def letterboxed(image, size=(160, 120)):
+    """像相机那样把缩略图放进固定尺寸，宽高比不同时上下留黑边"""
+    thumb = image.copy()
+    thumb.thumbnail(size)
+    canvas = Image.new('RGB', size)
+    canvas.paste(thumb, ((size[0] - thumb.width) // 2, (size[1] - thumb.height) // 2))
+    return canvas
+
+
+def encode(image, quality=90):
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=quality)
+    return output.getvalue()
+
+
+def with_thumbnail(main, thumb):
+    """构造带IFD1缩略图的JPEG：IFD0只有Make，IFD1指向缩略图数据"""
+    thumb_data = encode(thumb, 80)
+    tiff = bytearray(b'II*\x00' + struct.pack('<I', 8))
+    tiff += struct.pack('<HHHII', 1, 0x010F, 2, 6, 26) + struct.pack('<I', 32)
+    tiff += b'Canon\x00'
+    tiff += struct.pack('<H', 2)
+    tiff += struct.pack('<HHII', 0x0201, 4, 1, 62) + struct.pack('<HHII', 0x0202, 4, 1, len(thumb_data))
+    tiff += struct.pack('<I', 0) + thumb_data
+    app1 = b'Exif\x00\x00' + bytes(tiff)
+    return b'\xFF\xD8\xFF\xE1' + struct.pack('>H', len(app1) + 2) + app1 + encode(main)[2:]
+
+
+def comparison(data, config=ThumbnailConfig):
+    return compare_thumbnail(data, parse_exif(data).thumbnail, config)
+
+
+def test_matching_thumbnail():
+    """未编辑的照片差异很小，3:2照片的带黑边缩略图也能对齐"""
+    photo = make_photo((1600, 1200))
+    result = comparison(with_thumbnail(photo, letterboxed(photo)))
+    assert result.thumbnail_size == (160, 120) and result.image_size == (1600, 1200)
+    assert result.difference < 0.03, result
+
+    wide = make_photo((1800, 1200))
+    result = comparison(with_thumbnail(wide, letterboxed(wide)))
+    assert result.difference < 0.03, result
+    print(f"未编辑: 差异 {result.difference:.2%}")
+
+
+def test_edited_photo():
+    """修改主图后保留旧缩略图、裁剪主图都会被发现"""
+    photo = make_photo((1600, 1200))
+    thumb = letterboxed(photo)
+
+    edited = photo.copy()
+    ImageDraw.Draw(edited).rectangle((0, 600, 1600, 1200), fill=(250, 250, 250))
+    result = comparison(with_thumbnail(edited, thumb))
+    assert result.difference > Config.THUMBNAIL_DIFFERENCE_THRESHOLD, result
+
+    cropped = comparison(with_thumbnail(photo.crop((400, 300, 1600, 1200)), thumb))
+    assert cropped.difference > Config.THUMBNAIL_DIFFERENCE_THRESHOLD, cropped
+
+    checker = ExifIntegrityChecker(confidence_ceiling=None)
+    record = build_record({'Make': 'Canon', 'Model': 'EOS R5', 'DateTime': '2024:01:01 10:00:00'})
+    record.thumbnail = result
+    found = checker.check_integrity(record)
+    assert found['indicators'] == [f'嵌入的缩略图与主图不一致（差异{result.difference:.1%}）']
+    assert found['details']['thumbnail']['difference'] == result.difference
+    print(f"编辑后: 差异 {result.difference:.2%}, 裁剪后: 差异 {cropped.difference:.2%}")
+
+
+def test_skipped():
+    """未启用、只有头部数据或没有缩略图时跳过"""
+    photo = make_photo((800, 600))
+    data = with_thumbnail(photo, letterboxed(photo))
+    assert comparison(data, Config) is None
+    assert comparison(read_image_header(io.BytesIO(data))) is None
+    assert comparison(encode(photo)) is None
+
+    # 解码失败（缩略图数据损坏）时不影响分析
+    broken = bytearray(data)
+    start, length = parse_exif(data).thumbnail
+    broken[start + 2:start + length] = b'\x00' * (length - 2)
+    assert comparison(bytes(broken)) is None
+
+
+def test_analysis_pipeline():
+    """完整文件的分析结果包含比较结果，缓存键与只有头部时不同"""
+    photo = make_photo((1600, 1200))
+    edited = photo.copy()
+    ImageDraw.Draw(edited).rectangle((0, 0, 800, 1200), fill=(0, 0, 0))
+    data = with_thumbnail(edited, letterboxed(photo))
+    header = read_image_header(io.BytesIO(data))
+
+    Config.THUMBNAIL_CHECK = True
+    try:
+        exif_tags = parse_exif(data)
+        record = read_signals(build_record(exif_tags), data, exif_tags.thumbnail)
+        assert record.thumbnail.difference > Config.THUMBNAIL_DIFFERENCE_THRESHOLD
+
+        full = analyze_photo_data(data)
+        assert any(indicator.startswith('嵌入的缩略图') for indicator in full['integrity_check']['indicators'])
+        assert 'thumbnail' not in analyze_photo_data(header)['integrity_check']['details']
+        assert content_key(data, full=True) != content_key(header) == content_key(data)
+    finally:
+        Config.THUMBNAIL_CHECK = False
+
+
+def test_reduced_decoding_cost():
+    """1200万像素的照片只需几毫秒"""
+    photo = make_photo((4000, 3000))
+    data = with_thumbnail(photo, letterboxed(photo))
+    thumbnail = parse_exif(data).thumbnail
+    compare_thumbnail(data, thumbnail, ThumbnailConfig)
+
+    rounds = 10
+    start = time.perf_counter()
+    for _ in range(rounds):
+        result = compare_thumbnail(data, thumbnail, ThumbnailConfig)
+    elapsed = (time.perf_counter() - start) / rounds
+
+    start = time.perf_counter()
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+    full_decode = time.perf_counter() - start
+    print(f"4000x3000: 比较 {elapsed * 1000:.1f} 毫秒, 完整解码 {full_decode * 1000:.1f} 毫秒")
+    assert result.difference < 0.03
+    assert elapsed < full_decode
+
+
+if __name__ == "__main__":
+    test_matching_thumbnail()
+    test_edited_photo()
+    test_skipped()
+    test_analysis_pipeline()
+    test_reduced_decoding_cost()
+    print("所有测试通过")
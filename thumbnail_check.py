@@ -0,0 +1,78 @@
+"""
+嵌入缩略图与主图的一致性 - 以缩小比例解码主图
+
+相机写出的IFD1缩略图与主图内容相同。只修改主图像素、保留原EXIF的编辑方式会留下旧的缩略图，
+缩略图与主图不一致是很强的编辑信号。
+
+主图用PIL的draft模式解码：libjpeg在DCT域直接按1/2-1/8缩小，且只解码亮度分量，
+1200万像素的照片只需几毫秒，不需要完整解码。
+
+主图的像素数据位于SOS段之后，只有完整文件才能比较；
+流式上传只保留的头部数据中没有像素数据，这时跳过检查。
+"""
+
+from collections import namedtuple
+from PIL import Image, ImageChops, ImageStat
+from config import Config
+from exif_parser import metadata_extent, FULL_EXTENT
+from stream_ingest import BufferReader
+
+# difference: 平均灰度差异（0-1）；尺寸为 (宽, 高)
+ThumbnailComparison = namedtuple('ThumbnailComparison', ['difference', 'thumbnail_size', 'image_size'])
+
+# 比较时缩小到的最大边长（消除缩略图压缩噪声和缩放算法的差异）
+COMPARE_SIZE = 48
+
+
+def has_image_data(data, config=Config):
+    """是否启用了检查且数据中包含JPEG主图的像素数据（不只是头部）"""
+    if not config.THUMBNAIL_CHECK:
+        return False
+    extent = metadata_extent(data)
+    return extent is not None and extent != FULL_EXTENT and len(data) > extent and data[:2] == b'\xFF\xD8'
+
+
+def compare_thumbnail(data, thumbnail, config=Config):
+    """
+    比较嵌入的缩略图与主图
+
+    Args:
+        data: 完整的图片数据（bytes/bytearray/memoryview）
+        thumbnail: IFD1缩略图的 (偏移, 长度)，即 ExifTags.thumbnail
+
+    Returns:
+        ThumbnailComparison: 比较结果；未启用、没有缩略图、只有头部数据或无法解码时为None
+    """
+    if thumbnail is None or not has_image_data(data, config):
+        return None
+    offset, length = thumbnail
+    try:
+        with Image.open(BufferReader(data[offset:offset + length])) as thumb:
+            small = thumb.convert('L')
+        with Image.open(BufferReader(data)) as image:
+            if image.format != 'JPEG':
+                return None
+            image_size = image.size
+            # draft 选择不小于请求尺寸的最小缩小比例（最多1/8）
+            image.draft('L', (COMPARE_SIZE, COMPARE_SIZE))
+            main = image.convert('L')
+    except Exception as e:
+        print(f"比较缩略图时出错: {e}")
+        return None
+
+    # 缩略图的宽高比与主图不同时（如3:2照片的4:3缩略图带黑边），只比较中间与主图宽高比相同的区域
+    width, height = small.size
+    aspect = image_size[0] / image_size[1]
+    if width / height > aspect:
+        inner = round(height * aspect)
+        box = ((width - inner) // 2, 0, (width + inner) // 2, height)
+    else:
+        inner = round(width / aspect)
+        box = (0, (height - inner) // 2, width, (height + inner) // 2)
+
+    scale = COMPARE_SIZE / max(image_size)
+    size = (max(round(image_size[0] * scale), 1), max(round(image_size[1] * scale), 1))
+    expected = main.resize(size, Image.BOX)
+    actual = small.resize(size, Image.BOX, box=box)
+    difference = ImageStat.Stat(ImageChops.difference(expected, actual)).mean[0] / 255
+    return ThumbnailComparison(round(difference, 4), small.size, image_size)